@@ -0,0 +1,108 @@
+'''
+Benchmark: reading-list HTML generation, old iterrows + string concatenation vs. single pass (in memory / streaming)
+
+Usage:
+    python benchmarks/bench_html_generate.py
+    python benchmarks/bench_html_generate.py --sizes 1000 10000 100000
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import html_generate as hg
+
+WORDS = ["wnt", "fibrosis", "yap", "signaling", "fibroblast", "cancer", "mouse", "cell", "pathway", "beta-catenin",
+         "expression", "tissue", "repair", "lung", "kidney", "liver", "macrophage", "injury", "model", "patients"]
+JOURNALS = ["Nat Commun", "Cell", "Sci Rep", "J Clin Invest", "Nature", "Cell Rep", "Elife", "PLoS One"]
+SEARCH_INFO = {'search_keywords': '(wnt5a NOT cancer) AND fibro*', 'paper_type': 'Journal Article', 'search_date': '2025-01-01 00:00:00'}
+
+
+def make_table(n):
+    rnd = random.Random(n)
+    words = lambda k: ' '.join(rnd.choice(WORDS) for _ in range(k))
+    return pd.DataFrame({
+        'PMID': range(39000000, 39000000 + n),
+        'Title': [words(15).capitalize() for _ in range(n)],
+        'Journal': [rnd.choice(JOURNALS) for _ in range(n)],
+        'IF': [round(rnd.uniform(1, 60), 1) for _ in range(n)],
+        'JCR_Quartile': [rnd.choice(['Q1', 'Q2', 'Q3', 'Q4']) for _ in range(n)],
+        'CSA_Quartile': [str(rnd.randint(1, 4)) for _ in range(n)],
+        'publish_date': [f"2025{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}" for _ in range(n)],
+        'Abstract': [words(rnd.randint(150, 300)).capitalize() + '.' for _ in range(n)],
+        'DOI': [f"10.1038/s41467-025-{i:05d}-x [doi]" for i in range(n)],
+    })
+
+
+def legacy_build(df):
+    # 旧实现：两遍 iterrows，侧边栏和正文都用 += 拼接，最后一次性写出
+    pattern = hg._pattern_for(SEARCH_INFO, hg._first_title(df))
+    highlighter = hg._make_highlighter(pattern)
+    sidebar_links_html = ""
+    for idx, row in df.iterrows():
+        sidebar_links_html += hg._sidebar_link_html(idx, row)
+    html_content = hg._PAGE_HEAD + sidebar_links_html
+    for index, row in df.iterrows():
+        html_content += hg._article_card_html(index, row, highlighter, pattern)
+    html_content += hg._PAGE_SCRIPT
+    return html_content
+
+
+def run_legacy(df, csv_path, html_path):
+    html_content = legacy_build(df)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+
+def run_single_pass(df, csv_path, html_path):
+    hg.generate_reading_list(df, html_path, search_info=SEARCH_INFO)
+
+
+def run_streaming(df, csv_path, html_path):
+    # 流式模式直接读文件，不需要 DataFrame
+    hg.generate_reading_list(csv_path, html_path, search_info=SEARCH_INFO, streaming=True)
+
+
+def measure(func, *args):
+    # 计时和内存分开测量，避免 tracemalloc 的开销影响计时
+    begin = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'mode':>12} {'seconds':>9} {'rows/s':>9} {'peak MB':>8} {'HTML MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            df = make_table(n)
+            csv_path = os.path.join(tmp, f'articles_{n}.csv')
+            df.to_csv(csv_path, index=False)
+            for name, func in (("legacy", run_legacy), ("single-pass", run_single_pass), ("streaming", run_streaming)):
+                html_path = os.path.join(tmp, f'{name}_{n}.html')
+                _stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+                try:
+                    elapsed, peak = measure(func, df, csv_path, html_path)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = _stdout
+                size = os.path.getsize(html_path)
+                print(f"{n:>8} {name:>12} {elapsed:>9.2f} {n / elapsed:>9.0f} {peak / 1e6:>8.1f} {size / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
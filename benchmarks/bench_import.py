@@ -0,0 +1,58 @@
+'''
+Benchmark: 各模块的导入时间，以及导入后是否已经加载了较重的依赖（pandas、numpy、requests、openpyxl、bs4、Bio、tqdm、pyarrow、aiohttp）
+每次都在新的解释器中导入，取中位数；导入时加载了较重的依赖、或超过 --max-ms 时以退出码 1 结束，可用作回归检查
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 20 --max-ms 100
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MODULES = ['pubmed_utils', 'html_generate', 'table_io', 'journal_index', 'record_cache', 'run_metrics', 'pubmed_batch', 'pubmed_async']
+HEAVY = ['pandas', 'numpy', 'requests', 'openpyxl', 'bs4', 'Bio', 'tqdm', 'pyarrow', 'aiohttp']
+
+# 在子进程中运行：导入模块，输出用时和已加载的较重依赖
+_PROBE = '''
+import json, sys, time
+begin = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - begin
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def measure(module, repeat):
+    code = _PROBE.format(module=module, heavy=HEAVY)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        # 只取最后一行，模块导入时的其它输出不影响结果
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return statistics.median(run['ms'] for run in runs), runs[-1]['heavy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None, help="任一模块的导入时间（中位数）超过此值时失败")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':>14} {'median ms':>10}  heavy dependencies loaded")
+    for module in args.modules:
+        ms, heavy = measure(module, args.repeat)
+        slow = args.max_ms is not None and ms > args.max_ms
+        failed = failed or slow or bool(heavy)
+        print(f"{module:>14} {ms:>10.1f}  {', '.join(heavy) or '-'}{'  (over budget)' if slow else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
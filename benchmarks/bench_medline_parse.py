@@ -0,0 +1,109 @@
+'''
+Micro-benchmark: streaming MEDLINE parser vs. the old re.split + Bio.Medline path
+
+Usage:
+    python benchmarks/bench_medline_parse.py
+    python benchmarks/bench_medline_parse.py --sizes 100 1000 10000
+'''
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Bio import Medline
+from pubmed_utils import _iter_medline_records
+
+FIELDS = ["PMID", "TI", "TA", "IF", "Quartile", "JCR_Quartile", "Top", "OA", "LR", "AB", "LID"]
+WORDS = ["wnt", "fibrosis", "yap", "signaling", "fibroblast", "cancer", "mouse", "cell", "pathway", "beta-catenin",
+         "expression", "tissue", "repair", "lung", "kidney", "liver", "macrophage", "injury", "model", "patients"]
+
+
+def _wrap(tag, text, width=82):
+    # MEDLINE 格式：第一行 "TAG - "，后续行以 6 个空格缩进
+    lines = []
+    while len(text) > width:
+        cut = text.rfind(' ', 0, width)
+        cut = cut if cut > 0 else width
+        lines.append(text[:cut])
+        text = text[cut + 1:]
+    lines.append(text)
+    return [f"{tag:<4}- {lines[0]}"] + ["      " + line for line in lines[1:]]
+
+
+def make_medline_record(pmid):
+    rnd = random.Random(pmid)
+    words = lambda n: ' '.join(rnd.choice(WORDS) for _ in range(n))
+    lines = [f"PMID- {pmid}", "OWN - NLM", "STAT- MEDLINE", f"DCOM- 2025{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}",
+             f"LR  - 2025{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}", "IS  - 2041-1723 (Electronic)", "IS  - 2041-1723 (Linking)",
+             "VI  - 16", "IP  - 1", "DP  - 2025 Jan 2"]
+    lines += _wrap("TI", words(18).capitalize() + ".")
+    lines += [f"PG  - {rnd.randint(1, 9999)}", f"LID - 10.1038/s41467-025-{pmid % 100000:05d}-x [doi]", f"LID - {pmid % 10000} [pii]"]
+    lines += _wrap("AB", words(rnd.randint(150, 300)).capitalize() + ".")
+    for i in range(rnd.randint(3, 12)):
+        lines += [f"FAU - Author{i}, Name", f"AU  - Author{i} N"]
+        lines += _wrap("AD", f"Department of {words(3)}, University {i}, City, Country.")
+    lines += ["LA  - eng", "PT  - Journal Article", f"DEP - 2025010{rnd.randint(1, 9)}", "PL  - England", "TA  - Nat Commun",
+              "JT  - Nature communications", "JID - 101528555", "SB  - IM"]
+    lines += [f"MH  - {words(2).title()}" for _ in range(rnd.randint(5, 15))]
+    lines += ["EDAT- 2025/01/03 00:00", "MHDA- 2025/01/03 00:01", "PST - epublish", "SO  - Nat Commun. 2025 Jan 2;16(1):1."]
+    return '\n'.join(lines)
+
+
+def make_medline_text(n, start_pmid=39000000):
+    # EFetch 的 MEDLINE 文本：记录之间以空行分隔
+    return '\n' + '\n\n'.join(make_medline_record(start_pmid + i) for i in range(n)) + '\n'
+
+
+def legacy_parse(response_text):
+    # 旧实现：re.split 按记录切分，再对每条记录单独调用 Bio.Medline.parse
+    parsed = []
+    for record_text in re.split(r'\n(?=PMID- )', response_text):
+        if not record_text.strip() or not record_text.startswith('PMID-'):
+            continue
+        for record in Medline.parse(record_text.split('\n')):
+            if 'PMID' not in record:
+                continue
+            parsed.append({key: record[key] for key in FIELDS if key in record})
+    return parsed
+
+
+def streaming_parse(response_text, chunk_size=1 << 16):
+    # 与 EFetch 流式响应一样按 64 KB 的块喂给解析器
+    chunks = (response_text[i:i + chunk_size] for i in range(0, len(response_text), chunk_size))
+    return list(_iter_medline_records(chunks, FIELDS))
+
+
+def measure(func, text):
+    # 计时和内存分开测量，避免 tracemalloc 的开销影响计时
+    begin = time.perf_counter()
+    result = func(text)
+    elapsed = time.perf_counter() - begin
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'parser':>10} {'seconds':>9} {'records/s':>11} {'peak MB':>8}")
+    for n in args.sizes:
+        text = make_medline_text(n)
+        legacy, legacy_elapsed, legacy_peak = measure(legacy_parse, text)
+        streaming, streaming_elapsed, streaming_peak = measure(streaming_parse, text)
+        assert legacy == streaming, "parsers disagree"
+        for name, elapsed, peak in (("Bio", legacy_elapsed, legacy_peak), ("streaming", streaming_elapsed, streaming_peak)):
+            print(f"{n:>8} {name:>10} {elapsed:>9.3f} {n / elapsed:>11.0f} {peak / 1e6:>8.1f}")
+        print(f"{'':>8} {'speedup':>10} {legacy_elapsed / streaming_elapsed:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
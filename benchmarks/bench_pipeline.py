@@ -0,0 +1,114 @@
+'''
+Benchmark: 完整流程（get_main_info_into_excel -> embed_IF_into_excel -> generate_reading_list）对本地 E-utilities 替身服务器运行
+不访问 NCBI；替身服务器（mock_eutils.py）在本进程的后台线程中提供合成语料，每个规模在一个新的子进程中运行，峰值 RSS 互不影响
+记录每个阶段的用时、records/s 和结束时的峰值 RSS，以及请求数、重试次数、服务器拒绝的 429 数、截断的响应数和 HTML 大小
+--history 把结果（连同 git 版本）追加为 JSON Lines 的一行，用于比较不同版本
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 --latency 0.05 --rate-429 0.02 --truncate 0.02
+    python benchmarks/bench_pipeline.py --format parquet --virtual --history benchmarks/pipeline_history.jsonl
+'''
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from mock_eutils import MockEutils
+
+SEARCH_INFO = {'search_keywords': 'wnt AND fibrosis', 'paper_type': 'Journal Article', 'search_date': '2025-01-01 00:00:00'}
+
+
+def run_pipeline(url, n, table_format, virtual, requests_per_second):
+    # 在子进程中运行完整流程，返回各阶段的指标
+    import pubmed_utils
+    import run_metrics
+    from html_generate import generate_reading_list
+
+    pubmed_utils.EUTILS_BASE_URL = url
+    rate_limiter = pubmed_utils._TokenBucket(requests_per_second) if requests_per_second else None
+    utils = pubmed_utils.pubmed_utils(rate_limiter=rate_limiter)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        table_path = os.path.join(tmp_dir, f"bench.{table_format}")
+        html_path = os.path.join(tmp_dir, "bench_reading_list.html")
+        # 流程本身的输出（进度、匹配报告）不混进结果表
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), run_metrics.recording() as report:
+            utils.get_main_info_into_excel("MOCK", SEARCH_INFO['search_keywords'], None, "Journal Article", None, table_path, resume=False)
+            rows = len(utils.embed_IF_into_excel(table_path))
+            generate_reading_list(table_path, html_path, search_info=SEARCH_INFO, virtual=virtual)
+        html_size = os.path.getsize(html_path)
+    stages = report.to_dict()['stages']
+    efetch = stages.get('efetch', {})
+    return {
+        'rows': rows,
+        'stages': {name: {'seconds': stages[stage]['wall_seconds'], 'peak_rss_mb': stages[stage]['peak_rss_mb']}
+                   for name, stage in (('fetch', 'get_main_info_into_excel'), ('embed_IF', 'embed_IF_into_excel'), ('html', 'html'))},
+        'parse_records_per_second': stages.get('parse', {}).get('records_per_second'),
+        'requests': sum(stage.get('requests', 0) for stage in stages.values()),
+        'retries': sum(stage.get('retries', 0) for stage in stages.values()),
+        'efetch_mb': round(efetch.get('bytes', 0) / 1e6, 1),
+        'html_mb': round(html_size / 1e6, 2),
+    }
+
+
+def _git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--format', dest='table_format', default='xlsx', choices=['xlsx', 'csv', 'parquet', 'feather'])
+    parser.add_argument('--virtual', action='store_true', help="生成虚拟滚动的阅读列表")
+    parser.add_argument('--latency', type=float, default=0.05, help="替身服务器每个请求的延迟（秒）")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="替身服务器返回 429 的请求比例")
+    parser.add_argument('--truncate', type=float, default=0.0, help="在记录中间截断的 EFetch 响应比例")
+    parser.add_argument('--retry-after', type=float, default=None, help="429 响应的 Retry-After 秒数")
+    parser.add_argument('--requests-per-second', type=float, default=None, help="客户端限速，默认为 NCBI 有 api_key 时的 10 次/秒")
+    parser.add_argument('--history', default=None, help="把结果追加到这个 JSON Lines 文件")
+    args = parser.parse_args()
+
+    # spawn：每个规模一个全新的进程，峰值 RSS 只反映该规模
+    context = multiprocessing.get_context('spawn')
+    results = []
+    print(f"{'records':>8} {'stage':>9} {'seconds':>9} {'records/s':>11} {'peak MB':>8}")
+    for n in args.sizes:
+        with MockEutils(n, args.latency, args.rate_429, args.truncate, args.retry_after, seed=n) as mock:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_pipeline, (mock.url, n, args.table_format, args.virtual, args.requests_per_second))
+            result['records'] = n
+            result['server'] = mock.stats()
+        results.append(result)
+        for name, stage in result['stages'].items():
+            print(f"{n:>8} {name:>9} {stage['seconds']:>9.2f} {result['rows'] / stage['seconds']:>11.0f} {stage['peak_rss_mb'] or 0:>8.1f}")
+        print(f"{'':>8} rows {result['rows']}, {result['requests']} requests, {result['retries']} retries "
+              f"({result['server']['rejected_429']} x 429, {result['server']['truncated']} truncated), "
+              f"EFetch {result['efetch_mb']} MB, HTML {result['html_mb']} MB")
+
+    if args.history:
+        entry = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'version': _git_version(),
+            'python': platform.python_version(),
+            'options': {key: value for key, value in vars(args).items() if key not in ('sizes', 'history')},
+            'results': results,
+        }
+        with open(args.history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"Appended to {args.history}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+'''
+本地的 E-utilities 替身服务器：ESearch / EPost / EFetch / ESummary，提供可配置规模的合成 MEDLINE 语料
+用于离线测量和调优抓取流程，不访问 NCBI。可配置每个请求的延迟、429 的比例和在记录中间截断的响应比例
+
+与 NCBI 的行为一致的部分：
+    ESearch 返回 Count / IdList（按 Entrez 日期从新到旧），usehistory=y 时保存结果并返回 WebEnv / query_key
+    支持 reldate、datetype + mindate / maxdate（语料的日期均匀分布在最近 span_days 天）
+    ESearch 的 retstart + retmax 超过 9999 时返回 ERROR，EFetch 只能取到每个结果集的前 9999 条
+    429 带 Retry-After（retry_after 不为 None 时）；截断的响应以 200 结束，但最后一条记录不完整且没有换行符
+
+Usage:
+    python benchmarks/mock_eutils.py --records 100000 --latency 0.05 --rate-429 0.02 --truncate 0.02 --port 8999
+
+    import pubmed_utils
+    from mock_eutils import MockEutils
+    with MockEutils(records=10000, latency=0.05) as mock:
+        pubmed_utils.EUTILS_BASE_URL = mock.url
+        ...
+        print(mock.stats())
+'''
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+HISTORY_CAP = 9999
+FIRST_PMID = 30000000
+WORDS = ["wnt", "fibrosis", "yap", "signaling", "fibroblast", "cancer", "mouse", "cell", "pathway", "beta-catenin",
+         "expression", "tissue", "repair", "lung", "kidney", "liver", "macrophage", "injury", "model", "patients"]
+# (MedAbbr, ISSN)；最后一个不在期刊表中，用于覆盖未匹配的情况
+JOURNALS = [("Nat Commun", "2041-1723"), ("Cell", "0092-8674"), ("Sci Rep", "2045-2322"), ("J Biol Chem", "0021-9258"),
+            ("Nature", "0028-0836"), ("Elife", "2050-084X"), ("PLoS One", "1932-6203"), ("Mock J Nowhere", "0000-0000")]
+
+
+def _wrap(tag, text, width=82):
+    # MEDLINE 格式：第一行 "TAG - "，后续行以 6 个空格缩进
+    lines = []
+    while len(text) > width:
+        cut = text.rfind(' ', 0, width)
+        cut = cut if cut > 0 else width
+        lines.append(text[:cut])
+        text = text[cut + 1:]
+    lines.append(text)
+    return [f"{tag:<4}- {lines[0]}"] + ["      " + line for line in lines[1:]]
+
+
+def make_record(pmid, edat):
+    '''
+    一条合成的 MEDLINE 记录，内容只由 PMID 决定；edat 为 Entrez 日期
+    '''
+    rnd = random.Random(pmid)
+    words = lambda n: ' '.join(rnd.choices(WORDS, k=n))
+    journal, issn = JOURNALS[pmid % len(JOURNALS)]
+    revised = edat + timedelta(days=rnd.randint(0, 60))
+    lines = [f"PMID- {pmid}", "OWN - NLM", "STAT- MEDLINE", f"LR  - {revised:%Y%m%d}", f"IS  - {issn} (Electronic)", "VI  - 16", "IP  - 1",
+             f"DP  - {edat:%Y %b %d}"]
+    lines += _wrap("TI", words(rnd.randint(8, 20)).capitalize() + ".")
+    lines += [f"LID - 10.1000/mock.{pmid} [doi]"]
+    lines += _wrap("AB", words(rnd.randint(150, 300)).capitalize() + ".")
+    for i in range(rnd.randint(3, 12)):
+        lines += [f"FAU - Author{i}, Name", f"AU  - Author{i} N"]
+    lines += ["LA  - eng", "PT  - Journal Article", f"TA  - {journal}", "SB  - IM"]
+    lines += [f"MH  - {words(2).title()}" for _ in range(rnd.randint(5, 15))]
+    lines += [f"EDAT- {edat:%Y/%m/%d} 00:00", "PST - epublish"]
+    return '\n'.join(lines)
+
+
+def _parse_date(text, end=False):
+    # E-utilities 的日期参数：YYYY、YYYY/MM 或 YYYY/MM/DD；end 为 True 时取该年/月的最后一天
+    parts = [int(part) for part in text.replace('-', '/').split('/')]
+    if len(parts) == 1:
+        return date(parts[0], 12, 31) if end else date(parts[0], 1, 1)
+    if len(parts) == 2:
+        if not end:
+            return date(parts[0], parts[1], 1)
+        return date(parts[0] + parts[1] // 12, parts[1] % 12 + 1, 1) - timedelta(days=1)
+    return date(*parts)
+
+
+class MockEutils():
+    '''
+    在后台线程中运行的 E-utilities 替身服务器，url 为 EUTILS_BASE_URL 的替代值
+
+    Parameters:
+    -----------
+    records : int
+        语料中的记录数，PMID 从 FIRST_PMID 开始连续编号，越大越新
+    latency : float
+        每个请求的固定延迟（秒）
+    rate_429 : float
+        以 429 Too Many Requests 拒绝的请求比例
+    truncate : float
+        在记录中间截断的 EFetch 响应比例
+    retry_after : float, optional
+        429 响应的 Retry-After 秒数，默认为None（不带该头，客户端按指数退避）
+    span_days : int
+        语料的 Entrez 日期均匀分布在最近 span_days 天内
+    seed : int, optional
+        429 和截断的随机种子
+    port : int
+        监听端口，0 表示随机选择
+    '''
+    def __init__(self, records=1000, latency=0.0, rate_429=0.0, truncate=0.0, retry_after=None, span_days=3650, seed=None, port=0):
+        self.records = records
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.truncate = truncate
+        self.retry_after = retry_after
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        # 第 i 条记录（PMID = FIRST_PMID + i）的 Entrez 日期，从旧到新
+        today = date.today()
+        self._dates = [today - timedelta(days=span_days * (records - 1 - i) // max(records, 1)) for i in range(records)]
+        # history server：query_key -> 按 ESearch 顺序的 PMID 列表
+        self._history = {}
+        self._counters = {'requests': 0, 'esearch': 0, 'epost': 0, 'efetch': 0, 'esummary': 0, 'rejected_429': 0,
+                          'truncated': 0, 'records_sent': 0, 'bytes_sent': 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def start(self):
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def stats(self):
+        '''
+        返回各类请求数、拒绝的 429 数、截断的响应数、发送的记录数和字节数
+        '''
+        with self._lock:
+            return dict(self._counters)
+
+    def _count(self, **counters):
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] += value
+
+    def _roll(self, rate):
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def _search(self, params):
+        # 按日期条件筛选语料，返回从新到旧的 PMID 列表
+        low, high = 0, self.records
+        if params.get('reldate'):
+            low = bisect.bisect_left(self._dates, date.today() - timedelta(days=int(params['reldate'])))
+        if params.get('mindate'):
+            low = max(low, bisect.bisect_left(self._dates, _parse_date(params['mindate'])))
+        if params.get('maxdate'):
+            high = min(high, bisect.bisect_right(self._dates, _parse_date(params['maxdate'], end=True)))
+        return list(range(FIRST_PMID + high - 1, FIRST_PMID + low - 1, -1))
+
+    def _store(self, pmids):
+        with self._lock:
+            query_key = len(self._history) + 1
+            self._history[query_key] = pmids
+        return query_key
+
+    def _history_slice(self, params):
+        # EFetch / ESummary 的 id 列表，或 history server 上结果集的 [retstart, retstart + retmax)，最多取到前 HISTORY_CAP 条
+        if params.get('id'):
+            return [int(pmid) for pmid in params['id'].split(',')]
+        pmids = self._history.get(int(params.get('query_key', 0)), [])
+        retstart = int(params.get('retstart', 0))
+        retmax = int(params.get('retmax', 20))
+        return pmids[retstart:min(retstart + retmax, HISTORY_CAP)]
+
+    def esearch(self, params):
+        pmids = self._search(params)
+        retstart = int(params.get('retstart', 0))
+        retmax = int(params.get('retmax', 20))
+        if retmax and retstart + retmax > HISTORY_CAP:
+            return (f"<eSearchResult><Count>{len(pmids)}</Count>"
+                    f"<ERROR>Search Backend failed: retstart cannot be larger than {HISTORY_CAP - 1}</ERROR></eSearchResult>")
+        query_key = self._store(pmids) if params.get('usehistory') == 'y' else ''
+        ids = ''.join(f"<Id>{pmid}</Id>" for pmid in pmids[retstart:retstart + retmax])
+        return (f"<eSearchResult><Count>{len(pmids)}</Count><RetMax>{retmax}</RetMax><RetStart>{retstart}</RetStart>"
+                f"<QueryKey>{query_key}</QueryKey><WebEnv>MOCK_WEBENV</WebEnv><IdList>{ids}</IdList></eSearchResult>")
+
+    def epost(self, params):
+        query_key = self._store([int(pmid) for pmid in params['id'].split(',')])
+        return f"<ePostResult><QueryKey>{query_key}</QueryKey><WebEnv>MOCK_WEBENV</WebEnv></ePostResult>"
+
+    def esummary(self, params):
+        result = {'uids': []}
+        for pmid in self._history_slice(params):
+            if FIRST_PMID <= pmid < FIRST_PMID + self.records:
+                journal, issn = JOURNALS[pmid % len(JOURNALS)]
+                result['uids'].append(str(pmid))
+                result[str(pmid)] = {'uid': str(pmid), 'source': journal, 'issn': issn, 'title': f"Mock article {pmid}",
+                                     'sortpubdate': f"{self._dates[pmid - FIRST_PMID]:%Y/%m/%d} 00:00"}
+        return json.dumps({'header': {'type': 'esummary', 'version': '0.3'}, 'result': result})
+
+    def efetch(self, params):
+        pmids = [pmid for pmid in self._history_slice(params) if FIRST_PMID <= pmid < FIRST_PMID + self.records]
+        body = '\n' + '\n\n'.join(make_record(pmid, self._dates[pmid - FIRST_PMID]) for pmid in pmids) + '\n'
+        if len(pmids) > 1 and self._roll(self.truncate):
+            # 在后半部分的某条记录中间截断
+            cut = body.rfind('\nPMID- ', 0, len(body) * 3 // 4) + 40
+            self._count(truncated=1)
+            # 最后一条不完整的记录不计入
+            return body[:cut], body.count('\nPMID- ', 0, cut) - 1
+        return body, len(pmids)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        mock = self.mock
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            params.update((key, values[0]) for key, values in parse_qs(self.rfile.read(length).decode()).items())
+        endpoint = url.path.rsplit('/', 1)[-1].split('.')[0]
+        mock._count(requests=1)
+        if mock.latency:
+            time.sleep(mock.latency)
+        if endpoint not in ('esearch', 'epost', 'efetch', 'esummary'):
+            self._send(404, f"unknown endpoint {url.path}")
+            return
+        if mock._roll(mock.rate_429):
+            mock._count(rejected_429=1)
+            headers = {'Retry-After': str(mock.retry_after)} if mock.retry_after is not None else {}
+            self._send(429, '{"error":"API rate limit exceeded"}', headers)
+            return
+        mock._count(**{endpoint: 1})
+        records = 0
+        if endpoint == 'efetch':
+            body, records = mock.efetch(params)
+        else:
+            body = getattr(mock, endpoint)(params)
+        self._send(200, body)
+        mock._count(records_sent=records)
+
+    do_POST = do_GET
+
+    def _send(self, status, body, headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.mock._count(bytes_sent=len(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument('--truncate', type=float, default=0.0, help="在记录中间截断的 EFetch 响应比例")
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--span-days', type=int, default=3650)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--port', type=int, default=8999)
+    args = parser.parse_args()
+
+    mock = MockEutils(args.records, args.latency, args.rate_429, args.truncate, args.retry_after, args.span_days, args.seed, args.port)
+    mock.start()
+    # 第一行输出 URL，便于其它进程读取
+    print(mock.url, flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(mock.stats()))
+    finally:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
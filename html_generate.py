@@ -1,12 +1,22 @@
-import pandas as pd
 import re
+import base64
+import functools
+import hashlib
 import html
+import json
 import os
+import shutil
+import string
+import sys
+import tempfile
+import zlib
 from datetime import datetime
+from table_io import read_table, iter_rows, table_format
+import run_metrics
 
 
 def _build_pattern_from_query(query):
-    # Build a regex alternation pattern from a search query. Handles * wildcard and removes common boolean operators.
+    # Build the highlight pattern from a search query. Handles * wildcard and removes common boolean operators.
     if not query or not isinstance(query, str):
         return None
     tokens = re.split(r"\s+", query)
@@ -43,125 +53,283 @@ def _build_pattern_from_query(query):
 
         cleaned.append(t)
 
-    patterns = []
-    for t in cleaned:
-        if '*' in t:
-            # 修改：使用占位符，避免被 replace() 误伤
-            esc = ''.join([re.escape(ch) if ch != '*' else '___WILDCARD___' for ch in t])
-            tmp = esc.replace('___WILDCARD___', r'\w*')
-        else:
-            tmp = re.escape(t)
-        patterns.append(tmp)
+    return _highlight_pattern(cleaned)
+
 
-    if not patterns:
+def _highlight_pattern(terms):
+    # Compile the terms into one case-insensitive regex shaped like a trie: terms sharing a prefix share a branch, so the
+    # work at each text position depends on the term length, not on the number of terms. Literal terms win over wildcards
+    # ("fibrosis" over "fibro*"), and an empty group (?P<tK>) at the end of each branch tells which term matched.
+    # HTML entities are matched as well and left alone, so a term like "amp" does not break "&amp;".
+    # A term only matches at the start of a word ("wnt" marks "Wnt5a" but not "sWnt"), the same rule the page search uses.
+    trie = {}
+    for k, term in enumerate(terms):
+        if not term.strip('*'):
+            continue  # 单独的 * 会匹配每个词
+        node = trie
+        for ch in term.lower():
+            node = node.setdefault(ch, {})
+        node.setdefault(None, k)
+    if not trie:
         return None
-    return r'(?i)(' + '|'.join(patterns) + r')'
+    return r'(?:(?<![^\W_])' + _trie_regex(trie) + r'|&#?\w+;)'
 
 
-def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
-    # Generate a night-mode HTML reading list from CSV/Excel or a DataFrame with interactive features.
-    # Optional search_info dict may contain 'search_keywords', 'paper_type', 'release_date_cutoff', 'grab_total', 'save_path', 'search_date'.
+def _trie_regex(node):
+    # 字面字符在前、通配符在后，最后才是"到此结束"，这样较长、较具体的词优先
+    # 大小写写成 [Ww] 这样的字符类，比 (?i) 快
+    branches = []
+    for key in sorted(key for key in node if key is not None and key != '*'):
+        cases = sorted({key, key.upper()} if len(key.upper()) == 1 else {key})
+        char = '[' + ''.join(cases) + ']' if len(cases) > 1 else re.escape(key)
+        branches.append(char + _trie_regex(node[key]))
+    if '*' in node:
+        branches.append(r'\w*' + _trie_regex(node['*']))
+    if None in node:
+        branches.append(f'(?P<t{node[None]}>)')
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+def _is_dataframe(obj):
+    # pandas is never imported here: a DataFrame argument means the caller has already loaded it.
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+
+def _notna(value):
+    # pd.notna for a single cell without importing pandas: None, NaN, NaT and pd.NA count as missing.
+    if value is None:
+        return False
     try:
-        if isinstance(input_path_or_df, pd.DataFrame):
-            df = input_path_or_df
-        else:
-            input_path = str(input_path_or_df)
-            _, ext = os.path.splitext(input_path)
-            ext = ext.lower()
-            if ext in ('.xls', '.xlsx'):
-                df = pd.read_excel(input_path, sheet_name=0)
-            else:
-                df = pd.read_csv(input_path)
+        return bool(value == value)
+    except TypeError:
+        # pd.NA == pd.NA is itself NA, which has no truth value
+        return False
+
+
+def _read_input(input_path_or_df):
+    # Read the article table from Excel/Parquet/Feather/CSV, or pass a DataFrame through. Returns None on failure.
+    try:
+        if _is_dataframe(input_path_or_df):
+            return input_path_or_df
+        return read_table(str(input_path_or_df))
     except Exception as e:
         print(f"Failed to read input: {e}")
-        return
+        return None
+
+
+def _iter_df_rows(df):
+    # Yield (index, {column: value}) per row from column lists; avoids building a Series per row like iterrows().
+    columns = list(df.columns)
+    values = [df[col].tolist() for col in columns]
+    for index, row in zip(df.index.tolist(), zip(*values)):
+        yield index, dict(zip(columns, row))
+
 
+# pandas.read_excel / read_csv 默认识别为缺失值的字符串
+_PANDAS_NA_STRINGS = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                                '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+
+def _iter_input_rows(input_path_or_df):
+    # Stream (index, {column: value}) rows from a table file without loading it into a DataFrame. Returns None on failure.
+    if _is_dataframe(input_path_or_df):
+        return _iter_df_rows(input_path_or_df)
+    try:
+        header, rows = iter_rows(str(input_path_or_df))
+    except Exception as e:
+        print(f"Failed to read input: {e}")
+        return None
+    # 缺失值与 pandas 读取时一致，用 NaN 表示；pandas 读 Excel/CSV 时还会把 'N/A' 等字符串当作缺失值
+    nan = float('nan')
+    na_strings = _PANDAS_NA_STRINGS if table_format(str(input_path_or_df)) in ('excel', 'csv') else ()
+    return ((index, {col: nan if value is None or value in na_strings else value for col, value in zip(header, row)})
+            for index, row in enumerate(rows))
+
+
+def _first_title(df):
+    if 'Title' in df.columns or 'TI' in df.columns:
+        col = 'Title' if 'Title' in df.columns else 'TI'
+        vals = df[col].dropna().values
+        return str(vals[0]) if len(vals)>0 else ''
+    return ''
+
+
+def _pattern_for(search_info, sample_title=''):
+    # Highlight pattern from the search keywords, falling back to the first word of a sample title.
     pattern = None
     if search_info and 'search_keywords' in search_info:
         pattern = _build_pattern_from_query(search_info.get('search_keywords'))
     if not pattern:
-        sample = ''
-        if 'Title' in df.columns or 'TI' in df.columns:
-            col = 'Title' if 'Title' in df.columns else 'TI'
-            vals = df[col].dropna().values
-            sample = str(vals[0]) if len(vals)>0 else ''
-            words = re.findall(r"[A-Za-z0-9]{3,}", sample)
-            if words:
-                pattern = r'(?i)(' + re.escape(words[0]) + r')'
-
-    colors = ['#ffd54f', '#ff79c6', '#8be9fd', '#50fa7b', '#ffb86b']
-
-    def _make_highlighter(pat):
-        if not pat:
-            return lambda s: s
-        prog = re.compile(pat)
-        counter = {'i': 0}
-        def repl(m):
-            idx = counter['i'] % len(colors)
-            color = colors[idx]
-            counter['i'] += 1
-            return f'<span style="color: {color}; font-weight:700;">{m.group(0)}</span>'
-        return lambda s: prog.sub(repl, s)
+        words = re.findall(r"[A-Za-z0-9]{3,}", sample_title or '')
+        if words:
+            pattern = _highlight_pattern([words[0]])
+    return pattern
 
-    highlighter = _make_highlighter(pattern)
 
-    def truncate_text(text, length=1500):
-        if not isinstance(text, str):
-            return ""
-        if len(text) > length:
-            return text[:length] + "..."
-        return text
+_HIGHLIGHT_COLORS = ['#ffd54f', '#ff79c6', '#8be9fd', '#50fa7b', '#ffb86b']
 
-    search_block_html = ''
-    if search_info:
-        sd = search_info.get('search_date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        sk = search_info.get('search_keywords', 'N/A')
-        pt = search_info.get('paper_type', 'N/A')
-        rc = search_info.get('release_date_cutoff', None)
-        rc_text = f"last {rc} days" if rc else 'all time'
-        gt = search_info.get('grab_total_requested', search_info.get('grab_total', 'all'))
-        savep = search_info.get('save_path', '')
 
-        # Search summary block displayed on top of the HTML
-        search_block_html = f'''\
-        <div class="search-summary" id="search-summary">\
-            <h1>Search Summary (Night mode)</h1>\
-            <div class="search-meta">\
-                <div><strong>Search time:</strong> {sd}</div>\
-                <div><strong>Query:</strong> <code class="query">{html.escape(sk)}</code></div>\
-                <div><strong>Paper type:</strong> {html.escape(str(pt))}  <strong>Time range:</strong> {html.escape(rc_text)}</div>\
-                <div><strong>Requested count:</strong> {html.escape(str(gt))}  <strong>Save path:</strong> {html.escape(str(savep))}</div>\
-            </div>\
-        </div>\
+def _make_highlighter(pat):
+    # Returns highlight(text) -> text; highlight.many(*texts) highlights several texts with a single regex pass.
+    if not pat:
+        highlight = lambda s: s
+        highlight.many = lambda *texts: list(texts)
+        return highlight
+    return _compiled_highlighter(pat)
+
+
+@functools.lru_cache(maxsize=32)
+def _compiled_highlighter(pat):
+    # 每个模式只编译一次；颜色按词固定（第 K 个词用第 K 种颜色），同一个词在所有文章、所有分页中颜色相同
+    prog = re.compile(pat)
+    starts = {group: f'<span style="color: {_HIGHLIGHT_COLORS[int(group[1:]) % len(_HIGHLIGHT_COLORS)]}; font-weight:700;">'
+              for group in prog.groupindex}
+
+    def repl(m):
+        start = starts.get(m.lastgroup)
+        if start is None:
+            return m.group(0)  # HTML 实体
+        return start + m.group(0) + '</span>'
+
+    def highlight(s):
+        return prog.sub(repl, s)
+
+    def many(*texts):
+        # \x00 不会被任何词匹配，用它把几段文本连起来一次替换
+        if any('\x00' in text for text in texts):
+            return [highlight(text) for text in texts]
+        return highlight('\x00'.join(texts)).split('\x00')
+
+    highlight.many = many
+    return highlight
+
+
+def _truncate_text(text, length=1500):
+    if not isinstance(text, str):
+        return ""
+    if len(text) > length:
+        return text[:length] + "..."
+    return text
+
+
+def _bookmark_text(row):
+    # 使用实际的Excel列名
+    journal_raw = row.get('Journal', row.get('Journal (TA)', row.get('TA', '')))
+    journal = str(journal_raw).strip() if _notna(journal_raw) else "Unknown"
+    
+    pub_date_raw = row.get('publish_date', row.get('Publish Date (LR)', row.get('LR', '')))
+    if _notna(pub_date_raw) and str(pub_date_raw).strip():
+        pub_date = str(pub_date_raw).replace("-", "").replace("/", "").replace(" ", "")
+    else:
+        pub_date = "Unknown"
+    return f"{journal}. {pub_date}"
+
+
+def _sidebar_link_html(key, row):
+    bookmark_text = _bookmark_text(row)
+    # 添加状态指示器容器
+    return f'            <li><a href="#article-{key}" data-article-id="{key}"><span class="bookmark-indicators" id="indicators-{key}"></span>{html.escape(bookmark_text)}</a></li>\n'
+
+
+def _article_fields(row, highlighter, pattern):
+    # Card contents shared by the static and virtual pages; title and abstract are escaped and highlighted HTML, the rest plain text.
+    title = str(row.get('Title', row.get('TI', 'No Title')))
+    journal = str(row.get('Journal', row.get('TA', '')))
+    publish_date = str(row.get('publish_date', row.get('LR', '')))
+    abstract = str(row.get('Abstract', row.get('AB', '')))
+    pmid = str(row.get('PMID', ''))
+    doi = str(row.get('DOI', row.get('LID', '')))
+    impact_factor = str(row.get('IF', ''))
+    quartile = str(row.get('JCR_Quartile', row.get('Quartile', '')))
+    # export_store 导出的合并表格：命中该文章的查询名，以 "; " 分隔
+    queries = row.get('Queries', '')
+    queries = str(queries) if _notna(queries) else ''
+
+    display_abstract = _truncate_text(abstract, length=2000)
+    safe_title = html.escape(title)
+    safe_abstract = html.escape(display_abstract)
+    highlighted_title, highlighted_abstract = highlighter.many(safe_title, safe_abstract) if pattern else (safe_title, safe_abstract)
+
+    return {
+        'title': highlighted_title,
+        'journal': journal,
+        'publish_date': publish_date,
+        'abstract': highlighted_abstract,
+        'pmid': pmid,
+        'doi': doi,
+        'impact_factor': impact_factor if impact_factor != 'nan' else '',
+        'quartile': quartile if quartile != 'nan' else '',
+        'queries': queries,
+        # 创建书签标题（期刊名+日期）
+        'bookmark_title': f"{journal} - {publish_date}",
+    }
+
+
+def _article_card_html(key, row, highlighter, pattern, added=''):
+    # key: _article_key()；added: 文章首次加入列表时的时间戳，页面据此标记上次访问之后的新文章
+    fields = _article_fields(row, highlighter, pattern)
+    journal = fields['journal']
+    publish_date = fields['publish_date']
+    impact_factor = fields['impact_factor']
+    quartile = fields['quartile']
+    article_id = f"article-{key}"
+    added_attr = f' data-added="{added}"' if added else ''
+
+    meta_html = f'<span class="journal-info">{journal}</span>. {publish_date}.'
+    metrics_html = ''
+    if impact_factor:
+        metrics_html += f'<span class="metrics">IF: {impact_factor}</span>'
+    if quartile:
+        metrics_html += f'<span class="metrics">{quartile}</span>'
+    for query in filter(None, fields['queries'].split('; ')):
+        metrics_html += f'<span class="query-tag">{html.escape(query)}</span>'
+
+    return f'''
+        <div class="article-card" id="{article_id}"{added_attr} data-bookmark-title="{html.escape(fields["bookmark_title"])}">
+            <div class="action-buttons">
+                <button class="action-btn star-btn" onclick="toggleStar(this)" title="星标重点">⭐</button>
+                <button class="action-btn read-btn" onclick="toggleRead(this)" title="标记已读">✓</button>
+            </div>
+            <div class="article-title">{fields["title"]}</div>
+            <div class="article-meta">
+                {meta_html} <br>
+                {metrics_html}
+            </div>
+            <div class="abstract-section">
+                <span class="abstract-label">Abstract</span>
+                <div class="abstract-text">
+                    {fields["abstract"]}
+                </div>
+            </div>
+            <div class="article-ids">
+                PMID: {fields["pmid"]} &nbsp;|&nbsp; DOI: {fields["doi"]}
+            </div>
+        </div>
         '''
 
-    # 添加交互式JavaScript和CSS
 
-    # Generate sidebar bookmark links
-    sidebar_links_html = ""
-    for idx, row in df.iterrows():
-        # 使用实际的Excel列名
-        journal_raw = row.get('Journal', row.get('Journal (TA)', row.get('TA', '')))
-        journal = str(journal_raw).strip() if pd.notna(journal_raw) else "Unknown"
-        
-        pub_date_raw = row.get('publish_date', row.get('Publish Date (LR)', row.get('LR', '')))
-        if pd.notna(pub_date_raw) and str(pub_date_raw).strip():
-            pub_date = str(pub_date_raw).replace("-", "").replace("/", "").replace(" ", "")
-        else:
-            pub_date = "Unknown"
-        bookmark_text = f"{journal}. {pub_date}"
-        # 添加状态指示器容器
-        sidebar_links_html += f'            <li><a href="#article-{idx}" data-article-id="{idx}"><span class="bookmark-indicators" id="indicators-{idx}"></span>{html.escape(bookmark_text)}</a></li>\n'
+# 虚拟列表页面中每篇文章的数据是一个数组，字段顺序如下
+_PAYLOAD_FIELDS = ['id', 'bookmark', 'title', 'journal', 'publish_date', 'abstract', 'pmid', 'doi', 'impact_factor', 'quartile', 'bookmark_title',
+                   'added', 'queries']
 
-    # Extract unique identifier from output filename for localStorage isolation
-    storage_key_suffix = os.path.splitext(os.path.basename(output_html_path))[0]
-    # Sanitize: remove special chars, limit length
-    storage_key_suffix = re.sub(r'[^a-zA-Z0-9_]', '_', storage_key_suffix)[:50]
 
-    # 每次生成时注入一个唯一的 generation id（用于判断是否为新生成并清除旧的 localStorage 状态）
-    generation_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+def _article_payload(key, row, highlighter, pattern, added=''):
+    fields = _article_fields(row, highlighter, pattern)
+    fields['id'] = key
+    fields['bookmark'] = _bookmark_text(row)
+    fields['added'] = added
+    return [fields[name] for name in _PAYLOAD_FIELDS]
 
-    html_content = f'''
+
+# 追加模式用到的插入位置标记
+_SIDEBAR_END_MARKER = '<!-- sidebar-links-end -->'
+_ARTICLES_END_MARKER = '<!-- articles-end -->'
+
+# 页面开头（样式和侧边栏标题）与结尾（交互脚本），原样写出
+_PAGE_HEAD = '''
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -170,53 +338,56 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
         <meta name="viewport" content="width=device-width, initial-scale=1">
         <style>
             /* Sidebar styles */
-            .sidebar {{ position: fixed; left: 0; top: 0; width: 280px; height: 100%; background: #2a2a2a; border-right: 1px solid #444; overflow-y: auto; padding: 20px; z-index: 1000; transition: transform 0.3s; }}
-            .sidebar.hidden {{ transform: translateX(-280px); }}
-            .sidebar h2 {{ font-size: 18px; margin-bottom: 15px; color: #4a9eff; }}
-            .sidebar ul {{ list-style: none; }}
-            .sidebar li {{ margin: 8px 0; }}
-            .sidebar a {{ color: #b0b0b0; text-decoration: none; font-size: 14px; display: flex; align-items: center; gap: 5px; padding: 5px; border-radius: 3px; transition: all 0.2s; }}
-            .sidebar a:hover {{ background: #3a3a3a; color: #4a9eff; }}
-            .sidebar-toggle {{ position: fixed; left: 290px; top: 20px; background: #4a9eff; color: white; border: none; padding: 10px 15px; cursor: pointer; border-radius: 5px; z-index: 999; transition: left 0.3s; }}
-            .sidebar-toggle.sidebar-hidden {{ left: 10px; }}
+            .sidebar { position: fixed; left: 0; top: 0; width: 280px; height: 100%; background: #2a2a2a; border-right: 1px solid #444; overflow-y: auto; padding: 20px; z-index: 1000; transition: transform 0.3s; }
+            .sidebar.hidden { transform: translateX(-280px); }
+            .sidebar h2 { font-size: 18px; margin-bottom: 15px; color: #4a9eff; }
+            .sidebar ul { list-style: none; }
+            .sidebar li { margin: 8px 0; }
+            .sidebar a { color: #b0b0b0; text-decoration: none; font-size: 14px; display: flex; align-items: center; gap: 5px; padding: 5px; border-radius: 3px; transition: all 0.2s; }
+            .sidebar a:hover { background: #3a3a3a; color: #4a9eff; }
+            .sidebar-toggle { position: fixed; left: 290px; top: 20px; background: #4a9eff; color: white; border: none; padding: 10px 15px; cursor: pointer; border-radius: 5px; z-index: 999; transition: left 0.3s; }
+            .sidebar-toggle.sidebar-hidden { left: 10px; }
             
-            :root {{ --bg:#0b1220; --card:#07101a; --muted:#98a2b3; --text:#e6eef8; --accent:#66d9ef; --metric-bg:rgba(255,255,255,0.04); --border:rgba(255,255,255,0.06); }}
-            html,body {{ background: linear-gradient(180deg,#051021 0%,#071827 100%); color:var(--text); font-family: -apple-system,BlinkMacSystemFont,"Segoe UI",Roboto,"Helvetica Neue",Arial,sans-serif; margin:0; padding:0; transition: padding-left 0.3s; }}
-            body {{ padding-left: 300px; }}
-            body.sidebar-closed {{ padding-left: 0; }}
-            .bookmark-indicators {{ display: inline-flex; gap: 3px; min-width: 35px; flex-shrink: 0; }}
-            .bookmark-indicators .indicator {{ font-size: 14px; }}
-            .bookmark-indicators .star-indicator {{ color: #ffd700; }}
-            .bookmark-indicators .read-indicator {{ color: #4CAF50; }}
-            .container {{ max-width:1000px; margin:24px auto; padding:18px }}
-            .search-summary {{ background: linear-gradient(90deg, rgba(255,255,255,0.02), rgba(255,255,255,0.01)); border:1px solid var(--border); padding:20px; border-radius:12px; margin-bottom:20px; }}
-            .search-summary h1 {{ margin:0 0 8px 0; color:var(--accent); font-size:1.6em }}
-            .search-meta div {{ margin:6px 0; color:var(--muted) }}
-            .query {{ background: rgba(255,255,255,0.03); padding:6px 8px; border-radius:6px; color:var(--text); font-family:monospace }}
-
-            .article-card {{ background:var(--card); padding:30px; margin-bottom:18px; box-shadow: 0 6px 18px rgba(2,6,23,0.6); border:1px solid var(--border); border-radius:10px; page-break-inside:avoid; position:relative; transition: border-color 0.3s }}
-            .article-card.starred {{ border-left: 4px solid #ffd700; }}
-            .article-card.read {{ opacity: 0.6; }}
+            :root { --bg:#0b1220; --card:#07101a; --muted:#98a2b3; --text:#e6eef8; --accent:#66d9ef; --metric-bg:rgba(255,255,255,0.04); --border:rgba(255,255,255,0.06); }
+            html,body { background: linear-gradient(180deg,#051021 0%,#071827 100%); color:var(--text); font-family: -apple-system,BlinkMacSystemFont,"Segoe UI",Roboto,"Helvetica Neue",Arial,sans-serif; margin:0; padding:0; transition: padding-left 0.3s; }
+            body { padding-left: 300px; }
+            body.sidebar-closed { padding-left: 0; }
+            .bookmark-indicators { display: inline-flex; gap: 3px; min-width: 35px; flex-shrink: 0; }
+            .bookmark-indicators .indicator { font-size: 14px; }
+            .bookmark-indicators .star-indicator { color: #ffd700; }
+            .bookmark-indicators .read-indicator { color: #4CAF50; }
+            .container { max-width:1000px; margin:24px auto; padding:18px }
+            .search-summary { background: linear-gradient(90deg, rgba(255,255,255,0.02), rgba(255,255,255,0.01)); border:1px solid var(--border); padding:20px; border-radius:12px; margin-bottom:20px; }
+            .search-summary h1 { margin:0 0 8px 0; color:var(--accent); font-size:1.6em }
+            .search-meta div { margin:6px 0; color:var(--muted) }
+            .query { background: rgba(255,255,255,0.03); padding:6px 8px; border-radius:6px; color:var(--text); font-family:monospace }
+
+            .article-card { background:var(--card); padding:30px; margin-bottom:18px; box-shadow: 0 6px 18px rgba(2,6,23,0.6); border:1px solid var(--border); border-radius:10px; page-break-inside:avoid; position:relative; transition: border-color 0.3s }
+            .article-card.starred { border-left: 4px solid #ffd700; }
+            .article-card.read { opacity: 0.6; }
+            /* New since last visit */
+            .article-card.new .article-title::before, .sidebar a.new::before { content: 'NEW'; background: var(--accent); color: #04111d; font-size: 10px; font-weight: 700; padding: 1px 5px; border-radius: 4px; margin-right: 8px; vertical-align: middle; }
             
-            .article-title {{ color:var(--accent); font-size:1.3em; font-weight:700; margin-bottom:8px }}
-            .article-meta {{ color:var(--muted); font-size:0.95em; margin-bottom:14px }}
-            .journal-info {{ font-style:italic; color:var(--text); font-weight:600 }}
-            .metrics {{ display:inline-block; background:var(--metric-bg); padding:4px 8px; border-radius:6px; margin-right:6px; color:var(--text); font-size:0.85em }}
-            .abstract-section {{ margin-top:12px }}
-            .abstract-label {{ font-weight:700; color:var(--text); margin-bottom:6px; display:block }}
-            .abstract-text {{ color:#dbe9f6; line-height:1.7; text-align:justify }}
-            .article-ids {{ margin-top:16px; color:var(--muted); font-size:0.9em; border-top:1px dashed rgba(255,255,255,0.03); padding-top:10px }}
+            .article-title { color:var(--accent); font-size:1.3em; font-weight:700; margin-bottom:8px }
+            .article-meta { color:var(--muted); font-size:0.95em; margin-bottom:14px }
+            .journal-info { font-style:italic; color:var(--text); font-weight:600 }
+            .metrics { display:inline-block; background:var(--metric-bg); padding:4px 8px; border-radius:6px; margin-right:6px; color:var(--text); font-size:0.85em }
+            .query-tag { display:inline-block; border:1px solid var(--accent); color:var(--accent); padding:3px 8px; border-radius:10px; margin-right:6px; font-size:0.8em }
+            .abstract-section { margin-top:12px }
+            .abstract-label { font-weight:700; color:var(--text); margin-bottom:6px; display:block }
+            .abstract-text { color:#dbe9f6; line-height:1.7; text-align:justify }
+            .article-ids { margin-top:16px; color:var(--muted); font-size:0.9em; border-top:1px dashed rgba(255,255,255,0.03); padding-top:10px }
             
             /* 交互按钮样式 */
-            .action-buttons {{ position: absolute; top: 20px; right: 20px; display: flex; gap: 8px; }}
-            .action-btn {{ cursor: pointer; padding: 6px 10px; border-radius: 6px; font-size: 0.9em; transition: all 0.2s; background: rgba(255,255,255,0.05); border: 1px solid var(--border); color: var(--muted); }}
-            .action-btn:hover {{ background: rgba(255,255,255,0.1); transform: scale(1.05); }}
-            .action-btn.active {{ background: rgba(102,217,239,0.2); color: #66d9ef; border-color: #66d9ef; }}
-            .bookmark-btn.active {{ color: #ffd700; border-color: #ffd700; }}
-            .star-btn.active {{ color: #ffd700; border-color: #ffd700; }}
-            .read-btn.active {{ color: #50fa7b; border-color: #50fa7b; }}
+            .action-buttons { position: absolute; top: 20px; right: 20px; display: flex; gap: 8px; }
+            .action-btn { cursor: pointer; padding: 6px 10px; border-radius: 6px; font-size: 0.9em; transition: all 0.2s; background: rgba(255,255,255,0.05); border: 1px solid var(--border); color: var(--muted); }
+            .action-btn:hover { background: rgba(255,255,255,0.1); transform: scale(1.05); }
+            .action-btn.active { background: rgba(102,217,239,0.2); color: #66d9ef; border-color: #66d9ef; }
+            .bookmark-btn.active { color: #ffd700; border-color: #ffd700; }
+            .star-btn.active { color: #ffd700; border-color: #ffd700; }
+            .read-btn.active { color: #50fa7b; border-color: #50fa7b; }
             
-            @media print {{ body{{ background:white; color:black }} .article-card{{ box-shadow:none; border:none }} .action-buttons {{ display: none; }} }}
+            @media print { body{ background:white; color:black } .article-card{ box-shadow:none; border:none } .action-buttons { display: none; } }
         </style>
     </head>
     <body>
@@ -225,86 +396,10 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
         <h2>📑 Bookmarks</h2>
         <ul>
             <li><a href="#search-summary">Research Summary</a></li>
-    {sidebar_links_html}
-        </ul>
-    </div>
-    <div class="container">
-    {search_block_html}
     '''
 
-    for index, row in df.iterrows():
-        title = str(row.get('Title', row.get('TI', 'No Title')))
-        journal = str(row.get('Journal', row.get('TA', '')))
-        publish_date = str(row.get('publish_date', row.get('LR', '')))
-        abstract = str(row.get('Abstract', row.get('AB', '')))
-        pmid = str(row.get('PMID', ''))
-        doi = str(row.get('DOI', row.get('LID', '')))
-        impact_factor = str(row.get('IF', ''))
-        quartile = str(row.get('JCR_Quartile', row.get('Quartile', '')))
-
-        display_abstract = truncate_text(abstract, length=2000)
-        safe_title = html.escape(title)
-        safe_abstract = html.escape(display_abstract)
-        highlighted_title = highlighter(safe_title) if pattern else safe_title
-        highlighted_abstract = highlighter(safe_abstract) if pattern else safe_abstract
-
-        # 创建书签标题（期刊名+日期）
-        bookmark_title = f"{journal} - {publish_date}"
-        article_id = f"article-{index}"
-
-        meta_html = f'<span class="journal-info">{journal}</span>. {publish_date}.'
-        metrics_html = ''
-        if impact_factor and impact_factor != 'nan':
-            metrics_html += f'<span class="metrics">IF: {impact_factor}</span>'
-        if quartile and quartile != 'nan':
-            metrics_html += f'<span class="metrics">{quartile}</span>'
-
-        article_html = f'''
-        <div class="article-card" id="{article_id}" data-bookmark-title="{html.escape(bookmark_title)}">
-            <div class="action-buttons">
-                <button class="action-btn star-btn" onclick="toggleStar(this)" title="星标重点">⭐</button>
-                <button class="action-btn read-btn" onclick="toggleRead(this)" title="标记已读">✓</button>
-            </div>
-            <div class="article-title">{highlighted_title}</div>
-            <div class="article-meta">
-                {meta_html} <br>
-                {metrics_html}
-            </div>
-            <div class="abstract-section">
-                <span class="abstract-label">Abstract</span>
-                <div class="abstract-text">
-                    {highlighted_abstract}
-                </div>
-            </div>
-            <div class="article-ids">
-                PMID: {pmid} &nbsp;|&nbsp; DOI: {doi}
-            </div>
-        </div>
-        '''
-        html_content += article_html
-
-# 添加交互式JavaScript
-    html_content += '''
+_PAGE_SCRIPT = '''
     <script>
-        // Unique storage key suffix to isolate localStorage for different queries
-        const STORAGE_KEY_PREFIX = '{storage_key_suffix}';
-        // Unique generation id injected at file creation time
-        const GENERATION_ID = '{generation_id}';
-
-        // If the stored generation id differs, reset persisted starred/read state (clear old markers)
-        (function(){
-            const genKey = 'generation_' + STORAGE_KEY_PREFIX;
-            if (localStorage.getItem(genKey) !== GENERATION_ID) {
-                try {
-                    localStorage.setItem('starred_' + STORAGE_KEY_PREFIX, JSON.stringify([]));
-                    localStorage.setItem('read_' + STORAGE_KEY_PREFIX, JSON.stringify([]));
-                    localStorage.setItem(genKey, GENERATION_ID);
-                } catch (e) {
-                    console.warn('localStorage reset failed', e);
-                }
-            }
-        })();
-
         // 更新侧边栏的小图标
         function updateSidebarIndicator(articleId) {
             // 从 article-0 提取 0
@@ -423,6 +518,19 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
             
             // 初始化侧边栏所有图标
             updateAllSidebarIndicators();
+
+            // 标记上次访问之后新加入的文章
+            let latest = '';
+            document.querySelectorAll('.article-card[data-added]').forEach(card => {
+                const added = card.dataset.added;
+                if (isNewSinceLastVisit(added)) {
+                    card.classList.add('new');
+                    const link = document.querySelector('.sidebar a[href="#' + card.id + '"]');
+                    if (link) link.classList.add('new');
+                }
+                if (added > latest) latest = added;
+            });
+            markVisited(latest);
         }
     </script>
     </div>
@@ -430,12 +538,1106 @@ def generate_reading_list(input_path_or_df, output_html_path, search_info=None):
     </html>
     '''
 
+# 页内搜索：生成页面时建立标题/摘要的倒排索引，浏览器端的分词规则（/[\p{L}\p{N}]+/gu、小写、去停用词）与 _search_tokens 一致
+_SEARCH_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+_SEARCH_PUNCTUATION = str.maketrans(dict.fromkeys(string.punctuation, ' '))
+_SEARCH_STOP_WORDS = frozenset(['an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is', 'it', 'of', 'on', 'or',
+                                'that', 'the', 'these', 'this', 'to', 'was', 'were', 'which', 'with'])
+
+
+def _search_tokens(text):
+    # 去重后的 token 集合；先按 ASCII 标点和空白切分（比整段跑正则快一倍），含其它符号的片段再用正则细分
+    if not isinstance(text, str):
+        return set()
+    tokens = set()
+    for piece in set(text.lower().translate(_SEARCH_PUNCTUATION).split()):
+        if piece.isalnum():
+            tokens.add(piece)
+        else:
+            tokens.update(_SEARCH_TOKEN_PATTERN.findall(piece))
+    return {token for token in tokens if len(token) > 1 and token not in _SEARCH_STOP_WORDS}
+
+
+class _SearchIndexBuilder():
+    # token -> 文章位置列表，位置递增；每项编码为 (与上一项的位置差 * 2 + 是否出现在标题)，差值编码让 JSON 保持紧凑
+    def __init__(self):
+        self._postings = {}
+
+    def add(self, position, row):
+        title = row.get('Title', row.get('TI'))
+        abstract = row.get('Abstract', row.get('AB'))
+        flags = dict.fromkeys(_search_tokens(abstract), 0)
+        flags.update(dict.fromkeys(_search_tokens(title), 1))
+        for token, in_title in flags.items():
+            self._postings.setdefault(token, []).append((position, in_title))
+
+    def parts(self):
+        # {"tokens": [...按字典序...], "postings": [[...], ...]}，逐个 token 生成
+        tokens = sorted(self._postings)
+        yield '{"tokens":' + json.dumps(tokens, ensure_ascii=False, separators=(',', ':')) + ',"postings":['
+        for i, token in enumerate(tokens):
+            previous = 0
+            encoded = []
+            for position, in_title in self._postings[token]:
+                encoded.append((position - previous) * 2 + in_title)
+                previous = position
+            text = '[' + ','.join(map(str, encoded)) + ']'
+            yield ',' + text if i else text
+        yield ']}'
+
+
+_SEARCH_PANEL_HTML = '''
+    <div class="search-panel">
+        <input type="search" id="search-input" placeholder="Search titles and abstracts (AND / OR / NOT, fibro*)" autocomplete="off">
+        <label>IF ≥ <input type="number" id="filter-if" min="0" step="0.1"></label>
+        <select id="filter-quartile">
+            <option value="">All quartiles</option>
+            <option value="Q1">Q1</option>
+            <option value="Q2">Q2</option>
+            <option value="Q3">Q3</option>
+            <option value="Q4">Q4</option>
+        </select>
+        <label><input type="checkbox" id="filter-starred"> ⭐ only</label>
+        <select id="filter-read">
+            <option value="">All</option>
+            <option value="unread">Unread</option>
+            <option value="read">Read</option>
+        </select>
+        <span class="search-count" id="search-count"></span>
+    </div>
+    '''
+
+_SEARCH_PANEL_CSS = '''            /* Search panel */
+            .search-panel { position: sticky; top: 0; z-index: 50; display: flex; flex-wrap: wrap; gap: 10px; align-items: center; background: var(--card); border: 1px solid var(--border); padding: 12px 16px; border-radius: 12px; margin-bottom: 20px; color: var(--muted); }
+            .search-panel input, .search-panel select { background: var(--bg); color: var(--text); border: 1px solid var(--border); border-radius: 6px; padding: 6px 8px; font-size: 14px; }
+            .search-panel #search-input { flex: 1 1 280px; }
+            .search-panel #filter-if { width: 70px; }
+            .search-count { margin-left: auto; font-size: 13px; }
+'''
+
+# 搜索函数，虚拟列表页面和静态页面共用；索引格式为 {"tokens": [...], "postings": [...]}（见 _SearchIndexBuilder）
+_SEARCH_SCRIPT = r'''
+        // ---- 搜索：标题/摘要的倒排索引，查询语法和匹配规则与关键词高亮（_build_pattern_from_query）一致 ----
+        // 词之间默认 AND，OR 连接的词任一命中即可，NOT 排除下一个词，* 为通配符；标题命中的权重高于摘要
+        // 和高亮一样，一个词匹配以它开头的单词：wnt 找到 Wnt5a，*osis 找到 fibrosis
+
+        const TOKEN_PATTERN = /[\p{L}\p{N}]+/gu;
+        const STOP_WORDS = new Set(__SEARCH_STOP_WORDS__);
+        const TITLE_WEIGHT = 3;
+        let searchIndex = null;
+
+        function tokenize(text) {
+            return (text.toLowerCase().match(TOKEN_PATTERN) || []).filter(token => token.length > 1 && !STOP_WORDS.has(token));
+        }
+
+        function parseQuery(query) {
+            const groups = [];
+            const excluded = [];
+            let skipNext = false;
+            let orNext = false;
+            for (let token of query.trim().split(/\s+/)) {
+                const upper = token.toUpperCase();
+                if (upper === 'NOT') { skipNext = true; continue; }
+                if (upper === 'AND') { skipNext = false; continue; }
+                if (upper === 'OR') { skipNext = false; orNext = groups.length > 0; continue; }
+                token = token.replace(/^\(+|\)+$/g, '');
+                if (token.includes('[')) token = token.split('[')[0];
+                token = token.replace(/^"+|"+$/g, '');
+                if (!/[A-Za-z0-9*]/.test(token)) continue;
+                const term = {text: token.toLowerCase(), wildcard: token.includes('*')};
+                if (skipNext) { excluded.push(term); skipNext = false; continue; }
+                if (orNext) groups[groups.length - 1].push(term);
+                else groups.push([term]);
+                orNext = false;
+            }
+            return {groups: groups, excluded: excluded};
+        }
+
+        // 倒排表：每项为 (文章位置差值 * 2 + 是否出现在标题)
+        function postingsOf(k, hits) {
+            const deltas = searchIndex.postings[k];
+            let position = 0;
+            for (const value of deltas) {
+                position += value >> 1;
+                hits.set(position, Math.max(hits.get(position) || 0, (value & 1) ? TITLE_WEIGHT : 1));
+            }
+        }
+
+        // 返回 Map(文章位置 -> 权重)
+        function docsForToken(token, prefix) {
+            const tokens = searchIndex.tokens;
+            const hits = new Map();
+            let lo = 0, hi = tokens.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >> 1;
+                if (tokens[mid] < token) lo = mid + 1; else hi = mid;
+            }
+            if (!prefix) {
+                if (tokens[lo] === token) postingsOf(lo, hits);
+                return hits;
+            }
+            for (let k = lo; k < tokens.length && tokens[k].startsWith(token); k++) postingsOf(k, hits);
+            return hits;
+        }
+
+        function docsForTerm(term) {
+            if (term.wildcard && !/^[^*]+\*$/.test(term.text)) {
+                // 不是简单的前缀通配（如 *osis、fib*sis），扫描词表
+                const pattern = new RegExp('^' + term.text.split('*').map(part => part.replace(/[.+?^${}()|[\]\\]/g, '\\$&')).join('[\\p{L}\\p{N}]*'), 'u');
+                const hits = new Map();
+                searchIndex.tokens.forEach((token, k) => { if (pattern.test(token)) postingsOf(k, hits); });
+                return hits;
+            }
+            const parts = tokenize(term.text.replace(/\*$/, ''));
+            if (!parts.length) return null;
+            // 一个词被拆成多个 token（如 beta-catenin）时要求全部命中
+            let result = null;
+            parts.forEach((part, i) => {
+                const hits = docsForToken(part, i === parts.length - 1);
+                if (result === null) { result = hits; return; }
+                const merged = new Map();
+                result.forEach((weight, position) => { if (hits.has(position)) merged.set(position, Math.min(weight, hits.get(position))); });
+                result = merged;
+            });
+            return result;
+        }
+
+        // n: 文章总数，用于计算 idf
+        function search(query, n) {
+            const parsed = parseQuery(query);
+            let scores = null;
+            for (const group of parsed.groups) {
+                let groupHits = null;
+                for (const term of group) {
+                    const hits = docsForTerm(term);
+                    if (hits === null) continue;
+                    const idf = Math.log(1 + n / Math.max(1, hits.size));
+                    groupHits = groupHits || new Map();
+                    hits.forEach((weight, position) => groupHits.set(position, Math.max(groupHits.get(position) || 0, weight * idf)));
+                }
+                // 只有停用词的组不参与筛选
+                if (groupHits === null) continue;
+                if (scores === null) { scores = groupHits; continue; }
+                const merged = new Map();
+                scores.forEach((score, position) => { if (groupHits.has(position)) merged.set(position, score + groupHits.get(position)); });
+                scores = merged;
+            }
+            if (scores === null) return null;
+            for (const term of parsed.excluded) {
+                const hits = docsForTerm(term);
+                if (hits) hits.forEach((weight, position) => scores.delete(position));
+            }
+            return scores;
+        }
+
+        // 页面各自定义 applyFilters()
+        function initSearch(index, total) {
+            searchIndex = index;
+            let timer = null;
+            const schedule = () => { clearTimeout(timer); timer = setTimeout(applyFilters, 150); };
+            document.getElementById('search-input').addEventListener('input', schedule);
+            document.getElementById('filter-if').addEventListener('input', schedule);
+            ['filter-quartile', 'filter-starred', 'filter-read'].forEach(id => document.getElementById(id).addEventListener('change', applyFilters));
+            document.getElementById('search-count').textContent = total + ' articles';
+        }
+'''.replace('__SEARCH_STOP_WORDS__', json.dumps(sorted(_SEARCH_STOP_WORDS)))
+
+# 虚拟列表页面：同样的样式加上虚拟列表用的几条规则；脚本从嵌入的 JSON 渲染文章和侧边栏
+_VIRTUAL_PAGE_HEAD = _PAGE_HEAD.replace('        </style>', '''            /* Virtual list */
+            .sidebar-virtual { position: relative; }
+            .sidebar-virtual ul { position: absolute; left: 0; right: 0; margin: 0; padding: 0; }
+            .sidebar-virtual li { margin: 0; height: 32px; }
+            .sidebar-virtual a { white-space: nowrap; overflow: hidden; }
+            .loading-status { color: var(--muted); text-align: center; padding: 40px; }
+''' + _SEARCH_PANEL_CSS + '''        </style>''', 1)
+
+# 带搜索框的静态页面
+_SEARCH_PAGE_HEAD = _PAGE_HEAD.replace('        </style>', _SEARCH_PANEL_CSS + '        </style>', 1)
+
+_VIRTUAL_PAGE_SCRIPT = r'''
+    <script>
+        // 虚拟列表：文章数据来自上面的 JSON，只渲染视口附近的文章块和侧边栏条目
+        const BLOCK_SIZE = 50;              // 每个文章块的文章数，块是渲染/释放的单位
+        const ESTIMATED_CARD_HEIGHT = 360;  // 未渲染过的块按此估算高度
+        const SIDEBAR_ROW_HEIGHT = 32;      // 侧边栏每行固定高度
+        const SIDEBAR_OVERSCAN = 20;        // 侧边栏可见区域上下多渲染的行数
+
+        let F = {};
+        let articles = [];
+        let view = [];                      // 当前显示的文章（articles 中的位置），搜索/筛选后是结果的排序
+        let positionById = new Map();
+        let starred = new Set();
+        let read = new Set();
+        const blocks = [];
+        let observer = null;
+        let sidebarRange = [-1, -1];
+
+        function escapeHtml(value) {
+            return String(value).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+        }
+
+        async function loadJson(id) {
+            const el = document.getElementById(id);
+            if (!el) return null;
+            let text = el.textContent;
+            if (el.dataset.encoding === 'gzip-base64') {
+                const bytes = Uint8Array.from(atob(text.trim()), c => c.charCodeAt(0));
+                const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+                text = await new Response(stream).text();
+            }
+            return JSON.parse(text);
+        }
+
+        function saveState(name, ids) {
+            localStorage.setItem(name + '_' + STORAGE_KEY_PREFIX, JSON.stringify(Array.from(ids)));
+        }
+
+        function articleId(article) {
+            return 'article-' + article[F.id];
+        }
+
+        function cardHtml(article) {
+            const id = articleId(article);
+            const isStarred = starred.has(id);
+            const isRead = read.has(id);
+            let metrics = '';
+            if (article[F.impact_factor]) metrics += '<span class="metrics">IF: ' + escapeHtml(article[F.impact_factor]) + '</span>';
+            if (article[F.quartile]) metrics += '<span class="metrics">' + escapeHtml(article[F.quartile]) + '</span>';
+            if (article[F.queries]) article[F.queries].split('; ').forEach(query => { metrics += '<span class="query-tag">' + escapeHtml(query) + '</span>'; });
+            return '<div class="article-card' + (isStarred ? ' starred' : '') + (isRead ? ' read' : '') + (isNewSinceLastVisit(article[F.added]) ? ' new' : '') + '" id="' + id + '" data-bookmark-title="' + escapeHtml(article[F.bookmark_title]) + '">'
+                + '<div class="action-buttons">'
+                + '<button class="action-btn star-btn' + (isStarred ? ' active' : '') + '" onclick="toggleStar(this)" title="星标重点">⭐</button>'
+                + '<button class="action-btn read-btn' + (isRead ? ' active' : '') + '" onclick="toggleRead(this)" title="标记已读">✓</button>'
+                + '</div>'
+                + '<div class="article-title">' + article[F.title] + '</div>'
+                + '<div class="article-meta"><span class="journal-info">' + escapeHtml(article[F.journal]) + '</span>. ' + escapeHtml(article[F.publish_date]) + '. <br>' + metrics + '</div>'
+                + '<div class="abstract-section"><span class="abstract-label">Abstract</span><div class="abstract-text">' + article[F.abstract] + '</div></div>'
+                + '<div class="article-ids">PMID: ' + escapeHtml(article[F.pmid]) + ' &nbsp;|&nbsp; DOI: ' + escapeHtml(article[F.doi]) + '</div>'
+                + '</div>';
+        }
+
+        // ---- 文章块：进入视口附近时渲染，离开后释放 DOM，只保留测得的高度 ----
+
+        function renderBlock(block) {
+            if (block.rendered) return;
+            block.el.innerHTML = view.slice(block.start, block.start + block.count).map(position => cardHtml(articles[position])).join('');
+            block.el.style.height = '';
+            block.rendered = true;
+        }
+
+        function releaseBlock(block) {
+            if (!block.rendered) return;
+            block.height = block.el.offsetHeight;
+            block.el.style.height = block.height + 'px';
+            block.el.innerHTML = '';
+            block.rendered = false;
+        }
+
+        function buildBlocks() {
+            const list = document.getElementById('article-list');
+            if (observer) observer.disconnect();
+            blocks.length = 0;
+            list.innerHTML = '';
+            const fragment = document.createDocumentFragment();
+            for (let start = 0; start < view.length; start += BLOCK_SIZE) {
+                const count = Math.min(BLOCK_SIZE, view.length - start);
+                const el = document.createElement('div');
+                el.className = 'article-block';
+                el.dataset.block = blocks.length;
+                el.style.height = (count * ESTIMATED_CARD_HEIGHT) + 'px';
+                blocks.push({el: el, start: start, count: count, rendered: false});
+                fragment.appendChild(el);
+            }
+            list.appendChild(fragment);
+
+            observer = new IntersectionObserver(entries => {
+                entries.forEach(entry => {
+                    const block = blocks[entry.target.dataset.block];
+                    if (!block || block.el !== entry.target) return;
+                    if (entry.isIntersecting) renderBlock(block);
+                    else releaseBlock(block);
+                });
+            }, {rootMargin: '1500px 0px'});
+            blocks.forEach(block => observer.observe(block.el));
+        }
+
+        // position 是 view 中的位置
+        function goToArticle(position) {
+            renderBlock(blocks[Math.floor(position / BLOCK_SIZE)]);
+            const id = articleId(articles[view[position]]);
+            document.getElementById(id).scrollIntoView();
+            history.replaceState(null, '', '#' + id);
+            return false;
+        }
+
+        function showView(positions) {
+            view = positions;
+            document.getElementById('sidebar-virtual').style.height = (view.length * SIDEBAR_ROW_HEIGHT) + 'px';
+            renderSidebar(true);
+            buildBlocks();
+        }
+
+        // ---- 侧边栏：固定行高的虚拟列表，只渲染可见的行 ----
+
+        function indicatorHtml(id) {
+            let html = '';
+            if (starred.has(id)) html += '<span class="indicator star-indicator">⭐</span>';
+            if (read.has(id)) html += '<span class="indicator read-indicator">✓</span>';
+            return html;
+        }
+
+        function renderSidebar(force) {
+            const sidebar = document.querySelector('.sidebar');
+            const box = document.getElementById('sidebar-virtual');
+            const top = sidebar.scrollTop - box.offsetTop;
+            const first = Math.max(0, Math.floor(top / SIDEBAR_ROW_HEIGHT) - SIDEBAR_OVERSCAN);
+            const last = Math.min(view.length, Math.ceil((top + sidebar.clientHeight) / SIDEBAR_ROW_HEIGHT) + SIDEBAR_OVERSCAN);
+            if (!force && first === sidebarRange[0] && last === sidebarRange[1]) return;
+            sidebarRange = [first, last];
+
+            let html = '';
+            for (let position = first; position < last; position++) {
+                const article = articles[view[position]];
+                const num = article[F.id];
+                const id = 'article-' + num;
+                html += '<li><a href="#' + id + '"' + (isNewSinceLastVisit(article[F.added]) ? ' class="new"' : '') + ' data-article-id="' + num + '" onclick="return goToArticle(' + position + ')">'
+                    + '<span class="bookmark-indicators" id="indicators-' + num + '">' + indicatorHtml(id) + '</span>'
+                    + escapeHtml(article[F.bookmark]) + '</a></li>';
+            }
+            const windowList = document.getElementById('sidebar-window');
+            windowList.style.top = (first * SIDEBAR_ROW_HEIGHT) + 'px';
+            windowList.innerHTML = html;
+        }
+
+        // 只更新当前渲染出来的侧边栏条目，其余条目滚动到可见时按状态生成
+        function updateSidebarIndicator(id) {
+            const indicatorContainer = document.getElementById('indicators-' + id.replace('article-', ''));
+            if (indicatorContainer) indicatorContainer.innerHTML = indicatorHtml(id);
+        }
+
+        function toggleSidebar() {
+            const sidebar = document.querySelector('.sidebar');
+            const toggle = document.querySelector('.sidebar-toggle');
+            const body = document.body;
+
+            sidebar.classList.toggle('hidden');
+            toggle.classList.toggle('sidebar-hidden');
+            body.classList.toggle('sidebar-closed');
+        }
+
+        function toggleState(btn, ids, name, cardClass) {
+            const card = btn.closest('.article-card');
+            if (!card) return;
+            const id = card.id;
+            if (ids.has(id)) {
+                ids.delete(id);
+                card.classList.remove(cardClass);
+                btn.classList.remove('active');
+            } else {
+                ids.add(id);
+                card.classList.add(cardClass);
+                btn.classList.add('active');
+            }
+            saveState(name, ids);
+            updateSidebarIndicator(id);
+        }
+
+        function toggleStar(btn) {
+            toggleState(btn, starred, 'starred', 'starred');
+        }
+
+        function toggleRead(btn) {
+            toggleState(btn, read, 'read', 'read');
+        }
+
+__SEARCH_FUNCTIONS__
+
+        function applyFilters() {
+            const query = document.getElementById('search-input').value;
+            const minIf = parseFloat(document.getElementById('filter-if').value);
+            const quartile = document.getElementById('filter-quartile').value;
+            const starredOnly = document.getElementById('filter-starred').checked;
+            const readFilter = document.getElementById('filter-read').value;
+
+            const scores = query.trim() ? search(query, articles.length) : null;
+            let positions = scores ? Array.from(scores.keys()) : articles.map((article, position) => position);
+            positions = positions.filter(position => {
+                const article = articles[position];
+                const id = articleId(article);
+                if (!isNaN(minIf) && !(parseFloat(article[F.impact_factor]) >= minIf)) return false;
+                if (quartile && article[F.quartile] !== quartile) return false;
+                if (starredOnly && !starred.has(id)) return false;
+                if (readFilter === 'read' && !read.has(id)) return false;
+                if (readFilter === 'unread' && read.has(id)) return false;
+                return true;
+            });
+            // 有查询时按得分排序，得分相同保持原顺序
+            if (scores) positions.sort((a, b) => (scores.get(b) - scores.get(a)) || (a - b));
+            document.getElementById('search-count').textContent = positions.length === articles.length ? articles.length + ' articles' : positions.length + ' / ' + articles.length + ' articles';
+            showView(positions);
+            window.scrollTo(0, 0);
+        }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            starred = new Set(JSON.parse(localStorage.getItem('starred_' + STORAGE_KEY_PREFIX) || '[]'));
+            read = new Set(JSON.parse(localStorage.getItem('read_' + STORAGE_KEY_PREFIX) || '[]'));
+            Promise.all([loadJson('articles-data'), loadJson('articles-index')]).then(([data, index]) => {
+                data.fields.forEach((name, i) => { F[name] = i; });
+                articles = data.articles;
+                articles.forEach((article, position) => positionById.set(articleId(article), position));
+                markVisited(articles.reduce((latest, article) => article[F.added] > latest ? article[F.added] : latest, ''));
+                document.getElementById('loading-status').remove();
+
+                document.querySelector('.sidebar').addEventListener('scroll', () => renderSidebar(false), {passive: true});
+                window.addEventListener('resize', () => renderSidebar(false));
+                showView(articles.map((article, position) => position));
+                if (index) initSearch(index, articles.length);
+
+                const target = positionById.get(location.hash.slice(1));
+                if (target !== undefined) goToArticle(target);
+            }).catch(e => {
+                document.getElementById('loading-status').textContent = 'Failed to load articles: ' + e;
+            });
+        });
+    </script>
+    </body>
+    </html>
+    '''.replace('__SEARCH_FUNCTIONS__', _SEARCH_SCRIPT.rstrip('\n'))
+
+
+# 带搜索框的静态页面：打开页面时从文章卡片的标题/摘要建立同样格式的倒排索引，之后追加进来的文章（append_to_reading_list）也包括在内；
+# 筛选时隐藏不匹配的卡片和侧边栏条目，有查询时按得分重排，清空查询后恢复原顺序
+_STATIC_SEARCH_SCRIPT = r'''
+    <script>
+__SEARCH_FUNCTIONS__
+
+        let cards = [];
+        let sidebarItems = [];              // 与 cards 一一对应的侧边栏 <li>，没有链接的为 null
+        let cardMetrics = [];
+        let anchors = [null, null];         // 卡片和侧边栏条目重排时插在这两个节点之前
+
+        function buildSearchIndex() {
+            const postings = new Map();
+            cards.forEach((card, position) => {
+                const title = card.querySelector('.article-title');
+                const abstract = card.querySelector('.abstract-text');
+                const flags = new Map();
+                tokenize(abstract ? abstract.textContent : '').forEach(token => flags.set(token, 0));
+                tokenize(title ? title.textContent : '').forEach(token => flags.set(token, 1));
+                flags.forEach((inTitle, token) => {
+                    let list = postings.get(token);
+                    if (!list) { list = {previous: 0, deltas: []}; postings.set(token, list); }
+                    list.deltas.push((position - list.previous) * 2 + inTitle);
+                    list.previous = position;
+                });
+            });
+            const tokens = Array.from(postings.keys()).sort();
+            return {tokens: tokens, postings: tokens.map(token => postings.get(token).deltas)};
+        }
+
+        // IF 和分区取自卡片上的 .metrics 标签（"IF: 12.3"、"Q1"）
+        function readMetrics(card) {
+            const metrics = {impactFactor: NaN, quartile: ''};
+            card.querySelectorAll('.metrics').forEach(span => {
+                const text = span.textContent.trim();
+                if (text.startsWith('IF: ')) metrics.impactFactor = parseFloat(text.slice(4));
+                else metrics.quartile = text;
+            });
+            return metrics;
+        }
+
+        // 最后一个节点之后的位置，重排时都插在它之前；null 表示父节点末尾
+        function anchorAfter(nodes) {
+            const last = nodes.filter(node => node).pop();
+            return last ? [last.parentNode, last.nextSibling] : null;
+        }
+
+        function reorder(nodes, order, anchor) {
+            if (!anchor) return;
+            order.forEach(position => { if (nodes[position]) anchor[0].insertBefore(nodes[position], anchor[1]); });
+        }
+
+        function applyFilters() {
+            const query = document.getElementById('search-input').value;
+            const minIf = parseFloat(document.getElementById('filter-if').value);
+            const quartile = document.getElementById('filter-quartile').value;
+            const starredOnly = document.getElementById('filter-starred').checked;
+            const readFilter = document.getElementById('filter-read').value;
+
+            const scores = query.trim() ? search(query, cards.length) : null;
+            let positions = scores ? Array.from(scores.keys()) : cards.map((card, position) => position);
+            positions = positions.filter(position => {
+                const card = cards[position];
+                const metrics = cardMetrics[position];
+                if (!isNaN(minIf) && !(metrics.impactFactor >= minIf)) return false;
+                if (quartile && metrics.quartile !== quartile) return false;
+                if (starredOnly && !card.classList.contains('starred')) return false;
+                if (readFilter === 'read' && !card.classList.contains('read')) return false;
+                if (readFilter === 'unread' && card.classList.contains('read')) return false;
+                return true;
+            });
+            // 有查询时按得分排序，得分相同保持原顺序
+            if (scores) positions.sort((a, b) => (scores.get(b) - scores.get(a)) || (a - b));
+
+            const shown = new Set(positions);
+            const order = positions.concat(cards.map((card, position) => position).filter(position => !shown.has(position)));
+            cards.forEach((card, position) => { card.style.display = shown.has(position) ? '' : 'none'; });
+            sidebarItems.forEach((item, position) => { if (item) item.style.display = shown.has(position) ? '' : 'none'; });
+            reorder(cards, order, anchors[0]);
+            reorder(sidebarItems, order, anchors[1]);
+            document.getElementById('search-count').textContent = positions.length === cards.length ? cards.length + ' articles' : positions.length + ' / ' + cards.length + ' articles';
+            window.scrollTo(0, 0);
+        }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            cards = Array.from(document.querySelectorAll('.article-card'));
+            sidebarItems = cards.map(card => {
+                const link = document.querySelector('.sidebar a[href="#' + card.id + '"]');
+                return link ? link.closest('li') : null;
+            });
+            cardMetrics = cards.map(readMetrics);
+            anchors = [anchorAfter(cards), anchorAfter(sidebarItems)];
+            initSearch(buildSearchIndex(), cards.length);
+        });
+    </script>
+'''.replace('__SEARCH_FUNCTIONS__', _SEARCH_SCRIPT.rstrip('\n'))
+
+_STATIC_SEARCH_PAGE_SCRIPT = _PAGE_SCRIPT.replace('''    </script>
+    </div>''', '''    </script>''' + _STATIC_SEARCH_SCRIPT + '''    </div>''', 1)
+
+def _search_block_html(search_info):
+    # Search summary block displayed on top of the HTML
+    search_block_html = ''
+    if search_info:
+        sd = search_info.get('search_date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        sk = search_info.get('search_keywords', 'N/A')
+        pt = search_info.get('paper_type', 'N/A')
+        rc = search_info.get('release_date_cutoff', None)
+        rc_text = f"last {rc} days" if rc else 'all time'
+        gt = search_info.get('grab_total_requested', search_info.get('grab_total', 'all'))
+        savep = search_info.get('save_path', '')
+
+        search_block_html = f'''\
+        <div class="search-summary" id="search-summary">\
+            <h1>Search Summary (Night mode)</h1>\
+            <div class="search-meta">\
+                <div><strong>Search time:</strong> {sd}</div>\
+                <div><strong>Query:</strong> <code class="query">{html.escape(sk)}</code></div>\
+                <div><strong>Paper type:</strong> {html.escape(str(pt))}  <strong>Time range:</strong> {html.escape(rc_text)}</div>\
+                <div><strong>Requested count:</strong> {html.escape(str(gt))}  <strong>Save path:</strong> {html.escape(str(savep))}</div>\
+            </div>\
+        </div>\
+        '''
+    return search_block_html
+
+
+def _storage_key_suffix(path):
+    # Extract unique identifier from output filename for localStorage isolation
+    storage_key_suffix = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    # Sanitize: remove special chars, limit length
+    return re.sub(r'[^a-zA-Z0-9_]', '_', storage_key_suffix)[:50]
+
+
+def _storage_script(storage_key_suffix):
+    return f'''
+    <script>
+        // Unique storage key suffix to isolate localStorage for different queries
+        const STORAGE_KEY_PREFIX = {json.dumps(storage_key_suffix)};
+        // Newest article timestamp the reader had seen before this session; articles added later are marked "NEW".
+        // The baseline is kept in sessionStorage so reloads and other pages of the same list show the same markers.
+        const VISITED_KEY = 'visited_' + STORAGE_KEY_PREFIX;
+        const LAST_VISIT = (function() {{
+            let baseline = sessionStorage.getItem(VISITED_KEY);
+            if (baseline === null) {{
+                baseline = localStorage.getItem(VISITED_KEY) || '';
+                sessionStorage.setItem(VISITED_KEY, baseline);
+            }}
+            return baseline;
+        }})();
+        function isNewSinceLastVisit(added) {{
+            return Boolean(LAST_VISIT && added && added > LAST_VISIT);
+        }}
+        function markVisited(latest) {{
+            if (latest > (localStorage.getItem(VISITED_KEY) || '')) localStorage.setItem(VISITED_KEY, latest);
+        }}
+    </script>'''
+
+
+def _article_key(index, row):
+    # Cards and reader state are keyed by PMID, so they survive reordering and regeneration; rows without one fall back to the position.
+    pmid = row.get('PMID')
+    if pmid is not None and _notna(pmid):
+        if isinstance(pmid, float) and pmid.is_integer():
+            pmid = int(pmid)
+        pmid = re.sub(r'[^\w-]', '_', str(pmid).strip())
+        if pmid:
+            return pmid
+    return f'row{index}'
+
+
+def _row_hash(row):
+    # 行内容的哈希，追加/合并时判断文章是否有变化；值统一转成字符串，同样的内容从不同格式读入时哈希相同
+    text = '\x00'.join(f'{col}\x01{value}' for col, value in sorted((str(col), value) for col, value in row.items()))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _generation_stamp():
+    return datetime.utcnow().strftime('%Y%m%d%H%M%S')
+
+
+def _manifest_path(html_path):
+    # 单页阅读列表的清单放在页面旁边：wnt_fibro_reading_list.html -> wnt_fibro_reading_list.manifest.json
+    return os.path.splitext(html_path)[0] + '.manifest.json'
+
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def _save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _keyed_rows(rows, old_articles, stamp, articles):
+    # (index, row) -> (key, row, added)；文章沿用清单中记录的加入时间，新文章用本次的时间戳，结果记录到 articles {key: [hash, added]}
+    for index, row in rows:
+        key = _article_key(index, row)
+        previous = old_articles.get(key)
+        added = previous[1] if previous else stamp
+        articles[key] = [_row_hash(row), added]
+        yield key, row, added
+
+
+@run_metrics.timed("html")
+def generate_reading_list(input_path_or_df, output_html_path, search_info=None, streaming=False, virtual=False, compress=False, search=False):
+    # Generate a night-mode HTML reading list from CSV/Excel or a DataFrame with interactive features.
+    # Optional search_info dict may contain 'search_keywords', 'paper_type', 'release_date_cutoff', 'grab_total', 'save_path', 'search_date'.
+    # The page is built in one pass over the rows and written piece by piece. With streaming=True the input file is read row by row
+    # and the article cards are spooled to a temporary file, so neither the table nor the full document is held in memory.
+    # virtual=True embeds the articles as a JSON payload (gzip+base64 with compress=True) and renders only the cards and sidebar
+    # entries near the viewport, so lists with tens of thousands of articles open instantly.
+    # search=True adds a search box over titles/abstracts, using the same query syntax and term matching as the highlighting
+    # (a term matches words starting with it), plus IF / quartile / starred / read filters. On virtual pages the inverted index
+    # is built here and embedded next to the payload; static pages build it in the browser from the cards when the page opens.
+    if streaming:
+        rows = _iter_input_rows(input_path_or_df)
+        if rows is None:
+            return
+        first = next(rows, None)
+        sample_title = str(first[1].get('Title', first[1].get('TI', ''))) if first else ''
+        rows = _chain_first(first, rows)
+    else:
+        df = _read_input(input_path_or_df)
+        if df is None:
+            return
+        sample_title = _first_title(df)
+        rows = _iter_df_rows(df)
+
+    pattern = _pattern_for(search_info, sample_title)
+    highlighter = _make_highlighter(pattern)
+
+    search_block_html = _search_block_html(search_info)
+    storage_key_suffix = _storage_key_suffix(output_html_path)
+
+    # 阅读状态按 PMID 保存，重新生成不会清除；清单记录每篇文章的内容哈希和首次加入的时间，用于标记新文章和之后的追加
+    manifest_path = _manifest_path(output_html_path)
+    old_articles = _load_manifest(manifest_path).get('articles', {})
+    articles = {}
+    rows = _keyed_rows(rows, old_articles, _generation_stamp(), articles)
+
     out_dir = os.path.dirname(output_html_path) or '.'
     os.makedirs(out_dir, exist_ok=True)
+    if virtual:
+        _write_virtual_page(output_html_path, rows, highlighter, pattern, search_block_html, storage_key_suffix, compress, search)
+    else:
+        _write_static_page(output_html_path, rows, highlighter, pattern, search_block_html, storage_key_suffix, streaming, search)
+    _save_manifest(manifest_path, {'virtual': virtual, 'articles': articles})
+    run_metrics.add("html", calls=0, records=len(articles))
+
+    print(f"Conversion complete: {output_html_path}")
+
+
+def _write_static_page(output_html_path, rows, highlighter, pattern, search_block_html, storage_key_suffix, streaming=False, search=False):
+    # rows: (key, row, added)
+    # search=True 时加上搜索框，索引由页面脚本从卡片建立，所以之后用 append_to_reading_list 追加的文章也能搜到
+    # 侧边栏在文章之前输出，但每行只生成一次：侧边栏链接收集到列表（很小），文章卡片收集到列表或临时文件
+    sidebar_parts = []
+    articles = tempfile.TemporaryFile('w+', encoding='utf-8') if streaming else []
+    add_article = articles.write if streaming else articles.append
+    try:
+        for key, row, added in rows:
+            sidebar_parts.append(_sidebar_link_html(key, row))
+            add_article(_article_card_html(key, row, highlighter, pattern, added))
+
+        with open(output_html_path, 'w', encoding='utf-8') as f:
+            f.write(_SEARCH_PAGE_HEAD if search else _PAGE_HEAD)
+            f.writelines(sidebar_parts)
+            f.write(f'''
+            {_SIDEBAR_END_MARKER}
+        </ul>
+    </div>
+    <div class="container">
+    {search_block_html}
+    {_SEARCH_PANEL_HTML if search else ''}
+    ''')
+            if streaming:
+                articles.seek(0)
+                shutil.copyfileobj(articles, f)
+            else:
+                f.writelines(articles)
+            f.write(f'''
+    {_ARTICLES_END_MARKER}
+    ''')
+            # 添加交互式JavaScript
+            f.write(_storage_script(storage_key_suffix))
+            f.write(_STATIC_SEARCH_PAGE_SCRIPT if search else _PAGE_SCRIPT)
+    finally:
+        if streaming:
+            articles.close()
+
+
+def _write_virtual_page(output_html_path, rows, highlighter, pattern, search_block_html, storage_key_suffix, compress, search=False):
+    # 文章数据以 JSON 嵌入页面，由脚本只渲染可见部分；侧边栏也由脚本生成，所以只需一遍、不需要缓存任何行
+    # search=True 时同时建立标题/摘要的倒排索引，嵌入在文章数据之后
+    encoding = 'gzip-base64' if compress else 'json'
+    index = _SearchIndexBuilder() if search else None
     with open(output_html_path, 'w', encoding='utf-8') as f:
+        f.write(_VIRTUAL_PAGE_HEAD)
+        f.write(f'''
+        </ul>
+        <div class="sidebar-virtual" id="sidebar-virtual"><ul id="sidebar-window"></ul></div>
+    </div>
+    <div class="container">
+    {search_block_html}
+    {_SEARCH_PANEL_HTML if search else ''}
+    <div id="article-list"></div>
+    <div id="loading-status" class="loading-status">Loading articles...</div>
+    </div>
+    <script type="application/json" id="articles-data" data-encoding="{encoding}">''')
+
+        def payload():
+            for position, (key, row, added) in enumerate(rows):
+                if index is not None:
+                    index.add(position, row)
+                yield _article_payload(key, row, highlighter, pattern, added)
+        _write_script_json(f, _payload_parts(payload()), compress)
+        f.write('</script>')
+        if index is not None:
+            f.write(f'''
+    <script type="application/json" id="articles-index" data-encoding="{encoding}">''')
+            _write_script_json(f, index.parts(), compress)
+            f.write('</script>')
+        f.write(_storage_script(storage_key_suffix))
+        f.write(_VIRTUAL_PAGE_SCRIPT)
+
+
+def _payload_parts(articles):
+    # {"fields": [...], "articles": [[...], ...]}，逐条生成
+    yield '{"fields":' + json.dumps(_PAYLOAD_FIELDS) + ',"articles":['
+    for i, article in enumerate(articles):
+        text = json.dumps(article, ensure_ascii=False, separators=(',', ':'))
+        yield ',' + text if i else text
+    yield ']}'
+
+
+def _write_script_json(f, parts, compress):
+    # 把 JSON 片段写进 <script> 标签；compress 时写 gzip 后的 base64
+    if not compress:
+        # "</" 会提前结束 <script>，JSON 中写成等价的 "<\/"
+        for part in parts:
+            f.write(part.replace('</', '<\\/'))
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip 格式，浏览器用 DecompressionStream('gzip') 解压
+    pending = b''
+    for part in parts:
+        pending += compressor.compress(part.encode('utf-8'))
+        # base64 每 3 字节编码成 4 个字符，按 3 的倍数切分可以分段编码
+        cut = len(pending) // 3 * 3
+        if cut >= 1 << 16:
+            f.write(base64.b64encode(pending[:cut]).decode('ascii'))
+            pending = pending[cut:]
+    pending += compressor.flush()
+    f.write(base64.b64encode(pending).decode('ascii'))
+
+
+def _chain_first(first, rows):
+    # Put a peeked row back in front of the row iterator.
+    if first is not None:
+        yield first
+    yield from rows
+
+
+_SHARD_MANIFEST = 'manifest.json'
+_SHARD_GROUP_LABELS = {None: 'All articles', 'journal': 'Journal', 'date': 'Month', 'if': 'Impact factor'}
+# IF 分组的下界（从高到低），低于最后一个下界或没有 IF 的归入 'N/A'
+_IF_BUCKETS = [(20, 'IF ≥ 20'), (10, 'IF 10–20'), (5, 'IF 5–10'), (3, 'IF 3–5'), (1, 'IF 1–3'), (0, 'IF < 1')]
+
+
+def _shard_group(row, group_by):
+    # Group label and sort key of one article for the sharded output.
+    if group_by == 'journal':
+        journal = row.get('Journal', row.get('TA', ''))
+        label = str(journal).strip() if _notna(journal) and str(journal).strip() else 'Unknown'
+        return label, (label.lower(),)
+    if group_by == 'date':
+        digits = re.sub(r'\D', '', str(row.get('publish_date', row.get('LR', ''))))
+        if len(digits) >= 6:
+            label = f"{digits[:4]}-{digits[4:6]}"
+            # 新的月份排在前面
+            return label, (-int(digits[:6]),)
+        return 'Unknown', (1,)
+    if group_by == 'if':
+        try:
+            impact_factor = float(row.get('IF', ''))
+        except (TypeError, ValueError):
+            impact_factor = float('nan')
+        for rank, (lower, label) in enumerate(_IF_BUCKETS):
+            if impact_factor >= lower:
+                return label, (rank,)
+        return 'N/A', (len(_IF_BUCKETS),)
+    return _SHARD_GROUP_LABELS[None], (0,)
+
+
+@run_metrics.timed("html")
+def generate_sharded_reading_list(input_path_or_df, output_dir, search_info=None, shard_size=1000, group_by=None, virtual=False, compress=False,
+                                  search=False):
+    # Split a large reading list into page files of at most shard_size articles plus a small index.html for navigation.
+    # group_by: None (input order), 'journal', 'date' (publication month) or 'if' (IF bucket); each group gets its own pages.
+    # All pages share one STORAGE_KEY_PREFIX (from the directory name), so star/read state is shared across pages and kept when the
+    # set is regenerated; articles added since the previous run are marked as new. Each page's content hash is recorded in manifest.json; pages whose content did not
+    # change are not rewritten, and pages that no longer exist are removed. Returns the path of index.html.
+    # search=True adds the search box of generate_reading_list to every page; each page searches its own articles.
+    if group_by not in _SHARD_GROUP_LABELS:
+        raise ValueError(f"group_by must be one of {list(_SHARD_GROUP_LABELS)}")
+    df = _read_input(input_path_or_df)
+    if df is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, _SHARD_MANIFEST)
+    manifest = _load_manifest(manifest_path)
+    old_hashes = {shard['file']: shard['hash'] for shard in manifest.get('shards', [])}
+    storage_key_suffix = _storage_key_suffix(output_dir)
+    articles = {}
+    keyed_rows = _keyed_rows(_iter_df_rows(df), manifest.get('articles', {}), _generation_stamp(), articles)
+
+    pattern = _pattern_for(search_info, _first_title(df))
+    search_block_html = _search_block_html(search_info)
+
+    # 分组（组内保持输入顺序），再按 shard_size 切分成页
+    groups = {}
+    for article in keyed_rows:
+        label, key = _shard_group(article[1], group_by)
+        groups.setdefault((key, label), []).append(article)
+    shards = []
+    used_names = set()
+    for key, label in sorted(groups):
+        rows = groups[(key, label)]
+        slug = re.sub(r'[^a-z0-9]+', '-', label.lower()).strip('-') or 'group'
+        name = slug
+        suffix = 2
+        while name in used_names:
+            name = f"{slug}-{suffix}"
+            suffix += 1
+        used_names.add(name)
+        pages = range(0, len(rows), shard_size)
+        for page, start in enumerate(pages, start=1):
+            shards.append({'file': f"{name}-{page:03d}.html", 'group': label, 'page': page, 'pages': len(pages),
+                           'rows': rows[start:start + shard_size]})
+
+    # 高亮颜色按词固定，同样的内容总是生成同样的页面
+    highlighter = _make_highlighter(pattern)
+    written = 0
+    for position, shard in enumerate(shards):
+        prev_file = shards[position - 1]['file'] if position > 0 else None
+        next_file = shards[position + 1]['file'] if position + 1 < len(shards) else None
+        nav_html = _shard_nav_html(shard, prev_file, next_file, group_by)
+        content_hash = _shard_hash(shard['rows'], [nav_html, search_block_html, pattern, storage_key_suffix, virtual, compress, search])
+        shard_path = os.path.join(output_dir, shard['file'])
+        if old_hashes.get(shard['file']) != content_hash or not os.path.exists(shard_path):
+            rows = iter(shard['rows'])
+            if virtual:
+                _write_virtual_page(shard_path, rows, highlighter, pattern, nav_html + search_block_html, storage_key_suffix, compress, search)
+            else:
+                _write_static_page(shard_path, rows, highlighter, pattern, nav_html + search_block_html, storage_key_suffix, search=search)
+            written += 1
+        shard['hash'] = content_hash
+
+    current = {shard['file'] for shard in shards}
+    for stale in set(old_hashes) - current:
+        stale_path = os.path.join(output_dir, stale)
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    index_path = os.path.join(output_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(_shard_index_html(shards, group_by, search_block_html, storage_key_suffix, len(df)))
+
+    _save_manifest(manifest_path, {
+        'storage_key_prefix': storage_key_suffix,
+        'group_by': group_by,
+        'shard_size': shard_size,
+        'shards': [{'file': shard['file'], 'group': shard['group'], 'count': len(shard['rows']), 'hash': shard['hash']} for shard in shards],
+        'articles': articles,
+    })
+    run_metrics.add("html", calls=0, records=len(articles))
+
+    print(f"Sharded reading list: {len(shards)} pages ({written} rewritten), index: {index_path}")
+    return index_path
+
+
+def _shard_hash(rows, settings):
+    digest = hashlib.sha256(json.dumps(settings, default=str).encode('utf-8'))
+    for key, row, added in rows:
+        digest.update(json.dumps([key, row, added], default=str, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _shard_nav_html(shard, prev_file, next_file, group_by):
+    links = ['<a href="index.html">☰ All pages</a>']
+    if prev_file:
+        links.append(f'<a href="{html.escape(prev_file)}">← Prev</a>')
+    if next_file:
+        links.append(f'<a href="{html.escape(next_file)}">Next →</a>')
+    where = f"{html.escape(_SHARD_GROUP_LABELS[group_by])}: {html.escape(shard['group'])}, " if group_by else ''
+    return f'''
+        <div class="search-summary shard-nav" style="display:flex; gap:18px; align-items:center; flex-wrap:wrap;">
+            <span style="color:var(--muted)">{where}page {shard['page']} of {shard['pages']} ({len(shard['rows'])} articles)</span>
+            {' '.join(links)}
+        </div>
+        '''
+
+
+def _shard_index_html(shards, group_by, search_block_html, storage_key_suffix, total):
+    rows_html = []
+    for group in dict.fromkeys(shard['group'] for shard in shards):
+        pages = [shard for shard in shards if shard['group'] == group]
+        count = sum(len(shard['rows']) for shard in pages)
+        links = ' '.join(f'<a href="{html.escape(shard["file"])}">{shard["page"]}</a>' for shard in pages)
+        rows_html.append(f'            <tr><td>{html.escape(group)}</td><td class="num">{count}</td><td>{links}</td></tr>\n')
+    group_label = html.escape(_SHARD_GROUP_LABELS[group_by])
+    return f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Reading List Index (Night mode)</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        :root {{ --text:#e6eef8; --muted:#98a2b3; --accent:#66d9ef; --border:rgba(255,255,255,0.06); }}
+        html,body {{ background: linear-gradient(180deg,#051021 0%,#071827 100%); color:var(--text); font-family: -apple-system,BlinkMacSystemFont,"Segoe UI",Roboto,"Helvetica Neue",Arial,sans-serif; margin:0; }}
+        .container {{ max-width:1000px; margin:24px auto; padding:18px }}
+        .search-summary {{ border:1px solid var(--border); padding:20px; border-radius:12px; margin-bottom:20px; }}
+        .search-summary h1 {{ margin:0 0 8px 0; color:var(--accent); font-size:1.6em }}
+        .search-meta div {{ margin:6px 0; color:var(--muted) }}
+        .query {{ background: rgba(255,255,255,0.03); padding:6px 8px; border-radius:6px; font-family:monospace }}
+        table {{ width:100%; border-collapse:collapse; }}
+        th, td {{ text-align:left; padding:8px; border-bottom:1px solid var(--border); }}
+        th {{ color:var(--muted); font-weight:600; }}
+        td.num {{ text-align:right; }}
+        a {{ color:var(--accent); margin-right:8px; }}
+        .state {{ color:var(--muted); margin-bottom:16px; }}
+    </style>
+</head>
+<body>
+<div class="container">
+{search_block_html}
+    <div class="state">{total} articles in {len(shards)} pages · <span id="state-counts"></span></div>
+    <table>
+        <tr><th>{group_label}</th><th class="num">Articles</th><th>Pages</th></tr>
+{''.join(rows_html)}    </table>
+</div>
+<script>
+    // 所有分页共用同一个 STORAGE_KEY_PREFIX，这里汇总星标/已读数量
+    const STORAGE_KEY_PREFIX = {json.dumps(storage_key_suffix)};
+    const starred = JSON.parse(localStorage.getItem('starred_' + STORAGE_KEY_PREFIX) || '[]');
+    const read = JSON.parse(localStorage.getItem('read_' + STORAGE_KEY_PREFIX) || '[]');
+    document.getElementById('state-counts').textContent = '⭐ ' + starred.length + ' starred · ✓ ' + read.length + ' read';
+</script>
+</body>
+</html>
+'''
+
+
+@run_metrics.timed("html")
+def append_to_reading_list(input_path_or_df, html_path, search_info=None):
+    # Merge articles into an existing static reading list in place, without rebuilding it; the page's localStorage state is kept.
+    # Articles are matched by PMID against the page's manifest: new ones are appended (and shown as "NEW" to returning readers),
+    # ones whose content hash changed are re-rendered where they are, and unchanged ones are skipped.
+    # Returns False (and leaves the file untouched) when html_path does not exist or was generated without the insertion markers.
+    df = _read_input(input_path_or_df)
+    if df is None:
+        return False
+    if not os.path.exists(html_path):
+        return False
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    if _SIDEBAR_END_MARKER not in html_content or _ARTICLES_END_MARKER not in html_content:
+        print(f"{html_path} has no insertion markers, regenerate it with generate_reading_list")
+        return False
+
+    manifest_path = _manifest_path(html_path)
+    articles = _load_manifest(manifest_path).get('articles', {})
+    # 没有清单的旧页面：页面中已有的文章视为未变化
+    for key in re.findall(r'<div class="article-card" id="article-([^"]+)"', html_content):
+        articles.setdefault(key, [None, ''])
+    # 没有 PMID 的行按位置编号，接在已有的编号之后
+    positions = [int(key[3:]) for key in articles if key.startswith('row') and key[3:].isdigit()]
+    start = max(positions) + 1 if positions else 0
+
+    pattern = _pattern_for(search_info, _first_title(df))
+    highlighter = _make_highlighter(pattern)
+    stamp = _generation_stamp()
+    sidebar_parts = []
+    article_parts = []
+    updated = 0
+    for offset, (_, row) in enumerate(_iter_df_rows(df)):
+        key = _article_key(start + offset, row)
+        row_hash = _row_hash(row)
+        previous = articles.get(key)
+        if previous is None:
+            sidebar_parts.append(_sidebar_link_html(key, row))
+            article_parts.append(_article_card_html(key, row, highlighter, pattern, stamp))
+            articles[key] = [row_hash, stamp]
+        elif previous[0] is not None and previous[0] != row_hash:
+            html_content = _replace_article(html_content, key, row, highlighter, pattern, previous[1])
+            articles[key] = [row_hash, previous[1]]
+            updated += 1
+
+    if not article_parts and not updated:
+        print(f"No new or changed articles: {html_path}")
+        return True
+    html_content = html_content.replace(_SIDEBAR_END_MARKER, ''.join(sidebar_parts).lstrip() + '            ' + _SIDEBAR_END_MARKER, 1)
+    html_content = html_content.replace(_ARTICLES_END_MARKER, ''.join(article_parts) + '\n    ' + _ARTICLES_END_MARKER, 1)
+    with open(html_path, 'w', encoding='utf-8') as f:
         f.write(html_content)
+    _save_manifest(manifest_path, {'virtual': False, 'articles': articles})
+    run_metrics.add("html", calls=0, records=len(article_parts) + updated)
 
-    print(f"Conversion complete: {output_html_path}")
+    print(f"Appended {len(article_parts)} new and updated {updated} changed articles: {html_path}")
+    return True
+
+
+def _replace_article(html_content, key, row, highlighter, pattern, added):
+    # 替换页面中一篇文章的卡片和侧边栏链接；卡片以 8 个空格缩进的 </div> 结束（内部元素缩进更深，文本已转义）
+    card_start = html_content.find(f'<div class="article-card" id="article-{key}"')
+    if card_start < 0:
+        return html_content
+    card_end = html_content.index('\n        </div>', card_start) + len('\n        </div>')
+    card = _article_card_html(key, row, highlighter, pattern, added).strip()
+    html_content = html_content[:card_start] + card + html_content[card_end:]
+    link = re.compile(r'^ *<li><a href="#article-' + re.escape(key) + r'".*\n', re.M)
+    return link.sub(lambda m: _sidebar_link_html(key, row), html_content, count=1)
 
 
 if __name__ == "__main__":
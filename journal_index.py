@@ -0,0 +1,285 @@
+'''
+期刊指标索引：把 JCR_CSA_2025.xlsx 编译成一个 pickle 文件，供 pubmed_utils 查询 IF 和分区
+匹配顺序：ISSN/eISSN 精确匹配 -> MedAbbr 精确匹配 -> 规范化名称 + 字符三元组（trigram）索引的模糊匹配
+解析 xlsx 需要数秒，编译后的索引加载只需几十毫秒
+索引文件放在源文件旁边（JCR_CSA_2025.xlsx -> JCR_CSA_2025.journal_index.pkl），源文件的大小/修改时间变化时按内容哈希判断是否需要重新编译
+每个进程最多加载一次，多个工作进程共用同一个索引文件
+numpy / pandas 在构建或查询索引时才导入（加载 pickle 时由 pickle 自动导入）
+'''
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+
+# 默认的 JCR/CAS 表：与本模块在同一目录
+DEFAULT_JCR_CSA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JCR_CSA_2025.xlsx')
+
+# 索引内容或格式变化时加 1，使旧的索引文件失效
+_INDEX_VERSION = 2
+
+# 进程内缓存 {源文件绝对路径: (源文件签名, JournalIndex)}
+_loaded = {}
+_lock = threading.Lock()
+
+
+def index_path(jcr_csa_path):
+    return os.path.splitext(jcr_csa_path)[0] + '.journal_index.pkl'
+
+
+def load_journal_index(jcr_csa_path=None):
+    '''
+    返回 JournalIndex
+    依次使用：进程内缓存 -> 编译好的索引文件 -> 重新解析 xlsx（并写出索引文件）
+    '''
+    source = os.path.abspath(jcr_csa_path or DEFAULT_JCR_CSA_PATH)
+    signature = _file_signature(source)
+    with _lock:
+        cached = _loaded.get(source)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        index = _load_compiled(source, signature)
+        if index is None:
+            index = _compile(source, signature)
+        _loaded[source] = (signature, index)
+        return index
+
+
+def clear_cache():
+    '''
+    清空进程内缓存（索引文件保留）
+    '''
+    with _lock:
+        _loaded.clear()
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_compiled(source, signature):
+    # 索引文件不存在、损坏或过期时返回 None
+    try:
+        with open(index_path(source), 'rb') as f:
+            compiled = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(compiled, dict) or compiled.get('version') != _INDEX_VERSION:
+        return None
+    if compiled.get('signature') != signature:
+        # 大小/修改时间变了（例如重新 checkout），内容相同时不必重新解析，只更新签名
+        if compiled.get('sha256') != _file_hash(source):
+            return None
+        compiled['signature'] = signature
+        _save_compiled(source, compiled)
+    return compiled['index']
+
+
+def _compile(source, signature):
+    index = JournalIndex(_read_journal_table(source))
+    _save_compiled(source, {
+        'version': _INDEX_VERSION,
+        'signature': signature,
+        'sha256': _file_hash(source),
+        'index': index,
+    })
+    return index
+
+
+def _save_compiled(source, compiled):
+    # 写到同目录的临时文件再替换，其它进程不会读到写了一半的索引；目录不可写时只保留进程内缓存
+    path = index_path(source)
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_journal_table(source):
+    # 加载JCR_CSA数据（指定字段类型防止自动转换）
+    import pandas as pd
+    dtype_spec = {
+        'JournalTitle': 'string',
+        'MedAbbr': 'string',
+        'CAS_Quartile': 'string',
+        'JIF_Quartile': 'string',
+        'JIF_2024': 'string',
+        'ISSN': 'string',
+        'eISSN': 'string'
+    }
+    return pd.read_excel(source, dtype=dtype_spec)
+
+
+# 规范化名称时忽略的词，NLM 期刊缩写通常省略它们（Journal of Biological Chemistry -> J Biol Chem）
+_STOP_WORDS = frozenset(['a', 'an', 'and', 'de', 'for', 'in', 'of', 'on', 'the'])
+# 模糊匹配的最低相似度（trigram Dice 系数）
+_FUZZY_THRESHOLD = 0.8
+# 每次模糊查询最多精细比较的候选数
+_FUZZY_CANDIDATES = 10
+_ISSN_PATTERN = re.compile(r'\d{4}-\d{3}[\dX]')
+
+
+def parse_issns(text):
+    '''
+    从 MEDLINE IS 字段（如 "2041-1723 (Electronic) 2041-1723 (Linking)"）或 ISSN 列中提取 ISSN 列表
+    '''
+    if not isinstance(text, str):
+        return []
+    return _ISSN_PATTERN.findall(text.upper())
+
+
+def normalize_journal(name):
+    '''
+    小写、去掉标点和常见虚词，返回以空格分隔的词
+    '''
+    if not isinstance(name, str):
+        return ''
+    tokens = re.sub(r'[^0-9a-z]+', ' ', name.lower().replace('&', ' and ')).split()
+    return ' '.join(token for token in tokens if token not in _STOP_WORDS)
+
+
+def _trigrams(text):
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class JournalIndex():
+    '''
+    期刊指标的多键索引，行号对应 table 中的行
+
+    Attributes:
+    -----------
+    table : DataFrame
+        JIF_2024, JIF_Quartile, CAS_Quartile 三列，按行号访问
+    '''
+    TIERS = ('issn', 'med_abbr', 'fuzzy')
+
+    def __init__(self, jcr_csa_df):
+        import numpy as np
+        import pandas as pd
+        jcr_csa_df = jcr_csa_df.reset_index(drop=True)
+        self.table = jcr_csa_df[['JIF_2024', 'JIF_Quartile', 'CAS_Quartile']]
+
+        # 键重复时保留最后一条
+        self._issn = {}
+        for column in ('ISSN', 'eISSN'):
+            for position, value in jcr_csa_df[column].items():
+                for issn in parse_issns(value):
+                    self._issn[issn] = position
+        self._abbr = {str(value).strip().upper(): position for position, value in jcr_csa_df['MedAbbr'].items() if pd.notna(value)}
+
+        # 模糊匹配：规范化后的刊名和 MedAbbr 都作为候选，MedAbbr 优先
+        names = {}
+        for column in ('JournalTitle', 'MedAbbr'):
+            for position, value in jcr_csa_df[column].items():
+                name = normalize_journal(value)
+                if name:
+                    names[name] = position
+        self._names = names
+        self._entries = list(names)
+        self._entry_positions = np.fromiter(names.values(), dtype=np.int64, count=len(names))
+
+        # trigram 倒排索引，以 CSR 形式保存：trigram -> postings[offsets[k]:offsets[k + 1]]
+        postings = {}
+        gram_counts = np.empty(len(self._entries), dtype=np.int32)
+        for entry, name in enumerate(self._entries):
+            grams = _trigrams(name)
+            gram_counts[entry] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(entry)
+        self._gram_ids = {gram: k for k, gram in enumerate(postings)}
+        self._offsets = np.cumsum([0] + [len(entries) for entries in postings.values()], dtype=np.int64)
+        self._postings = np.fromiter((entry for entries in postings.values() for entry in entries), dtype=np.int32, count=int(self._offsets[-1]))
+        self._gram_counts = gram_counts
+
+    def match(self, journal, issns=None):
+        '''
+        返回 (行号, 匹配层级)，层级为 'issn'、'med_abbr'、'fuzzy'，未匹配时为 (-1, None)
+        issns 可以是 ISSN 列表或 IS 字段原文
+        '''
+        if isinstance(issns, str) or issns is None:
+            issns = parse_issns(issns)
+        for issn in issns:
+            position = self._issn.get(issn.upper())
+            if position is not None:
+                return position, 'issn'
+        if isinstance(journal, str) and journal.strip():
+            position = self._abbr.get(journal.strip().upper())
+            if position is not None:
+                return position, 'med_abbr'
+            position = self._fuzzy(journal)
+            if position >= 0:
+                return position, 'fuzzy'
+        return -1, None
+
+    def match_many(self, journals, issns=None):
+        '''
+        批量匹配，相同的 (期刊名, ISSN) 只查一次；journals 与 issns 按位置一一对应，不使用它们的索引
+        返回 (行号数组, 层级数组)，未匹配处分别为 -1 和 None
+        '''
+        import numpy as np
+        import pandas as pd
+        # 按位置对齐：传入的 Series 可能带有筛选、拼接或排序后的索引
+        journals = pd.Series(list(journals), dtype=object)
+        issns = pd.Series(list(issns) if issns is not None else pd.NA, index=journals.index, dtype=object)
+        keys = journals.astype('string').fillna('') + '\x00' + issns.astype('string').fillna('')
+        codes, uniques = pd.factorize(keys)
+        results = [self.match(*key.split('\x00', 1)) for key in uniques]
+        positions = np.array([position for position, _ in results] + [-1], dtype=np.int64)[codes]
+        tiers = np.array([tier for _, tier in results] + [None], dtype=object)[codes]
+        return positions, tiers
+
+    def _fuzzy(self, journal):
+        import numpy as np
+        name = normalize_journal(journal)
+        if not name:
+            return -1
+        position = self._names.get(name)
+        if position is not None:
+            return position
+
+        query_grams = _trigrams(name)
+        gram_ids = [self._gram_ids[gram] for gram in query_grams if gram in self._gram_ids]
+        if not gram_ids:
+            return -1
+        hits = np.bincount(np.concatenate([self._postings[self._offsets[k]:self._offsets[k + 1]] for k in gram_ids]),
+                           minlength=len(self._entries))
+        # 至少共享一半 trigram 的条目才可能达到阈值或是缩写，先筛掉其余条目
+        candidates = np.flatnonzero(hits >= max(1, len(query_grams) // 2))
+        candidates = candidates[np.argsort(-hits[candidates], kind='stable')[:_FUZZY_CANDIDATES]]
+
+        tokens = name.split()
+        best, best_score = -1, 0.0
+        for entry in candidates:
+            full_tokens = self._entries[entry].split()
+            # 只接受词数相同的候选，避免 "journal biological chemistry" 匹配到 "world journal biological chemistry"
+            if len(full_tokens) != len(tokens):
+                continue
+            score = 2.0 * hits[entry] / (len(query_grams) + self._gram_counts[entry])
+            # NLM 缩写：每个词都是候选刊名对应词的前缀（Biomed Digit Libr -> biomedical digital libraries）
+            if score < 1.0 and len(tokens) > 1 and _is_abbreviation(tokens, full_tokens):
+                score = 1.0
+            if score >= _FUZZY_THRESHOLD and score > best_score:
+                best, best_score = entry, score
+        return int(self._entry_positions[best]) if best >= 0 else -1
+
+
+def _is_abbreviation(tokens, full_tokens):
+    return all(full.startswith(token) for token, full in zip(tokens, full_tokens))
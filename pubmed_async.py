@@ -0,0 +1,304 @@
+'''
+PubMed E-utilities 的 asyncio 客户端（ESearch / EPost / EFetch / ESummary），用于异步 web 服务等已经运行事件循环的场景
+多个并发检索共用一个事件循环、一个 HTTP 连接池和一个协程限速器，等待网络时不占用线程
+需要 aiohttp（可选依赖）：pip install aiohttp
+MEDLINE 解析、自适应批大小和输出字段与 pubmed_utils 相同，解析出的记录可以直接交给 pubmed_utils.enrich_records
+
+pubmed_utils 的同步接口（get_main_info_into_excel 等）仍然基于线程池：它主要在 Jupyter 中使用，
+而 Jupyter 本身已经在运行事件循环，同步包装 asyncio.run 在其中无法调用
+
+Usage:
+    async with AsyncPubmedClient(api_key) as client:
+        async for record in client.iter_records("wnt5a AND fibrosis", release_date_cutoff=30):
+            ...
+'''
+import asyncio
+import json
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+
+import pubmed_utils as _pubmed_utils
+from pubmed_utils import MEDLINE_FIELDS, _HISTORY_CAP, _RETRY_STATUS, _BatchFill, _BatchSizer, _iter_medline_records, _plan_batches, _retry_delay
+
+
+def _require_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("异步客户端需要 aiohttp: pip install aiohttp")
+    return aiohttp
+
+
+class AsyncTokenBucket():
+    '''
+    协程版令牌桶限速器，同一个事件循环中的所有请求共享
+    NCBI 限制: 无 api_key 时 3 次/秒，有 api_key 时 10 次/秒
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # pause() 的次数，等待中的调用者据此判断自己的预约是否作废
+        self._pauses = 0
+
+    @classmethod
+    def for_api_key(cls, api_key):
+        return cls(10 if api_key else 3)
+
+    def pause(self, seconds):
+        # 收到 429 时所有共享这个桶的请求一起暂停（同 pubmed_utils._TokenBucket）：
+        # 暂停期间不积累令牌，已经在等待的调用者在暂停结束后重新排队
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+        self._pauses += 1
+
+    async def acquire(self):
+        # 按调用顺序预约令牌：令牌不足时记为欠账，调用者等待到轮到自己为止
+        # 事件循环是单线程的，await 之前的读写不会被打断，不需要锁
+        while True:
+            pauses = self._pauses
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            if self._tokens >= 0:
+                return
+            await asyncio.sleep(-self._tokens / self.rate)
+            if self._pauses == pauses:
+                return
+
+
+class AsyncPubmedClient():
+    '''
+    Parameters:
+    -----------
+    api_key : str, optional
+        NCBI eUtils API key，默认为None
+    session : aiohttp.ClientSession, optional
+        默认为None（第一次请求时创建，close 时关闭）；传入的会话由调用者负责关闭
+    rate_limiter : AsyncTokenBucket, optional
+        默认为None（按 api_key 创建）；多个客户端共用一个限速器时总速率不超过 NCBI 的限制
+    max_concurrency : int, optional
+        每次 iter_records 同时进行的 EFetch 请求数，默认为None（有 api_key 时 8 个，否则 3 个）
+    timeout : float
+        单次请求的读超时（秒），默认为120
+    max_retries : int
+        遇到 429、服务器错误、超时或连接错误时最多重试的次数，默认为5（同 pubmed_utils）
+    '''
+    def __init__(self, api_key=None, session=None, rate_limiter=None, max_concurrency=None, timeout=120, max_retries=5):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or AsyncTokenBucket.for_api_key(api_key)
+        self.max_concurrency = max_concurrency or (8 if api_key else 3)
+        self.timeout = timeout
+        self._session = session
+        self._owns_session = session is None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            aiohttp = _require_aiohttp()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32),
+                timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=self.timeout))
+        return self._session
+
+    async def _request(self, endpoint, params, method="GET", retry_errors=True):
+        # 返回响应文本；429 和服务器错误按指数退避重试，429 优先按 Retry-After 等待，并让共享限速器的所有请求一起暂停；
+        # retry_errors 为 True 时超时和连接错误同样重试
+        # 重试用尽或其它 HTTP 错误时抛出 aiohttp.ClientResponseError
+        aiohttp = _require_aiohttp()
+        params = {"db": "pubmed", **{key: str(value) for key, value in params.items() if value is not None}}
+        if self.api_key:
+            params["api_key"] = self.api_key
+        url = _pubmed_utils.EUTILS_BASE_URL + endpoint
+        session = self._get_session()
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            try:
+                request = session.post(url, data=params) if method == "POST" else session.get(url, params=params)
+                async with request as response:
+                    if response.status not in _RETRY_STATUS or attempt >= self.max_retries:
+                        response.raise_for_status()
+                        # NCBI 的 MEDLINE 文本是 UTF-8
+                        return await response.text(encoding="utf-8")
+                    delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                    status = response.status
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError):
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                delay = _retry_delay(attempt)
+                status = None
+            attempt += 1
+            if status == 429:
+                # 下一次 acquire 等到暂停结束
+                self.rate_limiter.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    async def esearch(self, term, release_date_cutoff=None, retstart=0, retmax=0, usehistory=True, extra_params=None):
+        '''
+        ESearch，返回 {'count': 总数, 'ids': PMID 列表, 'webenv': ..., 'query_key': ...}
+        usehistory 为 False 时 webenv/query_key 为 None
+        '''
+        params = dict(extra_params or {})
+        params.update({"term": term, "retstart": retstart, "retmax": retmax, "reldate": release_date_cutoff or None,
+                       "usehistory": "y" if usehistory else None})
+        root = ET.fromstring(await self._request("esearch.fcgi", params))
+        webenv, query_key = root.find("WebEnv"), root.find("QueryKey")
+        return {
+            "count": int(root.find("Count").text),
+            "ids": [id_node.text for id_node in root.iter("Id")],
+            "webenv": webenv.text if webenv is not None else None,
+            "query_key": query_key.text if query_key is not None else None,
+        }
+
+    async def esearch_ids(self, term, release_date_cutoff=None, limit=None, extra_params=None):
+        '''
+        返回 PMID 列表（字符串），最多取 limit 个
+        ESearch 只能翻到前 _HISTORY_CAP 条：结果更多时只返回前 _HISTORY_CAP 条并给出警告（同 iter_records；
+        按日期切片获取全部 PMID 见 pubmed_utils 的同步接口）
+        '''
+        pmids = []
+        count = 0
+        cap = _HISTORY_CAP if limit is None else min(limit, _HISTORY_CAP)
+        while len(pmids) < cap:
+            retmax = cap - len(pmids)
+            result = await self.esearch(term, release_date_cutoff, len(pmids), retmax, usehistory=False, extra_params=extra_params)
+            count = result["count"]
+            pmids.extend(result["ids"])
+            if len(result["ids"]) < retmax or len(pmids) >= count:
+                break
+        if len(pmids) == _HISTORY_CAP and count > _HISTORY_CAP:
+            print(f"Warning: {count} results, only the first {_HISTORY_CAP} can be fetched from one search")
+        return pmids
+
+    async def epost(self, pmids):
+        '''
+        EPost 上传 PMID 列表到 history server，返回 (WebEnv, query_key)
+        '''
+        root = ET.fromstring(await self._request("epost.fcgi", {"id": ",".join(str(pmid) for pmid in pmids)}, method="POST"))
+        return root.find("WebEnv").text, root.find("QueryKey").text
+
+    async def esummary(self, pmids=None, webenv=None, query_key=None, retstart=0, retmax=500):
+        '''
+        ESummary（JSON），按给定的 PMID 列表或 WebEnv/query_key 返回文档摘要字典的列表
+        '''
+        if pmids is not None:
+            params = {"id": ",".join(str(pmid) for pmid in pmids)}
+            method = "POST"
+        else:
+            params = {"webenv": webenv, "query_key": query_key, "retstart": retstart, "retmax": retmax}
+            method = "GET"
+        params["retmode"] = "json"
+        result = json.loads(await self._request("esummary.fcgi", params, method=method)).get("result", {})
+        return [result[uid] for uid in result.get("uids", []) if uid in result]
+
+    async def efetch(self, webenv, query_key, retstart, retmax, fields=MEDLINE_FIELDS):
+        '''
+        EFetch 一批 MEDLINE 文本，返回 (记录列表, short)
+        响应在行中间被截断时，最后一条不完整的记录已被丢弃；short 为 True 表示记录数少于 retmax，
+        最后一条可能恰好在行边界被截断（见 pubmed_utils._iter_medline_records）
+        '''
+        # 超时由 iter_records 重试，同时让批大小减半
+        text = await self._request("efetch.fcgi", {"retstart": retstart, "retmax": retmax, "webenv": webenv, "query_key": query_key,
+                                                   "rettype": "medline", "retmode": "text"}, retry_errors=False)
+        state = {}
+        records = list(_iter_medline_records((text,), fields, state, expected=retmax))
+        if records and state["truncated"]:
+            records = records[:-1]
+        return records, state["short"]
+
+    async def iter_records(self, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, batch_size=None):
+        '''
+        异步生成器：ESearch 后按检索顺序逐条 yield 解析后的记录 {字段: 值}
+        参数同 pubmed_utils.get_main_info_into_excel；提前结束迭代时取消未完成的请求
+        PubMed 只能翻到前 9999 条：结果更多时只返回前 9999 条（按日期切片获取全部结果见 pubmed_utils.get_main_info_into_excel）
+        '''
+        search_term = search_key_words
+        if paper_type:
+            search_term += f" AND \"{paper_type}\"[PT]"
+        result = await self.esearch(search_term, release_date_cutoff)
+        total = result["count"] if grab_total is None else min(grab_total, result["count"])
+        if total > _HISTORY_CAP:
+            print(f"Warning: {result['count']} results, only the first {_HISTORY_CAP} can be fetched from one search")
+            total = _HISTORY_CAP
+        async for record in self._iter_history([(result["webenv"], result["query_key"], total)], batch_size):
+            yield record
+
+    async def iter_pmid_records(self, pmids, batch_size=None):
+        '''
+        异步生成器：按给定的 PMID 列表（EPost 上传）逐条 yield 解析后的记录
+        超过 history server 翻页上限的列表按 _HISTORY_CAP 分段 EPost（同 pubmed_utils._epost_segments）
+        '''
+        pmids = list(pmids)
+        segments = []
+        for i in range(0, len(pmids), _HISTORY_CAP):
+            chunk = pmids[i:i + _HISTORY_CAP]
+            segments.append((*await self.epost(chunk), len(chunk)))
+        async for record in self._iter_history(segments, batch_size):
+            yield record
+
+    async def _iter_history(self, segments, batch_size=None):
+        # 依次获取 history 结果 segments = [(WebEnv, query_key, 条数)]，批次划分（_plan_batches）和
+        # 截断补齐、重试、批大小调整（_BatchFill）与 pubmed_utils._iter_segment_batches 共用；
+        # 同样的滑动窗口：最多 2*max_concurrency 个批次在途或待 yield，按检索顺序输出
+        aiohttp = _require_aiohttp()
+        retryable = (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+        sizer = _BatchSizer(batch_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(webenv, query_key, retstart, retmax):
+            fill = _BatchFill(retstart, retmax, sizer, self.max_retries)
+            while True:
+                batch = fill.next_request()
+                if batch is None:
+                    return fill.records
+                async with semaphore:
+                    begin = time.monotonic()
+                    try:
+                        records, short = await self.efetch(webenv, query_key, *batch)
+                    except retryable:
+                        delay = fill.failed(time.monotonic() - begin)
+                        if delay is None:
+                            raise
+                    else:
+                        delay = fill.received(records, short, time.monotonic() - begin)
+                if delay:
+                    await asyncio.sleep(delay)
+
+        def submit(batch):
+            _, retmax, webenv, query_key, retstart = batch
+            return asyncio.ensure_future(fetch(webenv, query_key, retstart, retmax))
+
+        ranges = _plan_batches(segments, sizer)
+        pending = deque()
+        try:
+            for batch in ranges:
+                pending.append(submit(batch))
+                if len(pending) >= 2 * self.max_concurrency:
+                    break
+            while pending:
+                records = await pending.popleft()
+                next_batch = next(ranges, None)
+                if next_batch is not None:
+                    pending.append(submit(next_batch))
+                for record in records:
+                    yield record
+        finally:
+            for task in pending:
+                task.cancel()
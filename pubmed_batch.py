@@ -0,0 +1,311 @@
+'''
+批量运行多个 PubMed 查询（例如每周的文献摘要）：检索 + 抓取 -> 期刊指标匹配 -> HTML 阅读列表
+所有查询共用一个 pubmed_utils 实例：一个 HTTP 连接池、一个全局令牌桶限速器（总速率不超过 NCBI 的限制）、进程内只加载一次的期刊索引
+抓取在线程池中并发进行（网络等待为主），HTML 生成交给进程池（CPU 为主），每个查询抓取完成后立即开始生成它的阅读列表
+单个查询失败不影响其它查询，最后打印汇总并写出 batch_summary.json
+合并模式（--combined）下所有查询写入同一个文章库，重叠的文章只获取一次，最后只写出一个合并的表格和阅读列表，每篇文章标出命中它的查询
+
+Usage:
+    python pubmed_batch.py queries.txt --api-key KEY --out-dir ./paper_donload/weekly --release-date-cutoff 7
+    python pubmed_batch.py queries.jsonl --incremental --format parquet --virtual --search
+    python pubmed_batch.py queries.txt --combined --store ./paper_donload/articles.sqlite --virtual --search
+    python pubmed_batch.py queries.txt --report ./paper_donload/weekly/run_report.json --profile parse html
+
+queries 文件：每行一个查询，空行和以 # 开头的行被忽略；
+也可以每行一个 JSON 对象，逐个查询覆盖命令行的默认值：
+    {"query": "(wnt5a NOT cancer) AND fibro*", "name": "wnt5a_fibro", "paper_type": "Journal Article", "release_date_cutoff": 7, "grab_total": 500}
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import run_metrics
+from html_generate import generate_reading_list
+from pubmed_utils import pubmed_utils
+from record_cache import RecordCache
+
+# 每个查询可以覆盖的字段
+_QUERY_FIELDS = ('query', 'name', 'paper_type', 'release_date_cutoff', 'grab_total')
+
+
+def load_queries(path, defaults=None):
+    '''
+    读取 queries 文件，返回查询列表 [{'query':..., 'name':..., 'paper_type':..., 'release_date_cutoff':..., 'grab_total':...}]
+    name 没有给出时由查询词生成，重名时加序号，用作输出文件名
+    '''
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_number}: invalid JSON ({e})")
+                unknown = set(entry) - set(_QUERY_FIELDS)
+                if unknown or not entry.get('query'):
+                    raise ValueError(f"{path}:{line_number}: expected a 'query' and only {', '.join(_QUERY_FIELDS)}")
+            else:
+                entry = {'query': line}
+            queries.append({**(defaults or {}), **entry})
+
+    used = set()
+    for entry in queries:
+        name = _slug(entry.get('name') or entry['query'])
+        unique, k = name, 2
+        while unique in used:
+            unique, k = f"{name}_{k}", k + 1
+        used.add(unique)
+        entry['name'] = unique
+    return queries
+
+
+def _slug(text):
+    return re.sub(r'[^0-9A-Za-z]+', '_', text).strip('_')[:60] or 'query'
+
+
+def run_batch(queries, api_key, out_dir, table_format='xlsx', query_workers=4, html_workers=None, max_workers=None, cache=None,
+              incremental=False, virtual=False, compress=False, search=False, combined=False):
+    '''
+    运行一批查询，返回每个查询的结果 [{'name', 'query', 'table', 'html', 'records', 'fetch_seconds', 'html_seconds', 'error'}]
+    合并模式下各查询的 table/html 为合并表格和阅读列表的路径
+
+    Parameters:
+    -----------
+    queries : list of dict
+        load_queries 的返回值
+    api_key : str
+        NCBI API key
+    out_dir : str
+        输出目录，每个查询写出 <name>.<table_format> 和 <name>_reading_list.html
+    query_workers : int
+        同时抓取的查询数，默认为4；总请求速率仍由共用的限速器控制
+    html_workers : int, optional
+        生成 HTML 的进程数，默认为None（CPU 核数）
+    max_workers : int, optional
+        每个查询内部的 EFetch 并发数，同 get_main_info_into_excel
+    cache : str, optional
+        共用的 SQLite 记录缓存路径，默认为None（不使用缓存；合并模式下为 out_dir 中的 articles.sqlite）；增量模式下不使用
+    incremental : bool
+        为True时用 update_main_info_into_excel 只获取上次运行之后新增的论文
+    virtual, compress, search : bool
+        传给 generate_reading_list
+    combined : bool
+        为True时所有查询只写入文章库（get_query_into_store），最后导出一个合并的表格 combined.<table_format> 和阅读列表
+    '''
+    if combined and incremental:
+        raise ValueError("combined=True and incremental=True cannot be used together")
+    os.makedirs(out_dir, exist_ok=True)
+    utils = pubmed_utils()
+    if combined and not cache:
+        cache = os.path.join(out_dir, 'articles.sqlite')
+    record_cache = RecordCache(cache) if cache else None
+    results = {entry['name']: {'name': entry['name'], 'query': entry['query'], 'table': None, 'html': None, 'records': None,
+                               'fetch_seconds': None, 'html_seconds': None, 'error': None} for entry in queries}
+
+    def fetch(entry):
+        save_path = os.path.join(out_dir, f"{entry['name']}.{table_format}")
+        begin = time.perf_counter()
+        if combined:
+            pmids = utils.get_query_into_store(api_key, entry['query'], record_cache, name=entry['name'], release_date_cutoff=entry.get('release_date_cutoff'),
+                                               paper_type=entry.get('paper_type', 'Article'), grab_total=entry.get('grab_total'), max_workers=max_workers)
+            return None, len(pmids), time.perf_counter() - begin
+        if incremental:
+            utils.update_main_info_into_excel(api_key, entry['query'], entry.get('paper_type', 'Article'), save_path,
+                                              release_date_cutoff=entry.get('release_date_cutoff'), max_workers=max_workers)
+        else:
+            utils.get_main_info_into_excel(api_key, entry['query'], entry.get('release_date_cutoff'), entry.get('paper_type', 'Article'),
+                                           entry.get('grab_total'), save_path, max_workers=max_workers, cache=record_cache)
+        query_df = utils.embed_IF_into_excel(save_path)
+        return save_path, len(query_df), time.perf_counter() - begin
+
+    # spawn：子进程不继承抓取线程持有的锁
+    html_pool = ProcessPoolExecutor(max_workers=html_workers, mp_context=multiprocessing.get_context('spawn'))
+    html_futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=query_workers) as fetch_pool:
+            fetch_futures = {fetch_pool.submit(fetch, entry): entry for entry in queries}
+            for future in as_completed(fetch_futures):
+                entry = fetch_futures[future]
+                result = results[entry['name']]
+                try:
+                    result['table'], result['records'], result['fetch_seconds'] = future.result()
+                except Exception as e:
+                    result['error'] = f"fetch failed: {e!r}"
+                    print(f"[{entry['name']}] {result['error']}")
+                    continue
+                if combined:
+                    continue
+                html_path = os.path.join(out_dir, f"{entry['name']}_reading_list.html")
+                search_info = {
+                    'search_keywords': entry['query'],
+                    'paper_type': entry.get('paper_type', 'Article'),
+                    'release_date_cutoff': entry.get('release_date_cutoff'),
+                    'grab_total': entry.get('grab_total'),
+                    'save_path': result['table'],
+                    'search_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                html_futures[html_pool.submit(_generate_html, result['table'], html_path, search_info, virtual, compress, search,
+                                              _worker_metrics(html_path))] = ([entry['name']], html_path)
+
+        if combined:
+            _export_combined(utils, record_cache, queries, results, out_dir, table_format, html_pool, html_futures, virtual, compress, search)
+
+        for future in as_completed(html_futures):
+            names, html_path = html_futures[future]
+            try:
+                html_seconds, stages, profiles = future.result()
+                report = run_metrics.active()
+                if report is not None:
+                    report.merge(stages)
+                    report.profiles.update(profiles)
+            except Exception as e:
+                html_seconds, html_path, error = None, None, f"HTML failed: {e!r}"
+                print(f"[{', '.join(names)}] {error}")
+            for name in names:
+                results[name]['html_seconds'], results[name]['html'] = html_seconds, html_path
+                if html_path is None:
+                    results[name]['error'] = error
+    finally:
+        html_pool.shutdown()
+        if record_cache is not None:
+            record_cache.close()
+    return [results[entry['name']] for entry in queries]
+
+
+def _export_combined(utils, store, queries, results, out_dir, table_format, html_pool, html_futures, virtual, compress, search):
+    # 合并模式：成功的查询导出为一个表格，再提交一个阅读列表任务
+    names = [entry['name'] for entry in queries if not results[entry['name']]['error']]
+    if not names:
+        return
+    table_path = os.path.join(out_dir, f"combined.{table_format}")
+    try:
+        utils.export_store(store, table_path, names=names)
+    except Exception as e:
+        for name in names:
+            results[name]['error'] = f"export failed: {e!r}"
+        print(f"[combined] export failed: {e!r}")
+        return
+    for name in names:
+        results[name]['table'] = table_path
+    kept = [entry for entry in queries if entry['name'] in names]
+    search_info = {
+        # 高亮所有查询的关键词
+        'search_keywords': ' OR '.join(f"({entry['query']})" for entry in kept),
+        'paper_type': ', '.join(sorted({entry.get('paper_type') or 'Any' for entry in kept})),
+        'save_path': table_path,
+        'search_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    html_path = os.path.join(out_dir, "combined_reading_list.html")
+    html_futures[html_pool.submit(_generate_html, table_path, html_path, search_info, virtual, compress, search,
+                                  _worker_metrics(html_path))] = (names, html_path)
+
+
+def _worker_metrics(html_path):
+    # 主进程在记录指标时，HTML 进程也记录，参数为 (profile, trace_memory, .prof 前缀)，否则为 None
+    report = run_metrics.active()
+    if report is None:
+        return None
+    profile_prefix = f"{report.profile_prefix}.{os.path.splitext(os.path.basename(html_path))[0]}"
+    return report.profile, report.trace_memory, profile_prefix
+
+
+def _generate_html(table_path, html_path, search_info, virtual, compress, search, metrics=None):
+    # 在 HTML 进程池中运行；返回 (用时, 本任务的阶段指标, .prof 文件)，由主进程合并到运行报告
+    begin = time.perf_counter()
+    if metrics is None:
+        generate_reading_list(table_path, html_path, search_info=search_info, virtual=virtual, compress=compress, search=search)
+        return time.perf_counter() - begin, {}, {}
+    profile, trace_memory, profile_prefix = metrics
+    with run_metrics.recording(profile=profile, trace_memory=trace_memory, profile_prefix=profile_prefix) as report:
+        generate_reading_list(table_path, html_path, search_info=search_info, virtual=virtual, compress=compress, search=search)
+    name = os.path.splitext(os.path.basename(html_path))[0]
+    return (time.perf_counter() - begin, report.to_dict()['stages'],
+            {f"{stage}:{name}": path for stage, path in report.profiles.items()})
+
+
+def _print_summary(results, elapsed):
+    failed = [result for result in results if result['error']]
+    records = sum(result['records'] or 0 for result in results)
+    print("\n" + "="*60)
+    print("批量查询报告")
+    print("="*60)
+    print(f"{'name':<40} {'records':>8} {'fetch s':>8} {'html s':>7}")
+    for result in results:
+        if result['error']:
+            print(f"{result['name'][:40]:<40} {'FAILED':>8}  {result['error']}")
+        else:
+            print(f"{result['name'][:40]:<40} {result['records']:>8} {result['fetch_seconds']:>8.1f} {result['html_seconds']:>7.1f}")
+    print("-"*60)
+    print(f"查询数: {len(results)}  失败: {len(failed)}  论文数: {records}  用时: {elapsed:.1f} s")
+    print("="*60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('queries', help="queries 文件：每行一个查询，或每行一个 JSON 对象")
+    parser.add_argument('--api-key', default=os.environ.get('NCBI_API_KEY'), help="NCBI API key，默认读取环境变量 NCBI_API_KEY")
+    parser.add_argument('--out-dir', default='./paper_donload/batch')
+    parser.add_argument('--format', dest='table_format', default='xlsx', choices=['xlsx', 'csv', 'parquet', 'feather'])
+    parser.add_argument('--paper-type', default='Article', help="默认的文献类型，空字符串表示不限")
+    parser.add_argument('--release-date-cutoff', type=int, default=None, help="默认的发布时间范围（天数）")
+    parser.add_argument('--grab-total', type=int, default=None, help="默认每个查询最多获取的论文数")
+    parser.add_argument('--query-workers', type=int, default=4)
+    parser.add_argument('--html-workers', type=int, default=None)
+    parser.add_argument('--max-workers', type=int, default=None, help="每个查询内部的 EFetch 并发数")
+    parser.add_argument('--cache', '--store', dest='cache', default=None, help="共用的 SQLite 记录缓存（文章库）路径")
+    parser.add_argument('--incremental', action='store_true', help="只获取上次运行之后新增的论文")
+    parser.add_argument('--combined', action='store_true', help="所有查询写入同一个文章库，只生成一个合并的表格和阅读列表")
+    parser.add_argument('--virtual', action='store_true')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--search', action='store_true')
+    parser.add_argument('--report', default=None, help="写出各阶段用时、请求数、字节数、记录数/秒和峰值内存的 JSON 报告")
+    parser.add_argument('--profile', nargs='+', default=(), metavar='STAGE',
+                        help="为这些阶段开启 cProfile（如 parse html journal_match，all 表示所有阶段），.prof 文件写在报告旁边")
+    parser.add_argument('--trace-memory', action='store_true', help="用 tracemalloc 记录最外层阶段（入口函数、html）的 Python 内存峰值（较慢）")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("--api-key is required (or set NCBI_API_KEY)")
+    if args.combined and args.incremental:
+        parser.error("--combined and --incremental cannot be used together")
+    defaults = {'paper_type': args.paper_type, 'release_date_cutoff': args.release_date_cutoff, 'grab_total': args.grab_total}
+    queries = load_queries(args.queries, defaults)
+    if not queries:
+        parser.error(f"no queries in {args.queries}")
+
+    recording = args.report or args.profile or args.trace_memory
+    if recording:
+        profile = True if 'all' in args.profile else args.profile
+        run_metrics.start(args.report, profile, args.trace_memory,
+                          profile_prefix=None if args.report else os.path.join(args.out_dir, 'run_report'))
+    begin = time.perf_counter()
+    try:
+        results = run_batch(queries, args.api_key, args.out_dir, table_format=args.table_format, query_workers=args.query_workers,
+                            html_workers=args.html_workers, max_workers=args.max_workers, cache=args.cache, incremental=args.incremental,
+                            virtual=args.virtual, compress=args.compress, search=args.search, combined=args.combined)
+    finally:
+        report = run_metrics.stop() if recording else None
+    elapsed = time.perf_counter() - begin
+    _print_summary(results, elapsed)
+    with open(os.path.join(args.out_dir, 'batch_summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'finished': datetime.now().isoformat(timespec='seconds'), 'seconds': round(elapsed, 2), 'queries': results},
+                  f, ensure_ascii=False, indent=2)
+    if report is not None:
+        if report.path:
+            print(f"运行报告: {report.path}")
+        for stage, path in sorted(report.profiles.items()):
+            print(f"profile {stage}: {path}")
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
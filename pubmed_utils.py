@@ -1,24 +1,356 @@
 import os
-print("working directory:", os.getcwd())
-from Bio import Entrez, Medline
-import pandas as pd
-import requests
-import openpyxl
 import time
-from tqdm import trange
-from bs4 import BeautifulSoup
+import threading
+import functools
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import re
+import json
+import csv
+from datetime import datetime, date, timedelta
+from record_cache import RecordCache
+import table_io
+import journal_index
+import run_metrics
+from journal_index import DEFAULT_JCR_CSA_PATH
+# pandas、requests、tqdm 等较重的依赖在用到它们的函数中导入，import pubmed_utils 本身不加载它们
+
+EUTILS_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+# 需要重试的 HTTP 状态码：429（超过速率限制）和服务器端错误
+_RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+# PubMed 的 ESearch 和 history server 最多只能翻到前 10000 条（retstart + retmax <= 9999），更多的结果需要按日期切片获取
+_HISTORY_CAP = 9999
+# 输出的 MEDLINE 字段，依次对应 Excel 的第 1、2、... 列（pubmed_utils.excel_property_dic，pubmed_async 也使用）
+MEDLINE_FIELDS = ("PMID", "TI", "TA", "IF", "Quartile", "JCR_Quartile", "Top", "OA", "LR", "AB", "LID", "IS")
+# 指数退避：第 n 次重试前最多等待 _BACKOFF_BASE * 2**n 秒，不超过 _BACKOFF_MAX
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 60.0
+
+
+@functools.lru_cache(maxsize=None)
+def _medline_field_pattern(tags):
+    # 匹配一个需要的字段：以 "\nTAG - " 开头，连同其后以 6 个空格缩进的续行
+    return re.compile(r'\n(' + '|'.join(re.escape(tag) for tag in tags) + r')- ?([^\n]*(?:\n      [^\n]*)*)')
+
+
+def _iter_medline_records(chunks, fields, state=None, expected=None):
+    '''
+    单遍增量解析 MEDLINE 文本，逐条 yield 只包含 fields 中字段的精简记录 {字段: 值}
+    chunks 是文本块的可迭代对象（例如流式读取的响应体 iter_content，或整个文本作为一个块）
+    不需要的字段由正则直接跳过，不逐行处理；多行字段与 Bio.Medline 对文本字段的处理一致：各行用空格连接，空的续行被忽略；
+    重复出现的字段（如多个 LID、IS）同样用空格连接
+    每条记录从 PMID 行开始，PMID 之前的内容会被忽略
+
+    传入 state 字典时设置：
+        state['truncated']  文本最后没有换行符：响应在一行中间被截断，最后一条记录不完整
+        state['short']      没有在行中间截断，但记录数少于 expected（请求的 retmax）：响应可能恰好在行边界被截断，
+                            最后一条记录可能缺少字段，需要重新获取确认（见 _BatchFill）
+    '''
+    # MEDLINE 字段标签固定占 4 个字符，例如 "TI  - ..."、"PMID- ..."
+    pattern = _medline_field_pattern(tuple(f"{field:<4}" for field in fields if len(field) <= 4))
+    record = None
+
+    def scan(block):
+        nonlocal record
+        for match in pattern.finditer(block):
+            tag, value = match.groups()
+            if '\n' in value:
+                first, *rest = value.split('\n')
+                value = ' '.join(filter(None, [first.rstrip()] + [line[6:].rstrip() for line in rest]))
+            else:
+                value = value.rstrip()
+            field = tag.rstrip()
+            if field == 'PMID':
+                if record:
+                    yield record
+                record = {}
+            elif record is None:
+                continue
+            if field in record:
+                record[field] += ' ' + value
+            else:
+                record[field] = value
+
+    buffer = '\n'
+    last_chunk = ''
+    count = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        last_chunk = chunk
+        buffer += chunk
+        # 只解析到最后一个空行（记录边界），保证续行不会被块边界切断
+        cut = buffer.rfind('\n\n')
+        if cut > 0:
+            for complete in scan(buffer[:cut + 1]):
+                count += 1
+                yield complete
+            buffer = buffer[cut + 1:]
+    for complete in scan(buffer):
+        count += 1
+        yield complete
+    if record:
+        count += 1
+        yield record
+    if state is not None:
+        state['truncated'] = bool(last_chunk) and not last_chunk.endswith('\n')
+        state['short'] = not state['truncated'] and expected is not None and 0 < count < expected
+
+
+def _retry_delay(attempt, retry_after=None):
+    '''
+    第 attempt 次重试（从 0 开始）前等待的秒数
+    有 Retry-After（秒数或 HTTP 日期）时按它等待，否则指数退避并加随机抖动，避免并发请求同时重试
+    '''
+    if retry_after:
+        try:
+            return min(_BACKOFF_MAX, max(0.0, float(retry_after)))
+        except ValueError:
+            import email.utils
+            try:
+                return min(_BACKOFF_MAX, max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    return min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _timed_chunks(chunks, totals):
+    # 把从 chunks 取下一块的墙钟时间和 CPU 时间累加到 totals = [wall, cpu]，用于区分网络等待和解析
+    chunks = iter(chunks)
+    while True:
+        begin, cpu_begin = time.perf_counter(), time.thread_time()
+        chunk = next(chunks, None)
+        totals[0] += time.perf_counter() - begin
+        totals[1] += time.thread_time() - cpu_begin
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _parse_entrez_date(text, end=False):
+    # E-utilities 的日期参数：YYYY、YYYY/MM 或 YYYY/MM/DD；end 为 True 时取该年/月的最后一天
+    parts = [int(part) for part in str(text).split("/")]
+    if len(parts) == 3:
+        return date(*parts)
+    if len(parts) == 2:
+        first = date(parts[0], parts[1], 1)
+        return (first + timedelta(days=31)).replace(day=1) - timedelta(days=1) if end else first
+    return date(parts[0], 12, 31) if end else date(parts[0], 1, 1)
+
+
+def _write_json_atomic(path, obj):
+    # 先写临时文件再替换，避免中断时留下损坏的文件
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+class _TokenBucket():
+    '''
+    线程安全的令牌桶限速器，所有并发请求共享同一个桶
+    NCBI 限制: 无 api_key 时 3 次/秒，有 api_key 时 10 次/秒
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_api_key(cls, api_key):
+        return cls(10 if api_key else 3)
+
+    def pause(self, seconds):
+        # 收到 429 时所有共享这个桶的请求一起暂停，而不是各自立即重试
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        # 阻塞直到拿到一个令牌
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    # 暂停期间不积累令牌
+                    self._tokens = 0.0
+                    self._updated = self._paused_until
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _BatchSizer():
+    '''
+    自适应 EFetch 批大小（retmax）
+    响应快时逐步翻倍，超时或返回被截断时减半
+    E-utilities 对 MEDLINE 文本允许 retmax 最大 10000
+    '''
+    def __init__(self, batch_size=None, initial=200, minimum=10, maximum=10000, target_seconds=3.0):
+        # batch_size 不为 None 时使用固定批大小
+        self.fixed = batch_size is not None
+        self.size = int(batch_size) if self.fixed else initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self._lock = threading.Lock()
+
+    def next_size(self):
+        with self._lock:
+            return self.size
+
+    def record(self, size, elapsed, timed_out=False, truncated=False):
+        if self.fixed:
+            return
+        with self._lock:
+            if timed_out or truncated:
+                self.size = max(self.minimum, min(self.size, size) // 2)
+            elif elapsed > 2 * self.target_seconds:
+                self.size = max(self.minimum, self.size // 2)
+            elif elapsed < self.target_seconds and size >= self.size:
+                # 只有满批次的快速响应才说明还能加大
+                self.size = min(self.maximum, self.size * 2)
+
+
+def _plan_batches(segments, sizer, start=0):
+    '''
+    把 history 结果 segments = [(WebEnv, query_key, 条数)] 划分为 EFetch 批次，同步和异步客户端共用
+    多个切片视为一个整体，批次不跨越切片边界；批大小在取下一个批次时才向 sizer 询问，因此会随着响应情况动态变化
+    yield (拼接后的全局 retstart, retmax, WebEnv, query_key, 切片内 retstart)，从全局位置 start 开始
+    '''
+    offset = 0
+    for webenv, query_key, count in segments:
+        retstart = max(0, start - offset)
+        while retstart < count:
+            retmax = min(sizer.next_size(), count - retstart)
+            yield offset + retstart, retmax, webenv, query_key, retstart
+            retstart += retmax
+        offset += count
+
+
+class _BatchFill():
+    '''
+    一个 EFetch 批次 [retstart, retstart + retmax) 的获取状态，同步和异步客户端共用，调用方只负责发请求和等待：
+    返回条数不足时（截断）对剩余部分再次请求，按 PMID 去重，并据此调整 sizer 的批大小；
+    响应比请求的少、最后一条可能恰好在行边界被截断时（short），先不接受这一条，从它开始再请求一次，以新取得的为准；
+    超时和空响应按指数退避重试，重试用尽后仍不足 retmax 条时以已取得的部分结束，由调用方记录缺失
+
+        fill = _BatchFill(retstart, retmax, sizer, max_retries)
+        while (request := fill.next_request()) is not None:
+            try:
+                delay = fill.received(*efetch(*request), elapsed)   # efetch 返回 (records, short)
+            except 超时或连接错误:
+                delay = fill.failed(elapsed)      # None 时重新抛出
+            sleep(delay)
+        return fill.records
+    '''
+    def __init__(self, retstart, retmax, sizer, max_retries):
+        self.retstart = retstart
+        self.retmax = retmax
+        self.sizer = sizer
+        self.max_retries = max_retries
+        self.records = []
+        self._seen = set()
+        self._failures = 0
+        self._size = 0
+        self._done = False
+        # 上一次响应中可能不完整、等待确认的最后一条记录
+        self._pending = None
+
+    def next_request(self):
+        # 下一次请求的 (retstart, retmax)，取满或放弃时返回 None
+        if self._done or len(self.records) >= self.retmax:
+            return None
+        self._size = min(self.retmax - len(self.records), self.sizer.next_size())
+        return self.retstart + len(self.records), self._size
+
+    def failed(self, elapsed):
+        # 请求超时或连接中断：返回重试前等待的秒数，重试用尽时返回 None
+        self.sizer.record(self._size, elapsed, timed_out=True)
+        if self._failures >= self.max_retries:
+            return None
+        return self._backoff()
+
+    def received(self, records, short, elapsed):
+        # records 为一次响应中的记录（在行中间截断时已丢弃最后一条），short 见 _iter_medline_records
+        # 返回下一次请求前等待的秒数
+        self.sizer.record(self._size, elapsed, truncated=len(records) < self._size)
+        records = list(records)
+        pending, self._pending = self._pending, None
+        if pending is not None and (not records or records[0].get('PMID') != pending.get('PMID')):
+            # 重新请求没有再返回它：它确实是最后一条，原样接受
+            records.insert(0, pending)
+        records = [record for record in records if record.get('PMID') not in self._seen]
+        if short and records and (pending is None or records[-1].get('PMID') != pending.get('PMID')):
+            # 同一条记录只重新确认一次
+            self._pending = records.pop()
+        if not records and self._pending is not None:
+            return 0
+        if not records:
+            # 空响应可能是暂时的，少量重试；记录确实不存在（如检索后被删除）时放弃
+            if self._failures >= min(2, self.max_retries):
+                self._done = True
+                return 0
+            return self._backoff()
+        self._seen.update(record.get('PMID') for record in records)
+        self.records.extend(records)
+        return 0
+
+    def _backoff(self):
+        delay = _retry_delay(self._failures)
+        self._failures += 1
+        return delay
+
+
+def _make_session(pool_size=32):
+    # 带连接池的 HTTP 会话：连接保持复用（keep-alive），pool_size 为同时保持的连接数上限
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
 class pubmed_utils():
-    def __init__(self):
-        pass
-        
-        
-    def get_main_info_into_excel(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, save_path="./paper_info.xlsx"):
+    '''
+    Parameters:
+    -----------
+    session : requests.Session, optional
+        E-utilities 请求使用的 HTTP 会话，默认为None（第一次请求时创建一个带连接池的会话）
+    rate_limiter : _TokenBucket, optional
+        请求限速器，默认为None（按 api_key 创建）；多个实例共用一个限速器时总速率不超过 NCBI 的限制
+    max_retries : int, optional
+        每个请求遇到 429、服务器错误、超时或连接错误时最多重试的次数，默认为5（指数退避，429 按 Retry-After 等待）
+    '''
+    def __init__(self, session=None, rate_limiter=None, max_retries=5):
+        self.excel_property_dic = {token:index for index, token in enumerate(MEDLINE_FIELDS, start=1)}
+        # Excel 表头
+        self.excel_header_dic = {"PMID": "PMID", "TI": "Title", "TA": "Journal", "IF": "IF", "Quartile": "JCR_Quartile", "JCR_Quartile": "CSA_Quartile",
+                                 "Top": "Top", "OA": "Open Access", "LR": "publish_date", "AB": "Abstract", "LID": "DOI", "IS": "ISSN"}
+        self.rate_limiter = rate_limiter
+        self.session = session
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        # 正在获取的 PMID -> 获取完成时 set 的 Event，见 _claim_pmids
+        self._inflight = {}
+
+
+    @run_metrics.timed("get_main_info_into_excel")
+    def get_main_info_into_excel(self, api_key, search_key_words, release_date_cutoff=None, paper_type="Article", grab_total=None, save_path="./paper_info.xlsx", max_workers=None, batch_size=None, cache=None, resume=True):
         '''
         grab info from pubmed using NCBI eUtils API, save it into a excel
         支持逻辑符号: AND, OR, NOT 等
-        
+
         Parameters:
         -----------
         api_key : str
@@ -32,241 +364,958 @@ class pubmed_utils():
         grab_total : int, optional
             获取论文数量，默认为None（获取所有）
         save_path : str
-            Excel保存路径
+            保存路径，按扩展名选择格式：.xlsx (Excel)、.parquet / .feather（列式，需要 pyarrow）或 .csv
+        max_workers : int, optional
+            同时进行的 EFetch 请求数，默认为None（有 api_key 时 8 个，否则 3 个）
+        batch_size : int, optional
+            每次 EFetch 的记录数（最大 10000），默认为None（自适应：响应快时增大，超时或截断时减小）
+        cache : str or RecordCache, optional
+            本地记录缓存（SQLite 路径或 RecordCache 实例），默认为None（不使用缓存）
+            使用缓存时只 EFetch 缓存中没有的、或上次抓取后被修订过的 PMID
+        resume : bool, optional
+            每批数据写入后立即落盘（save_path + ".partial.csv"）并记录检查点，默认为True：
+            上次运行被中断时从最后写入的 retstart 继续，而不是从头开始
         '''
-        
-        grab_step = 10
-        
+
         # 构建搜索词
         search_term = search_key_words
         if paper_type:
             search_term += f" AND \"{paper_type}\"[PT]"
-        
+
         # 步骤1: ESearch - 搜索论文
-        esearch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+        print("Searching PubMed...")
+        total, webenv, query_key = self._esearch(api_key, search_term, release_date_cutoff)
+
+        print(f"Find total: {total}")
+
+        if grab_total is None or grab_total > total:
+            grab_total = total
+
+        # 步骤2: EFetch - 并发获取详细信息，按 retstart 顺序写入
+        run_key = {"search_term": search_term, "release_date_cutoff": release_date_cutoff, "total": total}
+        if cache is None:
+            if grab_total > _HISTORY_CAP:
+                # 超过 history server 的翻页上限：按日期切片，每片各自 ESearch，拼接成一个整体按顺序获取
+                segments = self._history_segments(api_key, search_term, release_date_cutoff, grab_total, max_workers)
+                grab_total = sum(count for _, _, count in segments)
+            else:
+                segments = [(webenv, query_key, grab_total)]
+            start = self._resume_start(save_path, run_key) if resume else 0
+            batches = self._iter_segment_batches(api_key, segments, batch_size, max_workers, start=start)
+        else:
+            start = 0
+            batches = self._iter_cached_batches(api_key, search_term, release_date_cutoff, grab_total, cache, batch_size, max_workers)
+        self._write_batches_to_excel(batches, grab_total, save_path, run_key=run_key, start=start)
+
+
+    @run_metrics.timed("get_pmids_into_excel")
+    def get_pmids_into_excel(self, api_key, pmids, save_path="./paper_info.xlsx", max_workers=None, batch_size=None, cache=None):
+        '''
+        按给定的 PMID 列表获取信息并保存到excel
+        PMID 列表通过 EPost (HTTP POST) 上传到 history server，之后与 get_main_info_into_excel 一样分批 EFetch
+
+        Parameters:
+        -----------
+        api_key : str
+            NCBI eUtils API key
+        pmids : list
+            PMID 列表
+        save_path : str
+            保存路径，按扩展名选择格式：.xlsx (Excel)、.parquet / .feather（列式，需要 pyarrow）或 .csv
+        max_workers, batch_size :
+            同 get_main_info_into_excel
+        cache : str or RecordCache, optional
+            本地记录缓存（文章库），给出时只获取缓存中没有的 PMID，新获取的记录写入缓存
+        '''
+        pmids = [str(pmid).strip() for pmid in pmids if str(pmid).strip()]
+        if not pmids:
+            print("No PMID given")
+            return
+        if cache is None:
+            batches = self._iter_segment_batches(api_key, self._epost_segments(api_key, pmids), batch_size, max_workers)
+        else:
+            if isinstance(cache, str):
+                cache = RecordCache(cache)
+            cached = cache.fetched_times(pmids)
+            to_fetch = [pmid for pmid in pmids if pmid not in cached]
+            print(f"Cache hits: {len(pmids) - len(to_fetch)}, to fetch: {len(to_fetch)}")
+            self._fetch_into_cache(api_key, to_fetch, cache, batch_size, max_workers)
+            batches = self._iter_store_batches(cache, pmids)
+        self._write_batches_to_excel(batches, len(pmids), save_path)
+
+
+    @run_metrics.timed("update_main_info_into_excel")
+    def update_main_info_into_excel(self, api_key, search_key_words, paper_type="Article", save_path="./paper_info.xlsx", reading_list_path=None, release_date_cutoff=None, search_info=None, max_workers=None, batch_size=None, cache=None):
+        '''
+        增量模式：只获取上次运行之后新增的论文，追加到已有的 excel 和 HTML 阅读列表
+        每个查询的水位（上次成功运行的时间和已见过的 PMID）保存在 save_path 旁的 .watermark.json 文件中
+        第一次运行（或查询词改变）时与 get_main_info_into_excel 相同，完整获取一次
+
+        Parameters:
+        -----------
+        api_key, search_key_words, paper_type, save_path, max_workers, batch_size :
+            同 get_main_info_into_excel
+        reading_list_path : str, optional
+            HTML 阅读列表路径，给出时把新论文追加到阅读列表，默认为None（不处理阅读列表）
+        release_date_cutoff : int, optional
+            只在第一次完整获取时使用的发布时间范围（天数）
+        search_info : dict, optional
+            传给 generate_reading_list 的 search_info
+        cache : str or RecordCache, optional
+            本地记录缓存（文章库），新获取的记录同时写入缓存
+
+        Returns:
+        --------
+        新增论文的 DataFrame（列名同 excel 表头）
+        '''
+        import pandas as pd
+        from html_generate import generate_reading_list, append_to_reading_list
+
+        search_term = search_key_words
+        if paper_type:
+            search_term += f" AND \"{paper_type}\"[PT]"
+
+        if isinstance(cache, str):
+            cache = RecordCache(cache)
+        run_started = datetime.now()
+        watermark = self._load_watermark(save_path)
+        if watermark is None or watermark.get("search_term") != search_term or not os.path.exists(save_path):
+            # 没有水位：完整获取一次
+            print("No watermark for this query, running a full fetch")
+            self.get_main_info_into_excel(api_key, search_key_words, release_date_cutoff, paper_type, None, save_path, max_workers, batch_size, cache=cache)
+            new_df = table_io.read_table(save_path)
+            if reading_list_path:
+                # 表格中的期刊指标由 embed_IF_into_excel 写入，阅读列表的卡片在这里匹配
+                generate_reading_list(self.enrich_journal_metrics(new_df)[0], reading_list_path, search_info=search_info)
+            seen = set()
+        else:
+            # 按 Entrez 日期 (EDAT) 只查询上次运行之后的部分；同一天的重叠部分用已见过的 PMID 去重
+            seen = set(watermark["pmids"])
+            since = datetime.fromisoformat(watermark["last_run"]).strftime("%Y/%m/%d")
+            print(f"Searching PubMed for records added since {since}...")
+            pmids = self._esearch_ids(api_key, search_term, extra_params={"datetype": "edat", "mindate": since, "maxdate": run_started.strftime("%Y/%m/%d")})
+            new_pmids = [pmid for pmid in pmids if pmid not in seen]
+            print(f"New records: {len(new_pmids)}")
+
+            new_records = []
+            if new_pmids:
+                for _, _, records in self._iter_segment_batches(api_key, self._epost_segments(api_key, new_pmids), batch_size, max_workers):
+                    new_records.extend(records)
+                self._append_records_to_excel(new_records, save_path)
+                if cache is not None:
+                    # 写入缓存的副本带期刊指标，表格中的记录保持不变（由 embed_IF_into_excel 处理）
+                    cache.put_many(self.enrich_records([dict(record) for record in new_records]))
+            new_df = pd.DataFrame([{self.excel_header_dic[key]: value for key, value in record.items()} for record in new_records],
+                                  columns=[self.excel_header_dic[key] for key in self.excel_property_dic])
+            if reading_list_path and len(new_df):
+                # 新卡片与完整获取时一样带期刊指标
+                if not append_to_reading_list(self.enrich_journal_metrics(new_df)[0], reading_list_path, search_info=search_info):
+                    generate_reading_list(self.enrich_journal_metrics(table_io.read_table(save_path))[0], reading_list_path, search_info=search_info)
+
+        seen.update(str(pmid) for pmid in new_df["PMID"].dropna())
+        self._save_watermark(save_path, {"search_term": search_term, "last_run": run_started.isoformat(timespec="seconds"), "pmids": sorted(seen)})
+        return new_df
+
+
+    @run_metrics.timed("get_query_into_store")
+    def get_query_into_store(self, api_key, search_key_words, store, name=None, release_date_cutoff=None, paper_type="Article", grab_total=None, max_workers=None, batch_size=None):
+        '''
+        把查询结果写入多个查询共用的文章库，不写出单独的表格
+        文章库中已有（且未被修订）的文章不再获取；查询本身只保存 PMID 列表和查询信息
+        之后用 export_store 导出合并的表格
+
+        Parameters:
+        -----------
+        api_key, search_key_words, release_date_cutoff, paper_type, grab_total, max_workers, batch_size :
+            同 get_main_info_into_excel
+        store : str or RecordCache
+            文章库（SQLite 路径或 RecordCache 实例）
+        name : str, optional
+            查询名，显示在合并阅读列表中，默认为None（使用查询词）
+
+        Returns:
+        --------
+        PMID 列表（ESearch 顺序）
+        '''
+        if isinstance(store, str):
+            store = RecordCache(store)
+        search_term = search_key_words
+        if paper_type:
+            search_term += f" AND \"{paper_type}\"[PT]"
+
+        print(f"Searching PubMed for {name or search_key_words}...")
+        pmids = self._sync_cache(api_key, search_term, release_date_cutoff, grab_total, store, batch_size, max_workers)
+        store.set_query(name or search_key_words, pmids, {
+            "search_keywords": search_key_words,
+            "paper_type": paper_type,
+            "release_date_cutoff": release_date_cutoff,
+            "grab_total": grab_total,
+            "search_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        print(f"Stored {len(pmids)} PMIDs for {name or search_key_words}")
+        return pmids
+
+
+    @run_metrics.timed("export_store")
+    def export_store(self, store, save_path, names=None):
+        '''
+        从文章库导出合并的表格：多个查询命中的同一篇文章只出现一次，Queries 列列出命中它的查询名（以 "; " 分隔）
+        文章按查询顺序、查询内按 ESearch 顺序排列
+
+        Parameters:
+        -----------
+        store : str or RecordCache
+            文章库
+        save_path : str
+            保存路径，格式同 get_main_info_into_excel
+        names : list of str, optional
+            要导出的查询名，默认为None（文章库中的所有查询）
+
+        Returns:
+        --------
+        合并后的 DataFrame（列名同 excel 表头，另加 Queries 列）
+        '''
+        if isinstance(store, str):
+            store = RecordCache(store)
+        if names is None:
+            names = list(store.queries())
+
+        matched = {}
+        for name in names:
+            for pmid in store.query_pmids(name):
+                matched.setdefault(pmid, []).append(name)
+        pmids = list(matched)
+
+        keys = list(self.excel_property_dic)
+        rows = []
+        for i in range(0, len(pmids), 500):
+            chunk = pmids[i:i + 500]
+            found = store.get_many(chunk)
+            # 旧版本缓存的记录没有期刊指标，导出时补上（enrich_records 原地修改记录）
+            missing = [record for record in found.values() if "IF" not in record]
+            if missing:
+                store.update_records(self.enrich_records(missing))
+            for pmid in chunk:
+                if pmid in found:
+                    record = found[pmid]
+                    rows.append([record.get(key, "") for key in keys] + ["; ".join(matched[pmid])])
+        if len(rows) < len(pmids):
+            print(f"Warning: {len(pmids) - len(rows)} articles of these queries are no longer in the store, run the queries again to fetch them")
+        import pandas as pd
+        query_df = pd.DataFrame(rows, columns=[self.excel_header_dic[key] for key in keys] + ["Queries"])
+        table_io.write_table(query_df, save_path)
+        print(f"Exported {len(query_df)} unique articles from {len(names)} queries ({sum(map(len, matched.values()))} matches) to {save_path}")
+        return query_df
+
+
+    @run_metrics.timed("search_store")
+    def search_store(self, store, query=None, save_path=None, min_if=None, quartiles=None, journal=None, since=None, until=None, order="rank", limit=None):
+        '''
+        在本地文章库中检索（标题/摘要的 FTS5 全文索引 + 期刊指标），不访问 NCBI
+        文章库包含 get_main_info_into_excel / get_pmids_into_excel / get_query_into_store 等用 cache 获取过的所有记录
+        返回的 DataFrame 可以直接传给 generate_reading_list
+
+        Parameters:
+        -----------
+        store : str or RecordCache
+            文章库
+        query : str, optional
+            检索式，语法同阅读列表的关键词：词之间为 AND，支持 OR、NOT、括号、"短语" 和 * 通配符，默认为None（不按内容筛选）
+        save_path : str, optional
+            同时把结果保存为表格，格式同 get_main_info_into_excel，默认为None（不保存）
+        min_if, quartiles, journal, since, until, order, limit :
+            见 RecordCache.search
+
+        Returns:
+        --------
+        DataFrame（列名同 excel 表头），按 order 排序
+        '''
+        if isinstance(store, str):
+            store = RecordCache(store)
+        self._enrich_store(store)
+        with run_metrics.stage("store_search") as stage:
+            records = store.search(query, min_if, quartiles, journal, since, until, order, limit)
+            stage.add(records=len(records))
+
+        import pandas as pd
+        keys = list(self.excel_property_dic)
+        query_df = pd.DataFrame([[record.get(key, "") for key in keys] for record in records],
+                                columns=[self.excel_header_dic[key] for key in keys])
+        if save_path:
+            table_io.write_table(query_df, save_path)
+        print(f"Found {len(query_df)} articles in the local store")
+        return query_df
+
+
+    def _enrich_store(self, store):
+        # 旧版本缓存中没有期刊指标的记录：匹配一次并写回，不改变抓取时间
+        pmids = store.unindexed_metrics()
+        for i in range(0, len(pmids), 500):
+            store.update_records(self.enrich_records(list(store.get_many(pmids[i:i + 500]).values())))
+
+
+    def export_excel(self, table_path, excel_path=None):
+        '''
+        把 Parquet/Feather/CSV 表格流式导出为 excel（可选的最后一步）
+        excel_path 默认为同名的 .xlsx 文件
+        '''
+        if excel_path is None:
+            excel_path = os.path.splitext(table_path)[0] + ".xlsx"
+        table_io.convert_table(table_path, excel_path)
+        print(f"Excel exported to {excel_path}")
+        return excel_path
+
+
+    def _watermark_path(self, save_path):
+        return os.path.splitext(save_path)[0] + ".watermark.json"
+
+
+    def _load_watermark(self, save_path):
+        watermark_path = self._watermark_path(save_path)
+        if not os.path.exists(watermark_path):
+            return None
+        with open(watermark_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    def _save_watermark(self, save_path, watermark):
+        _write_json_atomic(self._watermark_path(save_path), watermark)
+
+
+    def _append_records_to_excel(self, records, save_path):
+        # 按表头名称追加，兼容 embed_IF_into_excel 改写过列顺序的表格；逐行复制原有内容，内存占用与文件大小无关
+        table_io.append_rows(save_path, [{self.excel_header_dic[key]: key_info for key, key_info in record.items()} for record in records])
+        print(f"Appended {len(records)} records to {save_path}")
+
+
+    def _partial_paths(self, save_path):
+        # 分批落盘的中间文件和检查点
+        return save_path + ".partial.csv", save_path + ".checkpoint.json"
+
+
+    def _resume_start(self, save_path, run_key):
+        '''
+        根据检查点返回继续获取的 retstart；没有可用的检查点时清理中间文件并返回 0
+        '''
+        partial_path, checkpoint_path = self._partial_paths(save_path)
+        checkpoint = None
+        if os.path.exists(checkpoint_path) and os.path.exists(partial_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        saved_key = (checkpoint or {}).get("run_key") or {}
+        same_query = checkpoint is not None and all(saved_key.get(key) == run_key[key] for key in ("search_term", "release_date_cutoff"))
+        if not same_query:
+            for path in (partial_path, checkpoint_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return 0
+        # 检查点之后 PubMed 又新增了记录时，结果列表整体后移，回退相应的条数，重复的 PMID 写入时会被跳过
+        start = max(0, checkpoint["next_retstart"] - max(0, run_key["total"] - saved_key["total"]))
+        print(f"Resuming from record {start} ({checkpoint['rows']} records already saved)")
+        return start
+
+
+    def _write_batches_to_excel(self, batches, grab_total, save_path, run_key=None, start=0):
+        '''
+        流式写出：每批数据先追加到 save_path + ".partial.csv" 并 flush，同时更新检查点 (下一个 retstart)
+        全部完成后把中间文件流式转换为 save_path 的格式（Excel 用 openpyxl write_only 模式，Parquet/Feather 按批写出），然后删除中间文件
+        内存占用只与单批大小有关；中途中断时可从检查点继续（见 _resume_start）
+        每批返回的记录数与请求的 retmax 比较，重试后仍不足的批次记入检查点，结束时写出 save_path + ".missing.json" 并给出警告
+        '''
+        partial_path, checkpoint_path = self._partial_paths(save_path)
+        missing_path = save_path + ".missing.json"
+        keys = list(self.excel_property_dic)
+        seen = set()
+        rows_written = 0
+        # [[retstart, retmax, 实际条数], ...]
+        short_batches = []
+        if start and os.path.exists(partial_path):
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path, "r", encoding="utf-8") as f:
+                    short_batches = json.load(f).get("short_batches", [])
+            # 继续上次中断的运行：记下已写入的 PMID 用于去重
+            with open(partial_path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                seen.update(row[0] for row in reader if row)
+            rows_written = len(seen)
+            partial_file = open(partial_path, "a", encoding="utf-8", newline="")
+            writer = csv.writer(partial_file)
+        else:
+            partial_file = open(partial_path, "w", encoding="utf-8", newline="")
+            writer = csv.writer(partial_file)
+            writer.writerow([self.excel_header_dic[key] for key in keys])
+
+        from tqdm import tqdm
+        with partial_file, tqdm(total=grab_total, initial=min(start, grab_total), desc="getting pubmed info") as pbar:
+            for retstart, retmax, records in batches:
+                if len(records) < retmax:
+                    short_batches.append([retstart, retmax, len(records)])
+                with run_metrics.stage("write_partial") as stage:
+                    for record in records:
+                        pmid = str(record.get("PMID", ""))
+                        if pmid in seen:
+                            continue
+                        seen.add(pmid)
+                        writer.writerow([record.get(key, "") for key in keys])
+                        rows_written += 1
+                    partial_file.flush()
+                    os.fsync(partial_file.fileno())
+                    _write_json_atomic(checkpoint_path, {"run_key": run_key, "next_retstart": retstart + retmax, "rows": rows_written,
+                                                         "short_batches": short_batches})
+                    stage.add(records=len(records))
+                pbar.update(retmax)
+
+        # 按 save_path 的扩展名转换格式
+        with run_metrics.stage("convert_table") as stage:
+            table_io.convert_table(partial_path, save_path)
+            stage.add(records=rows_written)
+        os.remove(partial_path)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print(f"Data saved to {save_path}")
+        print(f"Total records written: {rows_written}")
+        if short_batches:
+            missing = sum(retmax - count for _, retmax, count in short_batches)
+            _write_json_atomic(missing_path, {"run_key": run_key, "missing": missing, "short_batches": short_batches})
+            print(f"Warning: {missing} records were not returned by PubMed after retries ({len(short_batches)} short batches), see {missing_path}")
+        elif os.path.exists(missing_path):
+            os.remove(missing_path)
+
+
+    def _iter_cached_batches(self, api_key, search_term, release_date_cutoff, grab_total, cache, batch_size=None, max_workers=None):
+        '''
+        使用本地缓存的获取流程：
+        1. ESearch 取得 PMID 列表，缓存中没有的或被修订过的记录先获取并写入缓存（见 _sync_cache）
+        2. 按 ESearch 顺序从缓存读出，yield (retstart, records)
+        '''
+        if isinstance(cache, str):
+            cache = RecordCache(cache)
+        pmids = self._sync_cache(api_key, search_term, release_date_cutoff, grab_total, cache, batch_size, max_workers)
+        yield from self._iter_store_batches(cache, pmids)
+        cache.evict()
+
+
+    def _iter_store_batches(self, cache, pmids, step=500):
+        # 按 pmids 的顺序分段从缓存读出，yield (retstart, retmax, records)
+        for retstart in range(0, len(pmids), step):
+            chunk = pmids[retstart:retstart + step]
+            found = cache.get_many(chunk)
+            yield retstart, len(chunk), [found[pmid] for pmid in chunk if pmid in found]
+
+
+    def _sync_cache(self, api_key, search_term, release_date_cutoff, grab_total, cache, batch_size=None, max_workers=None):
+        '''
+        ESearch 取得 PMID 列表；缓存中没有的 PMID，以及上次抓取之后被修订过（ESearch datetype=mdat）的 PMID
+        通过 EPost + EFetch 获取，匹配期刊指标后写入缓存
+        返回 ESearch 顺序的 PMID 列表
+        '''
+        # 先淘汰过期记录，过期的 PMID 会被当作缺失重新获取
+        cache.evict()
+
+        pmids = self._esearch_ids(api_key, search_term, release_date_cutoff, limit=grab_total)
+        fetched_times = cache.fetched_times(pmids)
+        revised = set()
+        if fetched_times:
+            # 自最早一次抓取以来被修改过的记录需要重新获取
+            since = time.strftime("%Y/%m/%d", time.localtime(min(fetched_times.values())))
+            modified = self._esearch_ids(api_key, search_term, extra_params={"datetype": "mdat", "mindate": since, "maxdate": "3000"})
+            revised = set(modified) & set(fetched_times)
+        to_fetch = [pmid for pmid in pmids if pmid not in fetched_times or pmid in revised]
+        print(f"Cache hits: {len(fetched_times) - len(revised)}, to fetch: {len(to_fetch)}")
+        self._fetch_into_cache(api_key, to_fetch, cache, batch_size, max_workers)
+        return pmids
+
+
+    def _fetch_into_cache(self, api_key, to_fetch, cache, batch_size=None, max_workers=None):
+        '''
+        通过 EPost + EFetch 获取 to_fetch 中的 PMID，匹配期刊指标后写入缓存（同时更新全文索引）
+        '''
+        # 同一实例中并发运行的查询（如 pubmed_batch）可能同时需要同一篇文章：已被其它查询认领的 PMID 不再获取，等它写入缓存
+        to_fetch, pending = self._claim_pmids(to_fetch)
+        try:
+            if to_fetch:
+                from tqdm import tqdm
+                with tqdm(total=len(to_fetch), desc="fetching uncached records") as pbar:
+                    for _, _, records in self._iter_segment_batches(api_key, self._epost_segments(api_key, to_fetch), batch_size, max_workers):
+                        # 每篇文章只在抓取时匹配一次期刊指标
+                        cache.put_many(self.enrich_records(records))
+                        pbar.update(len(records))
+        finally:
+            self._release_pmids(to_fetch)
+        for event in pending:
+            event.wait()
+
+
+    def _claim_pmids(self, pmids):
+        '''
+        认领要获取的 PMID，返回 (本次认领的 PMID 列表, 需要等待的其它认领的 Event 集合)
+        '''
+        claimed, pending = [], set()
+        event = threading.Event()
+        with self._lock:
+            for pmid in pmids:
+                other = self._inflight.get(pmid)
+                if other is None:
+                    self._inflight[pmid] = event
+                    claimed.append(pmid)
+                else:
+                    pending.add(other)
+        return claimed, pending
+
+
+    def _release_pmids(self, pmids):
+        # 获取结束（成功或失败）后释放认领，唤醒等待的查询
+        events = set()
+        with self._lock:
+            for pmid in pmids:
+                events.add(self._inflight.pop(pmid))
+        for event in events:
+            event.set()
+
+
+    def _esearch(self, api_key, search_term, release_date_cutoff=None, extra_params=None):
+        '''
+        ESearch 并保存结果到 NCBI history server
+        返回 (总数, WebEnv, query_key)
+        '''
+        root = self._esearch_request(api_key, search_term, release_date_cutoff, {**(extra_params or {}), "usehistory": "y", "retmax": 0})
+        total = int(root.find("Count").text)
+        webenv = root.find("WebEnv").text
+        query_key = root.find("QueryKey").text
+        return total, webenv, query_key
+
+
+    def _esearch_ids(self, api_key, search_term, release_date_cutoff=None, limit=None, extra_params=None):
+        '''
+        ESearch 并返回 PMID 列表（字符串），每次最多取 10000 个，最多取 limit 个
+        '''
+        pmids = []
+        while limit is None or len(pmids) < limit:
+            params = dict(extra_params or {})
+            params["retstart"] = len(pmids)
+            params["retmax"] = _HISTORY_CAP - len(pmids) if limit is None else min(_HISTORY_CAP, limit) - len(pmids)
+            root = self._esearch_request(api_key, search_term, release_date_cutoff, params)
+            count = int(root.find("Count").text)
+            if count > _HISTORY_CAP and (limit is None or limit > _HISTORY_CAP):
+                # 超过翻页上限：按日期切片分别取 PMID
+                return self._esearch_ids_partitioned(api_key, search_term, release_date_cutoff, limit, extra_params)
+            page = [id_node.text for id_node in root.iter("Id")]
+            pmids.extend(page)
+            if len(page) < params["retmax"] or len(pmids) >= count or params["retmax"] <= 0:
+                break
+        return pmids
+
+
+    def _esearch_ids_partitioned(self, api_key, search_term, release_date_cutoff=None, limit=None, extra_params=None, max_workers=None):
+        '''
+        按日期切片（见 _plan_date_slices）并发 ESearch，返回去重后的 PMID 列表，切片从新到旧排列，最多 limit 个
+        '''
+        slices = self._plan_date_slices(api_key, search_term, release_date_cutoff, extra_params, max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers or 4) as executor:
+            # 每片最多取 _HISTORY_CAP 个，单日超过上限的切片不会再次切分
+            pages = executor.map(lambda item: self._esearch_ids(api_key, search_term, None, limit=min(item[1], _HISTORY_CAP), extra_params=item[0]),
+                                 slices)
+            pmids = list(dict.fromkeys(pmid for page in pages for pmid in page))
+        return pmids if limit is None else pmids[:limit]
+
+
+    def _history_segments(self, api_key, search_term, release_date_cutoff, grab_total, max_workers=None):
+        '''
+        按日期切片并发 ESearch（usehistory），返回 [(WebEnv, query_key, 条数)]，切片从新到旧排列，条数合计最多 grab_total
+        '''
+        slices = self._plan_date_slices(api_key, search_term, release_date_cutoff, None, max_workers)
+        # 只对需要的切片建立 history
+        needed, remaining = [], grab_total
+        for params, count in slices:
+            if remaining <= 0:
+                break
+            needed.append(params)
+            remaining -= min(count, _HISTORY_CAP)
+        print(f"Partitioning {grab_total} records into {len(needed)} date slices of at most {_HISTORY_CAP}")
+        with ThreadPoolExecutor(max_workers=max_workers or 4) as executor:
+            histories = list(executor.map(lambda params: self._esearch(api_key, search_term, None, params), needed))
+        segments, remaining = [], grab_total
+        for total, webenv, query_key in histories:
+            count = min(total, _HISTORY_CAP, remaining)
+            if count > 0:
+                segments.append((webenv, query_key, count))
+                remaining -= count
+        return segments
+
+
+    def _plan_date_slices(self, api_key, search_term, release_date_cutoff=None, extra_params=None, max_workers=None):
+        '''
+        把检索按日期递归二分，直到每个切片的结果数不超过 _HISTORY_CAP，每一层的计数请求并发进行
+        日期类型和范围取自 extra_params 的 datetype/mindate/maxdate，默认按 Entrez 日期 (EDAT)：
+        有 release_date_cutoff 时为最近若干天，否则为 1800/01/01 至今天
+        返回 [(ESearch 参数 {datetype, mindate, maxdate, ...}, 结果数)]，按日期从新到旧排列
+        单日的结果仍超过上限时无法再分，该切片只能取到前 _HISTORY_CAP 条，并给出警告
+        '''
+        params = dict(extra_params or {})
+        datetype = params.pop("datetype", "edat")
+        today = date.today()
+        if "mindate" in params:
+            low = _parse_entrez_date(params.pop("mindate"))
+        elif release_date_cutoff:
+            low = today - timedelta(days=int(release_date_cutoff))
+        else:
+            low = date(1800, 1, 1)
+        high = min(_parse_entrez_date(params.pop("maxdate"), end=True), today) if "maxdate" in params else today
+
+        def slice_params(first, last):
+            return {**params, "datetype": datetype, "mindate": first.strftime("%Y/%m/%d"), "maxdate": last.strftime("%Y/%m/%d")}
+
+        def count(span):
+            root = self._esearch_request(api_key, search_term, None, {**slice_params(*span), "retmax": 0})
+            return int(root.find("Count").text)
+
+        slices = []
+        pending = [(low, high)]
+        with ThreadPoolExecutor(max_workers=max_workers or 4) as executor:
+            while pending:
+                split = []
+                for (first, last), total in zip(pending, executor.map(count, pending)):
+                    if total == 0:
+                        continue
+                    if total <= _HISTORY_CAP or first == last:
+                        if total > _HISTORY_CAP:
+                            print(f"Warning: {total} records on {first:%Y/%m/%d} alone, only the first {_HISTORY_CAP} can be fetched")
+                        slices.append((first, last, total))
+                    else:
+                        middle = first + (last - first) // 2
+                        split += [(first, middle), (middle + timedelta(days=1), last)]
+                pending = split
+        slices.sort(key=lambda item: item[0], reverse=True)
+        return [(slice_params(first, last), total) for first, last, total in slices]
+
+
+    def _esearch_request(self, api_key, search_term, release_date_cutoff=None, extra_params=None):
         esearch_params = {
             "db": "pubmed",
             "term": search_term,
-            "api_key": api_key,
-            "usehistory": "y",
-            "retmax": 0  # 只获取总数
+            "api_key": api_key
         }
-        
+        esearch_params.update(extra_params or {})
+
         # 添加日期范围限制
         if release_date_cutoff:
             esearch_params["reldate"] = release_date_cutoff
-        
-        print("Searching PubMed...")
-        esearch_response = requests.get(esearch_url, params=esearch_params)
-        esearch_data = esearch_response.text
-        
+
+        with run_metrics.stage("esearch") as stage:
+            esearch_response = self._request(api_key, "GET", "esearch.fcgi", params=esearch_params, timeout=(10, 120))
+            esearch_data = esearch_response.text
+            stage.add(requests=1, bytes=len(esearch_response.content))
+
         # 解析搜索结果
         import xml.etree.ElementTree as ET
-        root = ET.fromstring(esearch_data)
-        total = int(root.find("Count").text)
-        webenv = root.find("WebEnv").text
-        query_key = root.find("QueryKey").text
-        
-        print(f"Find total: {total}")
-        
-        if grab_total is None or grab_total > total:
-            grab_total = total
-        
-        # 初始化Excel
-        self.excel_property_dic = {token:index for index, token in enumerate(["PMID", "TI", "TA", "IF", "Quartile", "JCR_Quartile", "Top", "OA", "LR", "AB", "LID"], start=1)}
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.cell(row=1, column=self.excel_property_dic["PMID"]).value = "PMID"
-        ws.cell(row=1, column=self.excel_property_dic["TI"]).value = "Title"
-        ws.cell(row=1, column=self.excel_property_dic["TA"]).value = "Journal"
-        ws.cell(row=1, column=self.excel_property_dic["IF"]).value = "IF"
-        ws.cell(row=1, column=self.excel_property_dic["Quartile"]).value = "JCR_Quartile"
-        ws.cell(row=1, column=self.excel_property_dic["JCR_Quartile"]).value = "CSA_Quartile"
-        ws.cell(row=1, column=self.excel_property_dic["Top"]).value = "Top"
-        ws.cell(row=1, column=self.excel_property_dic["OA"]).value = "Open Access"
-        ws.cell(row=1, column=self.excel_property_dic["LR"]).value = "publish_date"
-        ws.cell(row=1, column=self.excel_property_dic["AB"]).value = "Abstract"
-        ws.cell(row=1, column=self.excel_property_dic["LID"]).value = "DOI"
-
-        # 步骤2: EFetch - 获取详细信息
-        cur_row = 2
-        efetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-        
-        for step in trange(0, (grab_total + grab_step - 1) // grab_step, desc="getting pubmed info"):
+        return ET.fromstring(esearch_data)
+
+
+    def _epost(self, api_key, pmids):
+        '''
+        EPost 上传 PMID 列表到 history server（POST，避免 URL 过长）
+        返回 (WebEnv, query_key)
+        '''
+        epost_data = {
+            "db": "pubmed",
+            "id": ",".join(str(pmid) for pmid in pmids),
+            "api_key": api_key
+        }
+        with run_metrics.stage("epost") as stage:
+            epost_response = self._request(api_key, "POST", "epost.fcgi", data=epost_data, timeout=(10, 120))
+            stage.add(requests=1, bytes=len(epost_response.content))
+
+        import xml.etree.ElementTree as ET
+        root = ET.fromstring(epost_response.text)
+        return root.find("WebEnv").text, root.find("QueryKey").text
+
+
+    def _request(self, api_key, method, endpoint, retry_errors=True, **kwargs):
+        '''
+        发送一次 E-utilities 请求（经过令牌桶限速），返回状态码为 200 的响应
+        429 和服务器错误按指数退避重试，429 优先按 Retry-After 等待，并让共享限速器的所有请求一起暂停；
+        retry_errors 为 True 时超时和连接错误同样重试；重试 self.max_retries 次后仍失败、或其它 HTTP 错误时抛出异常
+        '''
+        import requests
+        limiter = self._get_rate_limiter(api_key)
+        session = self._get_session()
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                response = session.request(method, EUTILS_BASE_URL + endpoint, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                run_metrics.add(endpoint.split(".")[0], calls=0, retries=1)
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+                continue
+            if response.status_code in _RETRY_STATUS and attempt < self.max_retries:
+                run_metrics.add(endpoint.split(".")[0], calls=0, retries=1)
+                delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+                if response.status_code == 429:
+                    limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            if response.status_code != 200:
+                response.close()
+                response.raise_for_status()
+            return response
+
+
+    def _epost_segments(self, api_key, pmids):
+        '''
+        按 history server 的翻页上限分段 EPost，返回 _iter_segment_batches 使用的 [(WebEnv, query_key, 条数)]
+        '''
+        segments = []
+        for i in range(0, len(pmids), _HISTORY_CAP):
+            chunk = pmids[i:i + _HISTORY_CAP]
+            segments.append((*self._epost(api_key, chunk), len(chunk)))
+        return segments
+
+
+    def _get_rate_limiter(self, api_key):
+        # 同一个实例的所有请求共享一个令牌桶
+        with self._lock:
+            if self.rate_limiter is None:
+                self.rate_limiter = _TokenBucket.for_api_key(api_key)
+            return self.rate_limiter
+
+
+    def _get_session(self):
+        # 同一个实例的所有请求共用一个连接池，不再每次请求都新建 TCP/TLS 连接
+        with self._lock:
+            if self.session is None:
+                self.session = _make_session()
+            return self.session
+
+
+    def _iter_efetch_batches(self, api_key, webenv, query_key, grab_total, batch_size=None, max_workers=None, start=0):
+        '''
+        在 WebEnv/query_key 上从 start 开始并发执行 EFetch，同时在途的请求数为 max_workers，
+        总速率由令牌桶控制；批大小由 _BatchSizer 决定（batch_size 为 None 时自适应）
+        结果按 retstart 顺序 yield (retstart, retmax, records)
+        '''
+        yield from self._iter_segment_batches(api_key, [(webenv, query_key, grab_total)], batch_size, max_workers, start)
+
+
+    def _iter_segment_batches(self, api_key, segments, batch_size=None, max_workers=None, start=0):
+        '''
+        同 _iter_efetch_batches，但依次获取多个 history 结果 segments = [(WebEnv, query_key, 条数)]（如日期切片），
+        视为一个整体：retstart 为拼接后的全局位置，批次不跨越切片边界，所有切片共用一个滑动窗口、限速器和批大小
+        '''
+        if max_workers is None:
+            max_workers = 8 if api_key else 3
+        sizer = _BatchSizer(batch_size)
+        # 流式读取响应体时连接中断会抛出 ChunkedEncodingError，读超时会以 ConnectionError 抛出
+        import requests
+        read_errors = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+
+        def request(webenv, query_key, retstart, retmax):
             efetch_params = {
                 "db": "pubmed",
-                "retstart": step * grab_step,
-                "retmax": grab_step,
+                "retstart": retstart,
+                "retmax": retmax,
                 "webenv": webenv,
                 "query_key": query_key,
                 "rettype": "medline",
                 "retmode": "text",
                 "api_key": api_key
             }
-            
-            efetch_response = requests.get(efetch_url, params=efetch_params)
-            response_text = efetch_response.text
-            
-            # 修复：使用正则表达式按照 PMID 行来分割记录
-            # PMID行格式为: "PMID- 12345678"
-            record_texts = re.split(r'\n(?=PMID- )', response_text)
-            
-            for record_text in record_texts:
-                if not record_text.strip() or not record_text.startswith('PMID-'):
-                    continue
-                
+            # 429 / 服务器错误在 _request 中退避重试；超时由 fetch 重试，同时让批大小减半
+            with run_metrics.stage("efetch"):
+                efetch_response = self._request(api_key, "GET", "efetch.fcgi", retry_errors=False, params=efetch_params, timeout=(10, 120), stream=True)
+            # NCBI 的 MEDLINE 文本是 UTF-8
+            efetch_response.encoding = 'utf-8'
+            # 边下载边解析，不在内存中保留整个响应体
+            state = {}
+            # 读取响应体的时间记为 efetch 的网络等待，从 parse 中扣除
+            network = [0.0, 0.0]
+            with run_metrics.stage("parse") as parse_stage, efetch_response:
+                chunks = efetch_response.iter_content(chunk_size=1 << 16, decode_unicode=True)
+                if run_metrics.active() is not None:
+                    chunks = _timed_chunks(chunks, network)
+                records = list(_iter_medline_records(chunks, self.excel_property_dic, state, expected=retmax))
+                parse_stage.exclude(*network)
+                parse_stage.add(records=len(records))
+            run_metrics.add("efetch", network[0], network[1], calls=0, requests=1, bytes=efetch_response.raw.tell())
+            # 响应在记录中间被截断时，丢弃最后一条不完整的记录，由下一次请求补齐
+            if records and state['truncated']:
+                records = records[:-1]
+            return records, state['short']
+
+        def fetch(webenv, query_key, retstart, retmax):
+            # 截断补齐、去重、重试和批大小调整见 _BatchFill
+            fill = _BatchFill(retstart, retmax, sizer, self.max_retries)
+            while True:
+                batch = fill.next_request()
+                if batch is None:
+                    return fill.records
+                begin = time.monotonic()
                 try:
-                    # 解析单条记录
-                    records = list(Medline.parse(record_text.split('\n')))
-                    
-                    for record in records:
-                        if 'PMID' not in record:
-                            continue
-                            
-                        # 写入Excel - 每个字段
-                        for key in self.excel_property_dic.keys():
-                            if key not in record:
-                                continue
-                            
-                            key_info = record[key]
-                            
-                            # 处理列表类型的字段
-                            if isinstance(key_info, list):
-                                if key == 'LID':  # DOI 字段
-                                    # 找到包含 [doi] 的项
-                                    doi_items = [item for item in key_info if '[doi]' in item.lower()]
-                                    if doi_items:
-                                        key_info = doi_items[0]
-                                    elif key_info:
-                                        key_info = key_info[0]
-                                    else:
-                                        key_info = ''
-                                elif key == 'LR':  # 日期字段 - 取最新的（第一个）
-                                    key_info = key_info[0] if key_info else ''
-                                else:
-                                    # 其他列表字段不应该出现在这些关键字段中
-                                    # 如果出现，用分号连接
-                                    key_info = '; '.join(str(x) for x in key_info)
-                            
-                            ws.cell(row=cur_row, column=self.excel_property_dic[key]).value = key_info
-                        
-                        cur_row += 1
-                        
-                except Exception as e:
-                    print(f"解析记录时出错: {e}")
-                    continue
-            
-            time.sleep(0.5)  # 遵守API限制
-
-        wb.save(save_path)
-        print(f"Data saved to {save_path}")
-        print(f"Total records written: {cur_row - 2}")
-        
-        
-    def embed_IF_into_excel(self, excel_path, jcr_csa_path="E:\\Python\\GrabPubmed\\JCR_CSA_2025.xlsx"):
+                    records, short = request(webenv, query_key, *batch)
+                except read_errors:
+                    delay = fill.failed(time.monotonic() - begin)
+                    if delay is None:
+                        raise
+                else:
+                    delay = fill.received(records, short, time.monotonic() - begin)
+                if delay:
+                    time.sleep(delay)
+
+        def submit(executor, batch):
+            position, retmax, webenv, query_key, retstart = batch
+            return position, retmax, executor.submit(fetch, webenv, query_key, retstart, retmax)
+
+        ranges = _plan_batches(segments, sizer, start)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 滑动窗口：最多 2*max_workers 个批次在途或待写入，保证内存有界
+            pending = deque()
+            for batch in ranges:
+                pending.append(submit(executor, batch))
+                if len(pending) >= 2 * max_workers:
+                    break
+            while pending:
+                retstart, retmax, future = pending.popleft()
+                records = future.result()
+                next_batch = next(ranges, None)
+                if next_batch is not None:
+                    pending.append(submit(executor, next_batch))
+                yield retstart, retmax, records
+
+
+    def _parse_medline_text(self, response_text):
+        '''
+        解析一次 EFetch 返回的 MEDLINE 文本，返回 [{字段: 值}] 列表
+        只保留 excel_property_dic 中的字段
+        '''
+        return list(_iter_medline_records([response_text], self.excel_property_dic))
+
+
+    @run_metrics.timed("embed_IF_into_excel")
+    def embed_IF_into_excel(self, excel_path, jcr_csa_path=DEFAULT_JCR_CSA_PATH):
         '''
         从本地JCR_CSA_2025.xlsx获取IF、JCR分区、CSA分区信息并保存到excel
         使用pandas进行数据匹配，支持MedAbbr字段匹配
+        excel_path 也可以是 .parquet / .feather / .csv 文件，按原格式读写
         '''
-
-        # 加载JCR_CSA数据（指定字段类型防止自动转换）
-        dtype_spec = {
-            'CAS_Quartile': 'string', 
-            'JIF_Quartile': 'string', 
-            'JIF_2024': 'string', 
-            'ISSN': 'string', 
-            'eISSN': 'string'
-        }
-        jcr_csa_df = pd.read_excel(jcr_csa_path, dtype=dtype_spec)
-        
-        # 创建MedAbbr到信息的映射字典（转大写用于匹配）
-        jcr_csa_dict = {}
-        for _, row in jcr_csa_df.iterrows():
-            med_abbr = row.get('MedAbbr')
-            if pd.notna(med_abbr):
-                key = str(med_abbr).strip().upper()
-                jcr_csa_dict[key] = {
-                    'JIF_2024': row.get('JIF_2024', 'N/A'),
-                    'JIF_Quartile': row.get('JIF_Quartile', 'N/A'),
-                    'CAS_Quartile': row.get('CAS_Quartile', 'N/A')
-                }
-        
         # 加载目标Excel
-        query_df = pd.read_excel(excel_path)
-        
-        # 删除旧的IF相关列（如果存在）
-        cols_to_drop = ['IF', 'JCR_Quartile', 'CSA_Quartile', 'Top', 'Open Access']
-        existing_cols = [col for col in cols_to_drop if col in query_df.columns]
-        if existing_cols:
-            query_df = query_df.drop(columns=existing_cols)
-        
-        # 匹配统计
-        match_stats = {
-            'exact_match': 0,
-            'no_match': 0
-        }
-        
-        # 新增列用于存储匹配结果
-        jif_2024_list = []
-        jif_quartile_list = []
-        cas_quartile_list = []
-        
-        # 遍历每条记录进行匹配
-        for _, row in query_df.iterrows():
-            journal_name = row.get('Journal')
-            
-            if pd.isna(journal_name):
-                jif_2024_list.append('N/A')
-                jif_quartile_list.append('N/A')
-                cas_quartile_list.append('N/A')
-                continue
-            
-            # 转大写匹配
-            journal_key = str(journal_name).strip().upper()
-            
-            if journal_key in jcr_csa_dict:
-                # 精确匹配
-                match_info = jcr_csa_dict[journal_key]
-                jif_2024_list.append(match_info['JIF_2024'])
-                jif_quartile_list.append(match_info['JIF_Quartile'])
-                cas_quartile_list.append(match_info['CAS_Quartile'])
-                match_stats['exact_match'] += 1
-            else:
-                # 未匹配
-                jif_2024_list.append('N/A')
-                jif_quartile_list.append('N/A')
-                cas_quartile_list.append('N/A')
-                match_stats['no_match'] += 1
-        
-        # 添加新列到DataFrame
-        query_df['IF'] = jif_2024_list
-        query_df['JCR_Quartile'] = jif_quartile_list
-        query_df['CSA_Quartile'] = cas_quartile_list
-        
-        # 统一缺失值表示
-        query_df = query_df.fillna('N/A')
-        
+        with run_metrics.stage("read_table") as stage:
+            query_df = table_io.read_table(excel_path)
+            stage.add(records=len(query_df))
+
+        query_df, match_stats = self.enrich_journal_metrics(query_df, jcr_csa_path)
+
         # 保存结果
-        query_df.to_excel(excel_path, index=False, sheet_name='Sheet')
-        
+        with run_metrics.stage("write_table") as stage:
+            table_io.write_table(query_df, excel_path)
+            stage.add(records=len(query_df))
+
         # 打印匹配报告
         total_journals = len(query_df)
         print("\n" + "="*60)
         print("期刊信息匹配报告")
         print("="*60)
         print(f"总期刊数: {total_journals}\n")
-        print(f"精确匹配: {match_stats['exact_match']} ({match_stats['exact_match']/total_journals*100:.1f}%)")
-        print(f"未匹配: {match_stats['no_match']} ({match_stats['no_match']/total_journals*100:.1f}%)")
+        for key, label in (('issn_match', 'ISSN匹配'), ('abbr_match', 'MedAbbr匹配'), ('fuzzy_match', '模糊匹配'), ('no_match', '未匹配')):
+            print(f"{label}: {match_stats[key]} ({match_stats[key]/max(total_journals, 1)*100:.1f}%)")
         print("="*60)
-        
+
         return query_df
+
+
+    def enrich_journal_metrics(self, query_df, jcr_csa_path=DEFAULT_JCR_CSA_PATH):
+        '''
+        在内存中为 DataFrame 添加 IF、JCR_Quartile、CSA_Quartile 列，不读写任何文件
+        依次按 ISSN（ISSN 列，没有时用 IS 列）、MedAbbr（Journal 列，没有时用 TA 列）、模糊刊名匹配
+
+        Returns:
+        --------
+        (新的 DataFrame, 各层匹配统计 {'issn_match': n, 'abbr_match': n, 'fuzzy_match': n, 'no_match': n})
+        '''
+        import pandas as pd
+        index = self._load_journal_index(jcr_csa_path)
+
+        # 删除旧的IF相关列（如果存在）
+        cols_to_drop = ['IF', 'JCR_Quartile', 'CSA_Quartile', 'Top', 'Open Access']
+        existing_cols = [col for col in cols_to_drop if col in query_df.columns]
+        if existing_cols:
+            query_df = query_df.drop(columns=existing_cols)
+        else:
+            query_df = query_df.copy()
+
+        def column(*names):
+            for name in names:
+                if name in query_df.columns:
+                    return query_df[name]
+            return pd.Series(pd.NA, index=query_df.index)
+        journals = column('Journal', 'TA')
+        issns = column('ISSN', 'IS')
+
+        # 相同的 (期刊, ISSN) 只匹配一次，再按行号整列取值
+        with run_metrics.stage("journal_match") as stage:
+            positions, tiers = index.match_many(journals, issns)
+            stage.add(records=len(query_df))
+        matched = positions >= 0
+        for name, source in (('IF', 'JIF_2024'), ('JCR_Quartile', 'JIF_Quartile'), ('CSA_Quartile', 'CAS_Quartile')):
+            values = index.table[source].to_numpy(dtype=object)[positions]
+            values[~matched] = 'N/A'
+            query_df[name] = values
+
+        # 统一缺失值表示
+        query_df = query_df.fillna('N/A')
+
+        match_stats = {
+            'issn_match': int((tiers == 'issn').sum()),
+            'abbr_match': int((tiers == 'med_abbr').sum()),
+            'fuzzy_match': int((tiers == 'fuzzy').sum()),
+            'no_match': int((~matched & (journals.notna() | issns.notna()).to_numpy()).sum())
+        }
+        return query_df, match_stats
+
+
+    def enrich_records(self, records, jcr_csa_path=DEFAULT_JCR_CSA_PATH):
+        '''
+        为记录流（{字段: 值}，如 EFetch 解析出的记录）逐条添加 IF、Quartile、JCR_Quartile 字段
+        按 IS、TA 字段匹配，字段名与 excel_property_dic 一致；未匹配的期刊为 'N/A'
+        '''
+        import pandas as pd
+        index = self._load_journal_index(jcr_csa_path)
+        table = index.table.to_numpy(dtype=object)
+        matches = {}
+        for record in records:
+            key = (record.get('TA'), record.get('IS'))
+            if key not in matches:
+                matches[key] = index.match(*key)[0]
+            position = matches[key]
+            metrics = table[position] if position >= 0 else ('N/A', 'N/A', 'N/A')
+            record['IF'], record['Quartile'], record['JCR_Quartile'] = (value if pd.notna(value) else 'N/A' for value in metrics)
+            yield record
+
+
+    def _load_journal_index(self, jcr_csa_path):
+        '''
+        返回 journal_index.JournalIndex（ISSN / MedAbbr / 模糊刊名索引）
+        使用编译好的期刊索引文件，每个进程只解析一次 xlsx
+        '''
+        with run_metrics.stage("journal_index"):
+            return journal_index.load_journal_index(jcr_csa_path)
     
 def download_pdf(self, excel_path, pdf_savepath, IF_cutoff):
         '''
         try to download paper which IF higher than cutoff
         warning: very low successful rate
         '''
-        
+        import openpyxl
+        import requests
+        from bs4 import BeautifulSoup
+        from tqdm import trange
+
         wb = openpyxl.load_workbook(excel_path)
         ws = wb["Sheet"]
         base_url = "https://sci-hub.tw/"
@@ -0,0 +1,327 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# 数据库结构版本（PRAGMA user_version）：1 起增加全文索引和期刊指标表
+_SCHEMA_VERSION = 1
+# search() 的排序方式
+_SEARCH_ORDERS = {
+    # 标题命中的权重高于摘要
+    'rank': "bm25(records_fts, 10.0, 1.0)",
+    'if': "a.impact_factor IS NULL, a.impact_factor DESC",
+    'date': "a.publish_date DESC",
+}
+
+
+class RecordCache():
+    '''
+    本地持久化的记录缓存（SQLite），以 PMID 为键保存解析后的记录
+    同时保存 LR（最后修订日期）和抓取时间，用于判断记录是否需要重新获取
+    也可以作为多个查询共用的文章库：每个查询只保存 PMID 列表（按 ESearch 顺序）和查询信息，同一篇文章只保存一份
+    标题和摘要建有 FTS5 全文索引，期刊指标（IF、分区）单独成表，search() 在本地检索已经获取过的所有文章
+
+    Parameters:
+    -----------
+    db_path : str
+        SQLite 数据库路径
+    max_records : int, optional
+        最多保留的记录数，超出时按最近访问时间淘汰，默认为None（不限）；已保存的查询中的文章不被淘汰
+    max_age_days : float, optional
+        记录抓取后最多保留的天数，超出后被淘汰（下次会重新获取），默认为None（不限）；已保存的查询中的文章不被淘汰
+    '''
+    def __init__(self, db_path="./paper_donload/pubmed_cache.sqlite", max_records=None, max_age_days=None):
+        self.db_path = db_path
+        self.max_records = max_records
+        self.max_age_days = max_age_days
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " pmid TEXT PRIMARY KEY,"
+            " lr TEXT,"
+            " record TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_accessed ON records (accessed_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            " name TEXT PRIMARY KEY,"
+            " info TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_members ("
+            " name TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " pmid TEXT NOT NULL,"
+            " PRIMARY KEY (name, position))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_members_pmid ON query_members (pmid)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " pmid TEXT PRIMARY KEY,"
+            " journal TEXT,"
+            " impact_factor REAL,"
+            " jcr_quartile TEXT,"
+            " cas_quartile TEXT,"
+            " publish_date TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_if ON articles (impact_factor)")
+        # rowid 为 PMID；保存一份标题和摘要的副本（records 中的记录是 JSON，不能作为外部内容表）
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(title, abstract, tokenize='porter unicode61')")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            # 旧版本的缓存：为已有记录建立索引
+            self._index_all()
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def _index_all(self):
+        cursor = self._conn.execute("SELECT record FROM records")
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            self._index([json.loads(record) for record, in rows])
+
+    def _index(self, records):
+        # 更新全文索引和期刊指标表，调用方持有锁并负责提交
+        self._conn.executemany("INSERT OR REPLACE INTO records_fts (rowid, title, abstract) VALUES (?, ?, ?)",
+                               [(int(record['PMID']), record.get('TI') or '', record.get('AB') or '') for record in records])
+        self._conn.executemany("INSERT OR REPLACE INTO articles (pmid, journal, impact_factor, jcr_quartile, cas_quartile, publish_date) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", [_article_row(record) for record in records])
+
+    def get_many(self, pmids):
+        '''
+        返回 {pmid: record}，只包含缓存中存在的 PMID，并更新它们的访问时间
+        '''
+        pmids = [str(pmid) for pmid in pmids]
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(pmids), 500):
+                chunk = pmids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT pmid, record FROM records WHERE pmid IN ({marks})", chunk).fetchall()
+                found.update((pmid, json.loads(record)) for pmid, record in rows)
+                self._conn.execute(f"UPDATE records SET accessed_at = ? WHERE pmid IN ({marks})", [now] + chunk)
+            self._conn.commit()
+        return found
+
+    def put_many(self, records):
+        '''
+        写入（或覆盖）记录，record 为 {字段: 值} 字典，必须包含 PMID
+        '''
+        now = time.time()
+        records = [record for record in records if record.get('PMID')]
+        rows = [(str(record['PMID']), record.get('LR'), json.dumps(record, ensure_ascii=False), now, now) for record in records]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO records (pmid, lr, record, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)", rows)
+            self._index(records)
+            self._conn.commit()
+        return len(rows)
+
+    def update_records(self, records):
+        '''
+        更新已有记录的内容（如补上期刊指标），不改变抓取时间，不存在的 PMID 被忽略
+        '''
+        records = [record for record in records if record.get('PMID')]
+        with self._lock:
+            self._conn.executemany("UPDATE records SET record = ? WHERE pmid = ?",
+                                   [(json.dumps(record, ensure_ascii=False), str(record['PMID'])) for record in records])
+            self._index(records)
+            self._conn.commit()
+        return len(records)
+
+    def fetched_times(self, pmids):
+        '''
+        返回 {pmid: 抓取时间戳}，只包含缓存中存在的 PMID
+        '''
+        pmids = [str(pmid) for pmid in pmids]
+        times = {}
+        with self._lock:
+            for i in range(0, len(pmids), 500):
+                chunk = pmids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                times.update(self._conn.execute(f"SELECT pmid, fetched_at FROM records WHERE pmid IN ({marks})", chunk).fetchall())
+        return times
+
+    def evict(self):
+        '''
+        按年龄和数量淘汰记录，返回删除的条数
+        已保存的查询（set_query）中的文章不被淘汰，否则导出这些查询时会缺少文章；drop_query 之后才可以被淘汰
+        '''
+        removed = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute("DELETE FROM records WHERE fetched_at < ? AND pmid NOT IN (SELECT pmid FROM query_members)",
+                                              (cutoff,)).rowcount
+            if self.max_records is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM records WHERE pmid NOT IN (SELECT pmid FROM records ORDER BY accessed_at DESC LIMIT ?)"
+                    " AND pmid NOT IN (SELECT pmid FROM query_members)",
+                    (int(self.max_records),)).rowcount
+            if removed:
+                self._conn.execute("DELETE FROM articles WHERE pmid NOT IN (SELECT pmid FROM records)")
+                self._conn.execute("DELETE FROM records_fts WHERE rowid NOT IN (SELECT CAST(pmid AS INTEGER) FROM records)")
+            self._conn.commit()
+        return removed
+
+    def search(self, query=None, min_if=None, quartiles=None, journal=None, since=None, until=None, order='rank', limit=None):
+        '''
+        在本地检索缓存中的所有文章，返回记录列表 [{字段: 值}]，不访问 NCBI
+
+        Parameters:
+        -----------
+        query : str, optional
+            标题/摘要的检索式，与阅读列表的关键词语法相同：词之间为 AND，支持 OR、NOT、括号、"短语" 和 * 通配符，
+            [tiab] 等字段标签被忽略；默认为None（不按内容筛选）
+        min_if : float, optional
+            最低影响因子
+        quartiles : iterable of str, optional
+            JCR 分区，如 ['Q1', 'Q2']
+        journal : str, optional
+            期刊缩写（TA），不区分大小写
+        since, until : str, optional
+            发布日期（LR）范围，YYYYMMDD 或 YYYY/MM/DD
+        order : str
+            'rank'（相关度，标题命中优先；没有 query 时按日期）、'if'（影响因子从高到低）或 'date'（从新到旧）
+        limit : int, optional
+            最多返回的条数
+        '''
+        if order not in _SEARCH_ORDERS:
+            raise ValueError(f"order must be one of {list(_SEARCH_ORDERS)}")
+        where, params = [], []
+        if query:
+            # 先在全文索引中检索，再按主键取指标和记录
+            sql = "SELECT r.record FROM records_fts CROSS JOIN articles a ON a.pmid = CAST(records_fts.rowid AS TEXT) JOIN records r ON r.pmid = a.pmid"
+            where.append("records_fts MATCH ?")
+            params.append(_fts_query(query))
+        else:
+            sql = "SELECT r.record FROM articles a JOIN records r ON r.pmid = a.pmid"
+            if order == 'rank':
+                order = 'date'
+        if min_if is not None:
+            where.append("a.impact_factor >= ?")
+            params.append(float(min_if))
+        if quartiles:
+            quartiles = [str(quartile).upper() for quartile in quartiles]
+            where.append(f"a.jcr_quartile IN ({','.join('?' * len(quartiles))})")
+            params += quartiles
+        if journal:
+            where.append("a.journal = ? COLLATE NOCASE")
+            params.append(journal.strip())
+        if since:
+            where.append("a.publish_date >= ?")
+            params.append(re.sub(r'\D', '', str(since)))
+        if until:
+            where.append("a.publish_date <= ?")
+            params.append(re.sub(r'\D', '', str(until)).ljust(8, '9'))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {_SEARCH_ORDERS[order]}, a.pmid DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"invalid search query {query!r}: {e}")
+        return [json.loads(record) for record, in rows]
+
+    def set_query(self, name, pmids, info=None):
+        '''
+        保存（或替换）一个查询的 PMID 列表和查询信息（可 JSON 序列化的字典，如查询词、文献类型）
+        '''
+        rows = [(name, position, str(pmid)) for position, pmid in enumerate(pmids)]
+        with self._lock:
+            self._conn.execute("DELETE FROM query_members WHERE name = ?", (name,))
+            self._conn.executemany("INSERT INTO query_members (name, position, pmid) VALUES (?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO queries (name, info, updated_at) VALUES (?, ?, ?)",
+                               (name, json.dumps(info or {}, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def queries(self):
+        '''
+        返回 {查询名: 查询信息}，按查询名排序
+        '''
+        with self._lock:
+            rows = self._conn.execute("SELECT name, info FROM queries ORDER BY name").fetchall()
+        return {name: json.loads(info) for name, info in rows}
+
+    def query_pmids(self, name):
+        '''
+        返回查询的 PMID 列表（按 ESearch 顺序），查询不存在时为空列表
+        '''
+        with self._lock:
+            return [pmid for pmid, in self._conn.execute("SELECT pmid FROM query_members WHERE name = ? ORDER BY position", (name,))]
+
+    def drop_query(self, name):
+        '''
+        删除查询（文章记录保留，由 evict 按年龄和数量淘汰）
+        '''
+        with self._lock:
+            self._conn.execute("DELETE FROM query_members WHERE name = ?", (name,))
+            self._conn.execute("DELETE FROM queries WHERE name = ?", (name,))
+            self._conn.commit()
+
+    def unindexed_metrics(self):
+        '''
+        返回没有期刊指标的 PMID（旧版本写入、未经 enrich_records 的记录）
+        '''
+        with self._lock:
+            return [pmid for pmid, in self._conn.execute("SELECT pmid FROM articles WHERE jcr_quartile IS NULL")]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _article_row(record):
+    # articles 表的一行；记录字段与 pubmed_utils.excel_property_dic 一致（Quartile 为 JCR 分区，JCR_Quartile 为中科院分区）
+    try:
+        impact_factor = float(record.get('IF'))
+    except (TypeError, ValueError):
+        impact_factor = None
+    if impact_factor != impact_factor:
+        impact_factor = None
+    return (str(record['PMID']), record.get('TA'), impact_factor, record.get('Quartile'), record.get('JCR_Quartile'),
+            re.sub(r'\D', '', str(record.get('LR') or '')) or None)
+
+
+# 检索式的词法单元：括号、"短语"、字段标签 [tiab]、其余的词（可带 * 通配符）
+_QUERY_TOKEN = re.compile(r'\s*(?:(\(|\))|"([^"]*)"|\[[^\]]*\]|([^\s()"\[\]]+))')
+
+
+def _fts_query(query):
+    '''
+    把阅读列表的关键词语法转换为 FTS5 检索式：每个词加引号（允许 - 等符号），末尾的 * 保留为前缀匹配
+    '''
+    parts = []
+    for paren, phrase, word in _QUERY_TOKEN.findall(query):
+        if paren:
+            parts.append(paren)
+        elif phrase:
+            parts.append('"' + phrase.replace('"', '') + '"')
+        elif word in ('AND', 'OR', 'NOT'):
+            parts.append(word)
+        elif word:
+            prefix = word.endswith('*')
+            word = word.rstrip('*')
+            if word:
+                parts.append('"' + word + '"' + ('*' if prefix else ''))
+    return ' '.join(parts)
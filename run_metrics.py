@@ -0,0 +1,330 @@
+'''
+可选的运行指标：按阶段记录墙钟时间、CPU 时间、请求数、重试次数、传输字节数、记录数/秒和峰值内存，导出为 JSON 报告
+默认不记录，pubmed_utils 和 html_generate 中的埋点此时只是一次函数调用；在 recording() 中运行时各阶段自动记录
+可以为指定阶段开启 cProfile（每个阶段写出一个 .prof 文件），以及用 tracemalloc 记录最外层阶段内 Python 对象的内存峰值
+
+阶段：
+    esearch / epost          ESearch、EPost 请求（含等待限速器的时间）
+    efetch                   EFetch 的网络等待（发出请求到读完响应体，不含解析）
+    parse                    MEDLINE 解析
+    write_partial            每批记录写入中间 CSV
+    convert_table            中间文件转换为 Excel / Parquet / Feather
+    read_table / write_table embed_IF_into_excel 读写表格
+    journal_index            加载期刊索引
+    journal_match            期刊指标匹配
+    html                     generate_reading_list / append_to_reading_list / generate_sharded_reading_list
+    get_main_info_into_excel 等入口函数的整体时间
+
+Usage:
+    import run_metrics
+    with run_metrics.recording("./paper_donload/run_report.json", profile=["parse", "html"], trace_memory=True):
+        utils.get_main_info_into_excel(api_key, keywords, 365, "Journal Article", None, path)
+        utils.embed_IF_into_excel(path)
+        generate_reading_list(path, html_path)
+'''
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不记录峰值 RSS
+    resource = None
+
+# 计数类指标，add() 的关键字参数
+_COUNTERS = ('requests', 'retries', 'bytes', 'records')
+
+# 当前的 RunReport，None 表示不记录
+_active = None
+
+
+def _peak_rss_mb():
+    # 进程启动以来的峰值常驻内存；Linux 的 ru_maxrss 单位为 KB，macOS 为字节
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+
+class RunReport():
+    '''
+    一次运行的各阶段指标，线程安全
+
+    Parameters:
+    -----------
+    path : str, optional
+        JSON 报告路径，stop() 时写出，默认为None（不写文件）
+    profile : iterable of str or True, optional
+        开启 cProfile 的阶段名，True 表示所有阶段；.prof 文件写在报告旁边（没有报告路径时写在当前目录）
+    trace_memory : bool
+        为True时用 tracemalloc 记录最外层阶段（进入时没有其它阶段在进行，如入口函数）内整个进程的 Python 内存峰值（会明显变慢）；
+        tracemalloc 的峰值是进程级的，嵌套或并发的阶段（如工作线程中的 efetch / parse）不记录，也不重置它
+    profile_prefix : str, optional
+        .prof 文件的路径前缀（写为 <前缀>.<阶段>.prof），默认为报告路径去掉扩展名
+    '''
+    def __init__(self, path=None, profile=(), trace_memory=False, profile_prefix=None):
+        self.path = path
+        self.profile = profile if profile is True else frozenset(profile or ())
+        self.trace_memory = trace_memory
+        self.profile_prefix = profile_prefix or (os.path.splitext(path)[0] if path else 'run_report')
+        self.started = datetime.now()
+        self.finished = None
+        self.stages = {}
+        # {阶段名: .prof 文件路径}，stop() 时写出
+        self.profiles = {}
+        self._profile_stats = {}
+        self._begin = time.perf_counter()
+        self._lock = threading.Lock()
+        # 同一时间只有一个阶段开启 cProfile（Python 3.12 起整个进程只能有一个）
+        self._profiling = False
+        self._started_tracemalloc = False
+        # trace_memory 时正在进行的阶段数（所有线程），只有最外层的阶段重置和记录 tracemalloc 峰值
+        self._open_stages = 0
+
+    def add(self, name, wall=0.0, cpu=0.0, calls=0, **counters):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, **dict.fromkeys(_COUNTERS, 0)}
+            stats['calls'] += calls
+            stats['wall_seconds'] += wall
+            stats['cpu_seconds'] += cpu
+            for key, value in counters.items():
+                if key in _COUNTERS:
+                    stats[key] += value
+                else:
+                    # 峰值类指标取最大值
+                    stats[key] = max(stats.get(key) or 0, value or 0)
+
+    def merge(self, stages):
+        '''
+        合并另一个进程的 to_dict()['stages']（如 HTML 进程池）
+        '''
+        for name, stats in stages.items():
+            stats = {key: value for key, value in stats.items() if key != 'records_per_second'}
+            self.add(name, stats.pop('wall_seconds', 0.0), stats.pop('cpu_seconds', 0.0), stats.pop('calls', 0), **stats)
+
+    def _wants_profile(self, name):
+        return self.profile is True or name in self.profile
+
+    def to_dict(self):
+        import platform
+        with self._lock:
+            stages = {}
+            for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]['wall_seconds']):
+                stats = dict(stats, wall_seconds=round(stats['wall_seconds'], 4), cpu_seconds=round(stats['cpu_seconds'], 4))
+                stats['records_per_second'] = round(stats['records'] / stats['wall_seconds'], 1) if stats['records'] and stats['wall_seconds'] else None
+                stages[name] = stats
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'finished': (self.finished or datetime.now()).isoformat(timespec='seconds'),
+                'wall_seconds': round(time.perf_counter() - self._begin, 3),
+                'peak_rss_mb': _peak_rss_mb(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'stages': stages,
+                'profiles': dict(self.profiles),
+            }
+
+    def save(self, path=None):
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def start(path=None, profile=(), trace_memory=False, profile_prefix=None):
+    '''
+    开始记录，返回 RunReport；参数同 RunReport
+    '''
+    global _active
+    report = RunReport(path, profile, trace_memory, profile_prefix)
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            report._started_tracemalloc = True
+    _active = report
+    return report
+
+
+def stop():
+    '''
+    停止记录，有报告路径时写出 JSON，返回 RunReport（没有在记录时返回 None）
+    '''
+    global _active
+    report, _active = _active, None
+    if report is None:
+        return None
+    report.finished = datetime.now()
+    if report._started_tracemalloc:
+        import tracemalloc
+        tracemalloc.stop()
+    if report._profile_stats and os.path.dirname(report.profile_prefix):
+        os.makedirs(os.path.dirname(report.profile_prefix), exist_ok=True)
+    for name, stats in report._profile_stats.items():
+        # 用 python -m pstats <文件> 或 snakeviz 查看
+        report.profiles[name] = f"{report.profile_prefix}.{name}.prof"
+        stats.dump_stats(report.profiles[name])
+    if report.path:
+        report.save()
+    return report
+
+
+@contextlib.contextmanager
+def recording(path=None, profile=(), trace_memory=False, profile_prefix=None):
+    '''
+    在 with 块中记录指标，结束时写出报告；参数同 RunReport
+    '''
+    report = start(path, profile, trace_memory, profile_prefix)
+    try:
+        yield report
+    finally:
+        stop()
+
+
+def active():
+    '''
+    返回当前的 RunReport，不在记录时返回 None
+    '''
+    return _active
+
+
+def add(name, wall=0.0, cpu=0.0, calls=1, **counters):
+    '''
+    向阶段 name 累加指标（计数：requests, retries, bytes, records）；不在记录时什么也不做
+    '''
+    report = _active
+    if report is not None:
+        report.add(name, wall, cpu, calls, **counters)
+
+
+class _Stage():
+    # stage() 返回的上下文管理器，可在块内用 stage.add(records=...) 追加计数
+    __slots__ = ('report', 'name', 'counters', 'wall', 'cpu', 'profiler', 'trace')
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.counters = {}
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def exclude(self, wall, cpu=0.0):
+        # 从本阶段扣除已记在其它阶段的时间（如 parse 中读取响应体的网络等待）
+        self.wall += wall
+        self.cpu += cpu
+
+    def __enter__(self):
+        report = self.report
+        self.profiler = None
+        # 已有阶段在 profile 时（嵌套或并发的阶段）不再开启；cProfile 只记录开启它的线程
+        if report._wants_profile(self.name):
+            import cProfile
+            with report._lock:
+                if not report._profiling:
+                    report._profiling = True
+                    self.profiler = cProfile.Profile()
+            if self.profiler is not None:
+                self.profiler.enable()
+        self.trace = False
+        if report.trace_memory:
+            import tracemalloc
+            with report._lock:
+                outermost = report._open_stages == 0
+                report._open_stages += 1
+            # reset_peak 影响整个进程：只有最外层的阶段重置，嵌套或并发的阶段不改变它的峰值
+            self.trace = outermost and tracemalloc.is_tracing()
+            if self.trace:
+                tracemalloc.reset_peak()
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        report = self.report
+        counters = dict(self.counters)
+        counters['peak_rss_mb'] = _peak_rss_mb()
+        if report.trace_memory:
+            with report._lock:
+                report._open_stages -= 1
+        if self.trace:
+            import tracemalloc
+            # 包括这段时间内所有线程的分配
+            counters['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1)
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            with report._lock:
+                # 同一阶段多次调用时累加，stop() 时写出
+                stats = report._profile_stats.get(self.name)
+                if stats is None:
+                    report._profile_stats[self.name] = pstats.Stats(self.profiler)
+                else:
+                    stats.add(self.profiler)
+                report._profiling = False
+        report.add(self.name, wall, cpu, 1, **counters)
+        return False
+
+
+class _NullStage():
+    # 不记录时使用的共享空上下文管理器
+    __slots__ = ()
+
+    def add(self, **counters):
+        pass
+
+    def exclude(self, wall, cpu=0.0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    '''
+    记录一个阶段的上下文管理器：墙钟时间、当前线程的 CPU 时间、结束时的峰值 RSS，以及块内 .add() 的计数
+    该阶段在 profile 中时用 cProfile 包裹；trace_memory 时，最外层的阶段记录块内整个进程的 Python 内存峰值
+    CPU 时间只统计进入阶段的线程；工作线程中的工作记在它们自己的阶段（如 efetch / parse）下
+    块内用 .exclude(wall, cpu) 扣除已记在其它阶段的时间
+
+        with run_metrics.stage("journal_match") as s:
+            ...
+            s.add(records=len(df))
+    '''
+    report = _active
+    if report is None:
+        return _NULL_STAGE
+    return _Stage(report, name)
+
+
+def timed(name):
+    '''
+    函数装饰器，等价于用 stage(name) 包裹整个函数体
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,246 @@
+'''
+文章表的读写，供 pubmed_utils 和 html_generate 共用
+按扩展名选择格式：.xlsx/.xls (Excel)、.parquet、.feather/.arrow（列式，需要 pyarrow），其它按 CSV 处理
+Parquet/Feather 可以作为各阶段之间的中间格式，Excel 只在需要时作为最后一步导出
+pandas、openpyxl、pyarrow 在用到时才导入：逐行读写 CSV 不需要它们
+'''
+import csv
+import os
+import tempfile
+
+# 列式格式每批写出的行数
+_ARROW_BATCH_ROWS = 10000
+
+
+def table_format(path):
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext in ('.xls', '.xlsx'):
+        return 'excel'
+    if ext == '.parquet':
+        return 'parquet'
+    if ext in ('.feather', '.arrow'):
+        return 'feather'
+    return 'csv'
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet/Feather 读写需要 pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def read_table(path, columns=None):
+    '''
+    读取整张表为 DataFrame，columns 给出时只读取这些列
+    '''
+    import pandas as pd
+    fmt = table_format(path)
+    if fmt == 'excel':
+        return pd.read_excel(path, sheet_name=0, usecols=columns)
+    if fmt == 'parquet':
+        _require_pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    if fmt == 'feather':
+        _require_pyarrow()
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_table(df, path):
+    '''
+    把 DataFrame 写到 path（先写临时文件再替换）
+    '''
+    fmt = table_format(path)
+    with _atomic_path(path) as tmp_path:
+        if fmt == 'excel':
+            df.to_excel(tmp_path, index=False, sheet_name='Sheet')
+        elif fmt == 'parquet':
+            _require_pyarrow()
+            df.to_parquet(tmp_path, index=False)
+        elif fmt == 'feather':
+            _require_pyarrow()
+            df.reset_index(drop=True).to_feather(tmp_path)
+        else:
+            df.to_csv(tmp_path, index=False)
+
+
+def iter_rows(path):
+    '''
+    流式读取表格，返回 (表头, 行迭代器)，每行是与表头对应的值列表，缺失值为 None
+    '''
+    fmt = table_format(path)
+    if fmt == 'excel':
+        return _iter_excel_rows(path)
+    if fmt in ('parquet', 'feather'):
+        return _iter_arrow_rows(path, fmt)
+    return _iter_csv_rows(path)
+
+
+def write_rows(path, header, rows, schema=None):
+    '''
+    流式写出表格（先写临时文件再替换），内存占用与行数无关
+    schema 为 pyarrow.Schema 时按它写列式格式，否则所有列按字符串处理
+    '''
+    fmt = table_format(path)
+    with _atomic_path(path) as tmp_path:
+        if fmt == 'excel':
+            import openpyxl
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet('Sheet')
+            ws.append(list(header))
+            for row in rows:
+                ws.append(list(row))
+            wb.save(tmp_path)
+        elif fmt in ('parquet', 'feather'):
+            _write_arrow_rows(tmp_path, fmt, header, rows, schema)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(['' if value is None else value for value in row] for row in rows)
+
+
+def convert_table(src_path, dst_path):
+    '''
+    流式转换表格格式，例如 Parquet -> Excel 导出
+    '''
+    header, rows = iter_rows(src_path)
+    write_rows(dst_path, header, rows, schema=_arrow_schema(src_path))
+
+
+def append_rows(path, records):
+    '''
+    按表头名称把 records（[{表头: 值}]）追加到已有表格末尾，不认识的列被忽略
+    逐行复制原有内容后整体替换，内存占用与文件大小无关
+    '''
+    header, rows = iter_rows(path)
+    columns = {name: index for index, name in enumerate(header) if name}
+
+    def new_rows():
+        for record in records:
+            row = [None] * len(header)
+            for name, value in record.items():
+                if name in columns:
+                    row[columns[name]] = value
+            yield row
+
+    def all_rows():
+        yield from rows
+        yield from new_rows()
+
+    write_rows(path, header, all_rows(), schema=_arrow_schema(path))
+
+
+class _atomic_path():
+    # with _atomic_path(path) as tmp_path: 写到同目录的临时文件，成功后替换 path
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        ext = os.path.splitext(self.path)[1]
+        fd, self.tmp_path = tempfile.mkstemp(suffix=ext, dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(fd)
+        return self.tmp_path
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return False
+
+
+def _iter_excel_rows(path):
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True)
+    ws = wb.active
+    rows = ws.iter_rows(values_only=True)
+    header = list(next(rows, ()))
+
+    def generate():
+        try:
+            yield from (list(row) for row in rows)
+        finally:
+            wb.close()
+    return header, generate()
+
+
+def _iter_csv_rows(path):
+    f = open(path, 'r', encoding='utf-8', newline='')
+    reader = csv.reader(f)
+    header = next(reader, [])
+
+    def generate():
+        with f:
+            for row in reader:
+                yield [value if value != '' else None for value in row]
+    return header, generate()
+
+
+def _iter_arrow_rows(path, fmt):
+    pa = _require_pyarrow()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        header = parquet_file.schema_arrow.names
+        batches = parquet_file.iter_batches(batch_size=_ARROW_BATCH_ROWS)
+    else:
+        reader = pa.ipc.open_file(path)
+        header = reader.schema.names
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    def generate():
+        for batch in batches:
+            columns = [column.to_pylist() for column in batch.columns]
+            yield from (list(row) for row in zip(*columns))
+    return header, generate()
+
+
+def _arrow_schema(path):
+    # 已有列式文件的 schema，追加/转换时保持列类型不变
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow
+    if fmt == 'feather':
+        pa = _require_pyarrow()
+        return pa.ipc.open_file(path).schema
+    return None
+
+
+def _arrow_column(values, arrow_type):
+    pa = _require_pyarrow()
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pa.array([None if value is None else str(value) for value in values], type=arrow_type)
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 例如从 CSV/Excel 读出的字符串写入数值列
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string()).cast(arrow_type)
+
+
+def _write_arrow_rows(path, fmt, header, rows, schema=None):
+    pa = _require_pyarrow()
+    if schema is None or schema.names != list(header):
+        schema = pa.schema([(name, pa.string()) for name in header])
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+
+    def flush(buffer):
+        columns = [_arrow_column(values, field.type) for values, field in zip(zip(*buffer), schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+
+    with writer:
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= _ARROW_BATCH_ROWS:
+                flush(buffer)
+                buffer = []
+        if buffer:
+            flush(buffer)
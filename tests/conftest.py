@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# 模块都在仓库根目录，替身服务器在 benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+
+@pytest.fixture
+def mock_eutils(monkeypatch):
+    # 返回一个函数：启动指定规模的替身服务器（benchmarks/mock_eutils.py），并把 E-utilities 地址指向它
+    import pubmed_utils
+    from mock_eutils import MockEutils
+    servers = []
+
+    def start(records, **options):
+        mock = MockEutils(records, **options).start()
+        servers.append(mock)
+        monkeypatch.setattr(pubmed_utils, "EUTILS_BASE_URL", mock.url)
+        return mock
+
+    yield start
+    for mock in servers:
+        mock.stop()
+
+
+@pytest.fixture
+def utils():
+    # 不限速的客户端
+    import pubmed_utils
+    return pubmed_utils.pubmed_utils(rate_limiter=pubmed_utils._TokenBucket(1000))
@@ -0,0 +1,119 @@
+import json
+import re
+import shutil
+import subprocess
+
+import pandas as pd
+import pytest
+
+import html_generate
+
+_TITLES = [
+    "Wnt5a signaling in pulmonary fibrosis",
+    "sWnt is not a match",
+    "Beta-catenin and WNT pathways",
+    "Unrelated cardiology study",
+]
+
+
+def _df():
+    return pd.DataFrame({
+        "PMID": [str(30000000 + i) for i in range(len(_TITLES))],
+        "Title": _TITLES,
+        "Abstract": ["Abstract text." for _ in _TITLES],
+        "Journal": ["Journal A", "Journal B", "Journal A", "Journal C"],
+        "publish_date": ["2024-01-01"] * len(_TITLES),
+        "IF": [12.3, 2.1, 5.0, ""],
+        "JCR_Quartile": ["Q1", "Q3", "Q2", ""],
+    })
+
+
+def _highlighted(query, text):
+    highlight = html_generate._make_highlighter(html_generate._build_pattern_from_query(query))
+    return "<span" in highlight(text)
+
+
+def _search(query, titles):
+    # 用 node 运行页面里的搜索函数，索引由 _SearchIndexBuilder 建立（与虚拟列表页面嵌入的相同）
+    builder = html_generate._SearchIndexBuilder()
+    for position, title in enumerate(titles):
+        builder.add(position, {"Title": title, "Abstract": ""})
+    script = (html_generate._SEARCH_SCRIPT
+              + f"\nsearchIndex = {''.join(builder.parts())};"
+              + f"\nconst scores = search({json.dumps(query)}, {len(titles)});"
+              + "\nconsole.log(JSON.stringify(scores ? Array.from(scores.keys()).sort((a, b) => a - b) : null));")
+    out = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+
+def test_highlight_matches_terms_at_word_start():
+    assert _highlighted("wnt", "Wnt5a signaling")
+    assert _highlighted("wnt", "beta-catenin/WNT")
+    assert not _highlighted("wnt", "sWnt is not a match")
+    assert _highlighted("*osis", "pulmonary fibrosis")
+    # HTML 实体不受影响
+    assert html_generate._make_highlighter(html_generate._build_pattern_from_query("amp"))("a &amp; b") == "a &amp; b"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+@pytest.mark.parametrize("query", ["wnt", "WNT5A", "fibro*", "*osis", "catenin", "wnt NOT fibrosis", "cardiology OR wnt"])
+def test_search_finds_the_articles_highlighting_marks(query):
+    found = _search(query, _TITLES)
+    terms = [term for term in query.split() if term not in ("NOT", "OR")]
+    if "NOT" in query:
+        expected = [i for i, title in enumerate(_TITLES) if _highlighted(terms[0], title) and not _highlighted(terms[1], title)]
+    else:
+        expected = [i for i, title in enumerate(_TITLES) if _highlighted(query, title)]
+    assert expected
+    assert found == expected
+
+
+def test_static_page_with_search(tmp_path):
+    html_path = tmp_path / "list.html"
+    html_generate.generate_reading_list(_df(), str(html_path), search=True)
+    page = html_path.read_text(encoding="utf-8")
+    assert 'id="search-input"' in page
+    assert "function buildSearchIndex()" in page
+    assert page.count('class="article-card"') == len(_TITLES)
+
+    # 追加的文章由页面脚本建索引，页面结构保持不变
+    added = _df().iloc[:1].assign(PMID="30000099", Title="Wnt11 in kidney")
+    assert html_generate.append_to_reading_list(added, str(html_path))
+    page = html_path.read_text(encoding="utf-8")
+    assert page.count('class="article-card"') == len(_TITLES) + 1
+    assert page.index('id="article-30000099"') < page.index("function buildSearchIndex()")
+
+    plain_path = tmp_path / "plain.html"
+    html_generate.generate_reading_list(_df(), str(plain_path))
+    assert 'id="search-input"' not in plain_path.read_text(encoding="utf-8")
+
+
+def test_sharded_static_pages_with_search(tmp_path):
+    index_path = html_generate.generate_sharded_reading_list(_df(), str(tmp_path / "shards"), shard_size=2, search=True)
+    pages = sorted(p for p in (tmp_path / "shards").glob("*.html") if p.name != "index.html")
+    assert index_path and len(pages) == 2
+    assert all('id="search-input"' in p.read_text(encoding="utf-8") for p in pages)
+
+
+def test_append_merges_articles_by_pmid(tmp_path):
+    html_path = tmp_path / "list.html"
+    html_generate.generate_reading_list(_df(), str(html_path))
+    manifest_path = tmp_path / "list.manifest.json"
+    before = json.loads(manifest_path.read_text(encoding="utf-8"))["articles"]
+
+    updated = pd.concat([_df(), _df().iloc[:1].assign(PMID="30000099", Title="Wnt11 in kidney")], ignore_index=True)
+    updated.loc[1, "Title"] = "sWnt revised title"
+    assert html_generate.append_to_reading_list(updated, str(html_path))
+    page = html_path.read_text(encoding="utf-8")
+    ids = re.findall(r'<div class="article-card[^"]*" id="article-(\d+)"', page)
+    # 新文章接在后面，修改过的原地替换，未变化的不动
+    assert ids == [str(30000000 + i) for i in range(len(_TITLES))] + ["30000099"]
+    assert "sWnt revised title" in page and "sWnt is not a match" not in page
+    assert page.count('href="#article-30000001"') == 1 and 'href="#article-30000099"' in page
+    after = json.loads(manifest_path.read_text(encoding="utf-8"))["articles"]
+    assert after["30000000"] == before["30000000"]
+    assert after["30000001"][1] == before["30000001"][1] and after["30000001"][0] != before["30000001"][0]
+
+    # 再次追加同样的内容：页面不变
+    assert html_generate.append_to_reading_list(updated, str(html_path))
+    assert html_path.read_text(encoding="utf-8") == page
@@ -0,0 +1,15 @@
+import pandas as pd
+import pytest
+
+import pubmed_utils
+
+
+@pytest.mark.parametrize("index", [[0, 1], [5, 7], [1, 0]])
+def test_enrich_journal_metrics_aligns_issns_by_position(index):
+    # 期刊名无法匹配，只能按 ISSN 匹配；筛选、拼接或排序后的 DataFrame 索引不是 0..n-1
+    df = pd.DataFrame({"Journal": ["Unknown journal A", "Unknown journal B"], "ISSN": ["0028-0836", "0036-8075"]}, index=index)
+    enriched, stats = pubmed_utils.pubmed_utils().enrich_journal_metrics(df)
+    expected, _ = pubmed_utils.pubmed_utils().enrich_journal_metrics(pd.DataFrame({"Journal": ["Nature", "Science"]}))
+    assert stats["issn_match"] == 2
+    assert enriched["IF"].tolist() == expected["IF"].tolist()
+    assert enriched.index.tolist() == index
@@ -0,0 +1,154 @@
+import io
+
+import pytest
+
+from pubmed_utils import _BatchFill, _BatchSizer, _iter_medline_records
+
+FIELDS = ("PMID", "TI", "AB", "LID", "IS", "TA")
+
+TEXT = '''
+PMID- 1
+OWN - NLM
+IS  - 2041-1723 (Electronic)
+IS  - 2041-1723 (Linking)
+TI  - Wnt5a signalling in
+      lung fibrosis.
+LID - 10.1038/s41467-025-00001-x [doi]
+LID - 101 [pii]
+AB  - First line of the abstract
+      
+      second paragraph.
+FAU - Author, Name
+TA  - Nat Commun
+
+PMID- 2
+TI  - Short title.
+AB  - Only one line.
+TA  - Cell
+'''
+
+
+def parse(text, chunk_size=None, expected=None):
+    state = {}
+    chunks = [text] if chunk_size is None else [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    return list(_iter_medline_records(chunks, FIELDS, state, expected)), state
+
+
+def test_continuation_lines_are_joined_with_spaces():
+    records, _ = parse(TEXT)
+    assert records[0]["TI"] == "Wnt5a signalling in lung fibrosis."
+    # 空的续行被忽略，不留下换行符
+    assert records[0]["AB"] == "First line of the abstract second paragraph."
+
+
+def test_repeated_fields_are_joined_and_unneeded_fields_skipped():
+    records, _ = parse(TEXT)
+    assert records[0]["LID"] == "10.1038/s41467-025-00001-x [doi] 101 [pii]"
+    assert records[0]["IS"] == "2041-1723 (Electronic) 2041-1723 (Linking)"
+    assert set(records[0]) == {"PMID", "TI", "AB", "LID", "IS", "TA"}
+    assert records[1] == {"PMID": "2", "TI": "Short title.", "AB": "Only one line.", "TA": "Cell"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_chunk_boundaries_do_not_change_the_result(chunk_size):
+    assert parse(TEXT, chunk_size)[0] == parse(TEXT)[0]
+
+
+def test_matches_bio_medline_on_text_fields():
+    Medline = pytest.importorskip("Bio.Medline")
+    # Bio.Medline 把空的续行保留为换行符，这里不保留，因此比较时统一空白
+    expected = [{key: " ".join((" ".join(value) if isinstance(value, list) else value).split()) for key, value in record.items() if key in FIELDS}
+                for record in Medline.parse(io.StringIO(TEXT.lstrip('\n')))]
+    assert parse(TEXT)[0] == expected
+
+
+def test_truncated_in_the_middle_of_a_line():
+    records, state = parse(TEXT[:TEXT.index("lung fibrosis")], expected=2)
+    assert state == {"truncated": True, "short": False}
+    assert [record["PMID"] for record in records] == ["1"]
+
+
+def test_truncated_on_a_line_boundary_is_short():
+    # 在行边界截断时文本仍以换行符结尾，只能由记录数少于请求的条数发现
+    records, state = parse(TEXT[:TEXT.index("FAU - ")], expected=2)
+    assert state == {"truncated": False, "short": True}
+    assert "TA" not in records[-1]
+    assert parse(TEXT, expected=2)[1] == {"truncated": False, "short": False}
+
+
+def make_server(text_for, total):
+    # 模拟 EFetch：text_for(retstart, retmax) 返回响应文本，按 _BatchFill 的方式解析
+    def efetch(retstart, retmax):
+        state = {}
+        records = list(_iter_medline_records([text_for(retstart, min(retmax, total - retstart))], FIELDS, state, retmax))
+        if records and state["truncated"]:
+            records = records[:-1]
+        return records, state["short"]
+    return efetch
+
+
+def record_text(pmid):
+    return f"PMID- {pmid}\nTI  - Title {pmid}.\nAB  - Abstract {pmid}.\nTA  - Cell"
+
+
+def fill_batch(efetch, retmax):
+    fill = _BatchFill(0, retmax, _BatchSizer(retmax), max_retries=3)
+    while (request := fill.next_request()) is not None:
+        fill.received(*efetch(*request), elapsed=0.0)
+    return fill.records
+
+
+def test_batch_fill_refetches_record_cut_on_a_line_boundary():
+    cut = {"done": False}
+
+    def text_for(retstart, retmax):
+        text = "\n" + "\n\n".join(record_text(pmid) for pmid in range(retstart, retstart + retmax)) + "\n"
+        if not cut["done"] and retmax > 3:
+            # 第一次响应在第 3 条记录的 AB 行之前截断
+            cut["done"] = True
+            return text[:text.index("AB  - Abstract 2.")]
+        return text
+
+    records = fill_batch(make_server(text_for, 10), 10)
+    assert [record["PMID"] for record in records] == [str(pmid) for pmid in range(10)]
+    assert all(record["AB"] == f"Abstract {record['PMID']}." for record in records)
+
+
+def test_batch_fill_keeps_the_last_record_when_fewer_exist():
+    # 服务器上只有 4 条（例如其余的已被删除）：最后一条确认后接受，不会丢失
+    records = fill_batch(make_server(lambda retstart, retmax: "\n" + "\n\n".join(record_text(pmid) for pmid in range(retstart, min(4, retstart + retmax))) + "\n", 10), 10)
+    assert [record["PMID"] for record in records] == ["0", "1", "2", "3"]
+
+
+def test_batch_fill_refetches_after_mid_line_truncation():
+    requests = []
+
+    def text_for(retstart, retmax):
+        requests.append((retstart, retmax))
+        text = "\n" + "\n\n".join(record_text(pmid) for pmid in range(retstart, retstart + retmax)) + "\n"
+        # 第一次响应在第 5 条记录的标题中间截断
+        return text[:text.index("Title 4") + 3] if len(requests) == 1 else text
+
+    records = fill_batch(make_server(text_for, 10), 10)
+    assert [record["PMID"] for record in records] == [str(pmid) for pmid in range(10)]
+    # 只重新请求缺少的部分
+    assert requests == [(0, 10), (4, 6)]
+
+
+def test_batch_fill_gives_up_after_retries():
+    fill = _BatchFill(0, 10, _BatchSizer(10), max_retries=2)
+    assert fill.next_request() == (0, 10)
+    assert fill.failed(elapsed=0.0) is not None
+    assert fill.failed(elapsed=0.0) is not None
+    assert fill.failed(elapsed=0.0) is None
+
+    # 空响应重试几次后以已取得的部分结束
+    fill = _BatchFill(0, 10, _BatchSizer(10), max_retries=5)
+    fill.next_request()
+    fill.received([{"PMID": "0"}], short=False, elapsed=0.0)
+    responses = 0
+    while fill.next_request() is not None:
+        fill.received([], short=False, elapsed=0.0)
+        responses += 1
+    assert [record["PMID"] for record in fill.records] == ["0"]
+    assert responses == 3
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from pubmed_async import AsyncPubmedClient, AsyncTokenBucket
+from pubmed_utils import _HISTORY_CAP
+from mock_eutils import FIRST_PMID
+
+
+def run_client(method, *args, **kwargs):
+    async def run():
+        async with AsyncPubmedClient(rate_limiter=AsyncTokenBucket(1000)) as client:
+            return await getattr(client, method)(*args, **kwargs)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("records", [4000, 12000])
+def test_esearch_ids_stays_within_history_cap(mock_eutils, capsys, records):
+    mock_eutils(records)
+    pmids = run_client("esearch_ids", "wnt")
+    assert len(pmids) == min(records, _HISTORY_CAP)
+    assert len(set(pmids)) == len(pmids)
+    # 超过上限时给出警告
+    assert ("Warning" in capsys.readouterr().out) == (records > _HISTORY_CAP)
+
+
+def test_esearch_ids_limit(mock_eutils):
+    mock_eutils(12000)
+    assert len(run_client("esearch_ids", "wnt", limit=150)) == 150
+    assert len(run_client("esearch_ids", "wnt", limit=20000)) == _HISTORY_CAP
+
+
+def collect(method, *args, **kwargs):
+    async def run():
+        async with AsyncPubmedClient(rate_limiter=AsyncTokenBucket(1000)) as client:
+            return [record async for record in getattr(client, method)(*args, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_iter_records_recovers_truncated_and_rejected_responses(mock_eutils):
+    mock = mock_eutils(3000, rate_429=0.05, truncate=0.1, retry_after=0, seed=1)
+    # 固定批大小：足够多的 EFetch 请求，保证替身服务器确实截断和拒绝过
+    records = collect("iter_records", "wnt", paper_type=None, batch_size=100)
+    pmids = [record["PMID"] for record in records]
+    assert len(pmids) == len(set(pmids)) == 3000
+    assert mock.stats()["truncated"] and mock.stats()["rejected_429"]
+
+
+def test_iter_pmid_records_splits_at_history_cap(mock_eutils):
+    mock = mock_eutils(12000)
+    pmids = [str(pmid) for pmid in range(FIRST_PMID, FIRST_PMID + 12000)]
+    records = collect("iter_pmid_records", pmids)
+    assert [record["PMID"] for record in records] == pmids
+    assert mock.stats()["epost"] == 2
+
+
+def test_rate_limiter_pause_delays_waiting_requests():
+    async def run():
+        bucket = AsyncTokenBucket(100)
+        await bucket.acquire()
+        waiter = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0)
+        begin = time.monotonic()
+        # 429：已经在等待的请求也要等到暂停结束
+        bucket.pause(0.2)
+        await waiter
+        return time.monotonic() - begin
+    assert asyncio.run(run()) >= 0.2
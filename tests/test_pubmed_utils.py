@@ -0,0 +1,155 @@
+import json
+import os
+import re
+
+import pytest
+
+from pubmed_utils import _BatchSizer
+from mock_eutils import FIRST_PMID
+
+
+def _pmids(save_path):
+    # 表格第一列是 PMID
+    with open(save_path, encoding="utf-8") as f:
+        return [line.split(",", 1)[0] for line in f.read().splitlines()[1:]]
+
+
+def _cards(html_path):
+    # {PMID: 卡片 HTML}
+    with open(html_path, encoding="utf-8") as f:
+        page = f.read()
+    return {re.search(r"PMID: (\d+)", card).group(1): card for card in page.split('class="article-card"')[1:]}
+
+
+def test_incremental_update_adds_cards_with_journal_metrics(mock_eutils, utils, tmp_path):
+    # 所有记录都在今天，增量检索（mindate = 上次运行的日期）能找到它们
+    mock_eutils(60, span_days=0)
+    save_path = str(tmp_path / "wnt.csv")
+    html_path = str(tmp_path / "wnt_reading_list.html")
+    utils.update_main_info_into_excel(None, "wnt", None, save_path, html_path)
+    full_cards = _cards(html_path)
+    assert len(full_cards) == 60
+
+    # 让最后 5 篇看起来是上次运行之后新增的
+    with open(save_path, "r+", encoding="utf-8") as f:
+        lines = f.readlines()
+        f.seek(0)
+        f.writelines(lines[:-5])
+        f.truncate()
+    watermark_path = utils._watermark_path(save_path)
+    with open(watermark_path, encoding="utf-8") as f:
+        watermark = json.load(f)
+    new_pmids = [line.split(",", 1)[0] for line in lines[-5:]]
+    watermark["pmids"] = [pmid for pmid in watermark["pmids"] if pmid not in new_pmids]
+    with open(watermark_path, "w", encoding="utf-8") as f:
+        json.dump(watermark, f)
+
+    new_df = utils.update_main_info_into_excel(None, "wnt", None, save_path, html_path)
+    assert sorted(new_df["PMID"].astype(str)) == sorted(new_pmids)
+    cards = _cards(html_path)
+    for pmid in new_pmids:
+        # 增量追加的卡片与完整获取时一样带期刊指标
+        assert ("IF: " in cards[pmid]) == ("IF: " in full_cards[pmid])
+    assert any("IF: " in cards[pmid] for pmid in new_pmids)
+
+
+def test_batch_sizer_adapts_to_response_times():
+    sizer = _BatchSizer(initial=100, minimum=10, maximum=400, target_seconds=1.0)
+    # 满批次且响应快时翻倍，直到上限
+    for expected in (200, 400, 400):
+        sizer.record(sizer.next_size(), 0.1)
+        assert sizer.next_size() == expected
+    # 不满的批次（结果集末尾）不说明还能加大
+    sizer.record(50, 0.1)
+    assert sizer.next_size() == 400
+    # 太慢、截断、超时时减半，不低于下限
+    sizer.record(400, 5.0)
+    assert sizer.next_size() == 200
+    sizer.record(200, 0.1, truncated=True)
+    assert sizer.next_size() == 100
+    for _ in range(10):
+        sizer.record(100, 0.1, timed_out=True)
+    assert sizer.next_size() == 10
+
+    fixed = _BatchSizer(batch_size=77)
+    fixed.record(77, 100.0, timed_out=True)
+    assert fixed.next_size() == 77
+
+
+def test_adaptive_batches_grow(mock_eutils, utils, tmp_path):
+    mock = mock_eutils(3000)
+    save_path = str(tmp_path / "wnt.csv")
+    utils.get_main_info_into_excel(None, "wnt", paper_type=None, save_path=save_path)
+    assert len(set(_pmids(save_path))) == 3000
+    # 起始批大小 200：不自适应时需要 15 次 EFetch
+    assert mock.stats()["efetch"] < 15
+
+
+def test_get_pmids_posts_the_list(mock_eutils, utils, tmp_path):
+    mock = mock_eutils(500)
+    pmids = [str(FIRST_PMID + i) for i in range(0, 500, 3)]
+    save_path = str(tmp_path / "pmids.csv")
+    utils.get_pmids_into_excel(None, pmids, save_path=save_path, batch_size=50)
+    assert _pmids(save_path) == pmids
+    assert mock.stats()["epost"] == 1
+
+
+def test_recovers_rejected_and_truncated_responses(mock_eutils, utils, tmp_path):
+    mock = mock_eutils(2000, rate_429=0.05, truncate=0.1, retry_after=0, seed=1)
+    save_path = str(tmp_path / "wnt.csv")
+    # 固定批大小：足够多的 EFetch 请求，保证替身服务器确实截断和拒绝过
+    utils.get_main_info_into_excel(None, "wnt", paper_type=None, save_path=save_path, batch_size=100)
+    pmids = _pmids(save_path)
+    assert len(pmids) == len(set(pmids)) == 2000
+    assert mock.stats()["truncated"] and mock.stats()["rejected_429"]
+    assert not os.path.exists(save_path + ".missing.json")
+
+
+def test_resumes_after_interrupt(mock_eutils, utils, tmp_path, monkeypatch, capsys):
+    mock_eutils(1000)
+    save_path = str(tmp_path / "wnt.csv")
+    partial_path, checkpoint_path = utils._partial_paths(save_path)
+    original = utils._iter_segment_batches
+
+    def interrupted(*args, **kwargs):
+        for i, batch in enumerate(original(*args, **kwargs)):
+            if i == 3:
+                raise KeyboardInterrupt
+            yield batch
+
+    monkeypatch.setattr(utils, "_iter_segment_batches", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        utils.get_main_info_into_excel(None, "wnt", paper_type=None, save_path=save_path, batch_size=100)
+    # 已写入的批次在中间文件里，检查点指向下一批
+    assert len(_pmids(partial_path)) == 300
+    with open(checkpoint_path, encoding="utf-8") as f:
+        assert json.load(f)["next_retstart"] == 300
+
+    retstarts = []
+
+    def recorded(*args, **kwargs):
+        for batch in original(*args, **kwargs):
+            retstarts.append(batch[0])
+            yield batch
+
+    monkeypatch.setattr(utils, "_iter_segment_batches", recorded)
+    utils.get_main_info_into_excel(None, "wnt", paper_type=None, save_path=save_path, batch_size=100)
+    assert "Resuming from record 300" in capsys.readouterr().out
+    # 只获取剩下的批次
+    assert retstarts == list(range(300, 1000, 100))
+    assert _pmids(save_path) == [str(FIRST_PMID + 999 - i) for i in range(1000)]
+    assert not os.path.exists(partial_path) and not os.path.exists(checkpoint_path)
+
+
+def test_partitions_results_past_history_cap(mock_eutils, utils, tmp_path):
+    mock_eutils(12000)
+    expected = {str(FIRST_PMID + i) for i in range(12000)}
+    save_path = str(tmp_path / "wnt.csv")
+    utils.get_main_info_into_excel(None, "wnt", paper_type=None, save_path=save_path, batch_size=2000)
+    pmids = _pmids(save_path)
+    # 日期切片之间没有重复，也没有遗漏
+    assert len(pmids) == 12000 and set(pmids) == expected
+    assert not os.path.exists(save_path + ".missing.json")
+
+    pmids = utils._esearch_ids(None, "wnt")
+    assert len(pmids) == 12000 and set(pmids) == expected
@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+import pubmed_utils
+from record_cache import RecordCache
+
+
+def make_record(pmid):
+    return {"PMID": str(pmid), "TI": f"Wnt signalling in fibrosis {pmid}", "AB": "Fibroblast activation.", "TA": "Nature", "LR": "20250101"}
+
+
+def test_evict_keeps_articles_of_saved_queries(tmp_path):
+    store = RecordCache(str(tmp_path / "articles.sqlite"), max_records=1, max_age_days=1)
+    store.put_many([make_record(pmid) for pmid in range(1, 7)])
+    store.set_query("wnt", ["1", "2", "3"])
+    # 1..3 已过期且最久没有访问，6 最近访问
+    now = time.time()
+    store._conn.executemany("UPDATE records SET fetched_at = ?, accessed_at = ? WHERE pmid = ?",
+                            [(now - 2 * 86400 if pmid <= 3 else now, now - 10 + pmid, str(pmid)) for pmid in range(1, 7)])
+
+    assert store.evict() == 2
+    assert sorted(store.get_many([str(pmid) for pmid in range(1, 7)])) == ["1", "2", "3", "6"]
+    assert {record["PMID"] for record in store.search("fibrosis")} == {"1", "2", "3", "6"}
+
+    df = pubmed_utils.pubmed_utils().export_store(store, str(tmp_path / "wnt.csv"))
+    assert df["PMID"].astype(str).tolist() == ["1", "2", "3"]
+
+    # 删除查询后它的文章可以被淘汰
+    store.drop_query("wnt")
+    store.evict()
+    assert len(store) == 1
+
+
+def test_search_store(tmp_path):
+    store = RecordCache(str(tmp_path / "articles.sqlite"))
+    store.put_many([
+        {"PMID": "1", "TI": "Wnt5a signalling in lung fibrosis", "AB": "Myofibroblast activation.", "TA": "Nature", "IS": "0028-0836", "LR": "20240105"},
+        {"PMID": "2", "TI": "Cardiac repair", "AB": "Fibroblast activation through the wnt pathway.", "TA": "Sci Rep", "IS": "2045-2322", "LR": "20230101"},
+        {"PMID": "3", "TI": "Kidney injury", "AB": "Tubular cells.", "TA": "Cell", "IS": "0092-8674", "LR": "20250101"},
+    ])
+    utils = pubmed_utils.pubmed_utils()
+
+    def pmids(*args, **kwargs):
+        return utils.search_store(store, *args, **kwargs)["PMID"].astype(str).tolist()
+
+    # 标题命中排在摘要命中之前
+    assert pmids("fibro*") == ["1", "2"]
+    assert pmids("wnt* NOT lung") == ["2"]
+    assert pmids('"cardiac repair" OR kidney', order="date") == ["3", "2"]
+    assert pmids("(kidney OR cardiac) AND injury[tiab]") == ["3"]
+    # 期刊指标在检索前补上
+    assert pmids(min_if=10) == ["3", "1"]
+    assert pmids("activation", min_if=10) == ["1"]
+    assert pmids(journal="sci rep", since="2023/01/01", until="2023") == ["2"]
+    assert pmids(order="if", limit=2) == ["1", "3"]
+
+    save_path = str(tmp_path / "found.csv")
+    assert len(utils.search_store(store, "fibro*", save_path=save_path)) == 2
+    assert os.path.exists(save_path)
+    with pytest.raises(ValueError):
+        utils.search_store(store, "fibrosis AND")
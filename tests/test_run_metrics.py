@@ -0,0 +1,26 @@
+import threading
+
+import run_metrics
+
+
+def _worker_stage():
+    with run_metrics.stage("worker"):
+        pass
+
+
+def test_traced_peak_only_for_outermost_stages():
+    with run_metrics.recording(trace_memory=True) as report:
+        with run_metrics.stage("outer"):
+            block = bytearray(20 << 20)
+            del block
+            # 嵌套和其它线程中的阶段不重置峰值
+            with run_metrics.stage("inner"):
+                pass
+            worker = threading.Thread(target=_worker_stage)
+            worker.start()
+            worker.join()
+    stages = report.to_dict()["stages"]
+    assert stages["outer"]["traced_peak_mb"] >= 20
+    assert "traced_peak_mb" not in stages["inner"]
+    assert "traced_peak_mb" not in stages["worker"]
+    assert report._open_stages == 0